@@ -1,55 +1,225 @@
-import random
-import string
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, session
+from flask import (Flask, render_template, redirect, url_for, flash, request,
+                   jsonify, session, abort, Response, stream_with_context)
 from flask_bcrypt import Bcrypt
 from flask_behind_proxy import FlaskBehindProxy
 from flask_login import LoginManager, login_user, logout_user, login_required, UserMixin, current_user
-from flask_migrate import Migrate
 from dotenv import load_dotenv
 from forms import LoginForm, RegistrationForm
-from models import db, User, Course, Module, Lesson
-from twilio.jwt.access_token import AccessToken
-from twilio.jwt.access_token.grants import VideoGrant
-import requests
+from models import db, User, Course, Module, Lesson, GenerationJob
+import click
+import json
 import os
-from bot import get_user_response
+import secrets
+import time
+from bot import get_user_response, stream_user_response, fake_stream
+from course_generator import generate_modules_and_lessons
+from course_store import list_courses, load_course_tree, load_module_tree
+from code_runner import RunError, create_runner
+from compressed_text import create_text_codec, set_default_codec
+from conversations import ConversationStore
+from instrumentation import LatencyStats
+from llm_cache import get_default_cache
+from llm_gateway import GatewayBusy, get_default_gateway
+from log_config import configure_logging
+from matchmaking import create_matchmaker
+from metrics import (CONTENT_TYPE, RequestMetrics, authorized, long_running,
+                     registry)
+from page_cache import PageCache, bump_version, course_key, module_key
+from search_index import SearchIndex
+from user_cache import UserCache
+from video_tokens import create_video_tokens
+from jobs import JobRunner, enqueue_job, job_to_dict, SUCCEEDED, FAILED
+from lazy_cli import LazyGroup
 from models import db , User, Course, Module, Lesson
-import openai 
-import threading 
 import datetime
 
-openai.api_key = os.environ.get("OPENAI_API_KEY")
+# Before reading any config; openai reads OPENAI_API_KEY when first imported
+load_dotenv()
 
 app = Flask(__name__, instance_relative_config=True)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', '9c7f5ed4fee35fed7a039ddba384397f')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///../instance/site.db')
+# Course generation: concurrent lesson calls, per-call timeout and retries
+app.config['COURSE_GEN_MAX_WORKERS'] = int(
+    os.getenv('COURSE_GEN_MAX_WORKERS', 8))
+app.config['COURSE_GEN_TIMEOUT'] = float(os.getenv('COURSE_GEN_TIMEOUT', 60))
+app.config['COURSE_GEN_RETRIES'] = int(os.getenv('COURSE_GEN_RETRIES', 2))
+app.config['COURSE_GEN_BACKOFF'] = float(os.getenv('COURSE_GEN_BACKOFF', 1.0))
+# Background generation jobs: worker threads per process, and how long a
+# running job may go without a heartbeat before another process requeues it
+app.config['COURSE_JOB_WORKERS'] = int(os.getenv('COURSE_JOB_WORKERS', 2))
+app.config['COURSE_JOB_LEASE'] = int(os.getenv('COURSE_JOB_LEASE', 300))
+# Longest time /wait_match holds a request open before the client re-polls,
+# and how often the page polls instead where the server cannot hold it
+app.config['MATCH_WAIT_TIMEOUT'] = float(os.getenv('MATCH_WAIT_TIMEOUT', 25))
+app.config['MATCH_POLL_INTERVAL'] = float(os.getenv('MATCH_POLL_INTERVAL', 3))
+# 'memory' only matches users within one process; 'sqlite' shares the queue
+# between every worker on the host through MATCHMAKING_DB
+app.config['MATCHMAKING_BACKEND'] = os.getenv('MATCHMAKING_BACKEND', 'memory')
+app.config['MATCHMAKING_DB'] = os.getenv(
+    'MATCHMAKING_DB', os.path.join(app.instance_path, 'matchmaking.db'))
+# Drop queued users not seen for this long, and room assignments this old
+app.config['MATCH_QUEUE_TTL'] = float(os.getenv('MATCH_QUEUE_TTL', 120))
+app.config['MATCH_ROOM_TTL'] = float(os.getenv('MATCH_ROOM_TTL', 3600))
+# 'fifo' pairs whoever has waited longest; 'skill' prefers a partner with the
+# same language and level, for up to MATCH_SKILL_WINDOW seconds
+app.config['MATCHMAKING_MODE'] = os.getenv('MATCHMAKING_MODE', 'fifo')
+app.config['MATCH_SKILL_WINDOW'] = float(os.getenv('MATCH_SKILL_WINDOW', 30))
+# /compile proxy to JDoodle: pooled connections with timeouts, a result cache
+# and a cap on each user's runs in flight
+app.config['JDOODLE_CLIENT_ID'] = os.getenv('JDOODLE_CLIENT_ID')
+app.config['JDOODLE_CLIENT_SECRET'] = os.getenv('JDOODLE_CLIENT_SECRET')
+app.config['JDOODLE_URL'] = os.getenv(
+    'JDOODLE_URL', 'https://api.jdoodle.com/v1/execute')
+app.config['JDOODLE_CONNECT_TIMEOUT'] = float(
+    os.getenv('JDOODLE_CONNECT_TIMEOUT', 3.05))
+app.config['JDOODLE_READ_TIMEOUT'] = float(
+    os.getenv('JDOODLE_READ_TIMEOUT', 15))
+app.config['JDOODLE_POOL_SIZE'] = int(os.getenv('JDOODLE_POOL_SIZE', 10))
+app.config['COMPILE_CACHE_SIZE'] = int(os.getenv('COMPILE_CACHE_SIZE', 256))
+app.config['COMPILE_CACHE_TTL'] = float(os.getenv('COMPILE_CACHE_TTL', 3600))
+app.config['COMPILE_MAX_PER_USER'] = int(os.getenv('COMPILE_MAX_PER_USER', 2))
+app.config['COMPILE_MAX_STDIN_BYTES'] = int(
+    os.getenv('COMPILE_MAX_STDIN_BYTES', 65536))
+# 'jdoodle' or 'local' (rlimited subprocesses on this host; see sandbox.py).
+# 'local' is not isolated, so it also needs SANDBOX_ALLOW_UNSAFE=1, and
+# /compile then requires a login
+app.config['COMPILE_BACKEND'] = os.getenv('COMPILE_BACKEND', 'jdoodle')
+app.config['SANDBOX_ALLOW_UNSAFE'] = \
+    os.getenv('SANDBOX_ALLOW_UNSAFE', '0') == '1'
+# 'openai' or 'fake' (canned answers, for working offline), and the fake
+# backend's pause per word, which stands in for the model's latency
+app.config['CHAT_BACKEND'] = os.getenv('CHAT_BACKEND', 'openai')
+app.config['CHAT_FAKE_DELAY'] = float(os.getenv('CHAT_FAKE_DELAY', 0.05))
+# Tutor conversation memory: tokens of recent turns and of the summary of
+# older ones sent with each question, and how many idle chats to keep
+app.config['CHAT_HISTORY_TOKENS'] = int(os.getenv('CHAT_HISTORY_TOKENS', 1000))
+app.config['CHAT_SUMMARY_TOKENS'] = int(os.getenv('CHAT_SUMMARY_TOKENS', 200))
+app.config['CHAT_MAX_SESSIONS'] = int(os.getenv('CHAT_MAX_SESSIONS', 1000))
+app.config['CHAT_SESSION_TTL'] = float(os.getenv('CHAT_SESSION_TTL', 1800))
+app.config['SANDBOX_WORKERS'] = int(os.getenv('SANDBOX_WORKERS', 4))
+app.config['SANDBOX_CPU_SECONDS'] = int(os.getenv('SANDBOX_CPU_SECONDS', 2))
+app.config['SANDBOX_WALL_SECONDS'] = float(
+    os.getenv('SANDBOX_WALL_SECONDS', 5))
+app.config['SANDBOX_MEMORY_MB'] = int(os.getenv('SANDBOX_MEMORY_MB', 256))
+app.config['SANDBOX_OUTPUT_BYTES'] = int(
+    os.getenv('SANDBOX_OUTPUT_BYTES', 65536))
+app.config['SANDBOX_PROCESSES'] = int(os.getenv('SANDBOX_PROCESSES', 16))
+app.config['SANDBOX_CACHE_DIR'] = os.getenv(
+    'SANDBOX_CACHE_DIR', os.path.join(app.instance_path, 'sandbox'))
+# Courses per page on /courses, /completed_courses and /api/courses
+app.config['COURSES_PAGE_SIZE'] = int(os.getenv('COURSES_PAGE_SIZE', 20))
+# Lesson content and quizzes are written compressed ('zlib', 'zstd' or
+# 'none') once they reach TEXT_COMPRESSION_MIN_BYTES; reads handle any format
+app.config['TEXT_COMPRESSION'] = os.getenv('TEXT_COMPRESSION', 'zlib')
+app.config['TEXT_COMPRESSION_MIN_BYTES'] = int(
+    os.getenv('TEXT_COMPRESSION_MIN_BYTES', 256))
+# Full-text search: 'fts5' (SQLite's search_index table), 'memory' (an index
+# per process) or 'auto', which uses the table wherever it exists
+app.config['SEARCH_BACKEND'] = os.getenv('SEARCH_BACKEND', 'auto')
+# Logging: DEBUG, INFO, WARNING...; 'text' or 'json' (one object per line)
+app.config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', 'INFO')
+app.config['LOG_FORMAT'] = os.getenv('LOG_FORMAT', 'text')
+# Requests slower than this are logged; set PROFILE_SLOW_REQUESTS=1 to also
+# sample their stacks every PROFILE_INTERVAL seconds (see /debug/slow_requests)
+app.config['SLOW_REQUEST_SECONDS'] = float(
+    os.getenv('SLOW_REQUEST_SECONDS', 1.0))
+app.config['PROFILE_SLOW_REQUESTS'] = \
+    os.getenv('PROFILE_SLOW_REQUESTS', '0') == '1'
+app.config['PROFILE_INTERVAL'] = float(os.getenv('PROFILE_INTERVAL', 0.005))
+# Bearer token for /metrics and /debug/slow_requests; unset turns them off
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+# Logged-in users kept in memory so @login_required skips the user SELECT;
+# another worker's edit to a user shows up here within USER_CACHE_TTL seconds
+app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', 1024))
+app.config['USER_CACHE_TTL'] = float(os.getenv('USER_CACHE_TTL', 300))
+# Twilio Video: signed tokens are reused per (user, room) until
+# VIDEO_TOKEN_REFRESH seconds before their VIDEO_TOKEN_TTL runs out
+app.config['TWILIO_ACCOUNT_SID'] = os.getenv('TWILIO_ACCOUNT_SID')
+app.config['TWILIO_API_KEY_SID'] = os.getenv('TWILIO_API_KEY_SID')
+app.config['TWILIO_API_KEY_SECRET'] = os.getenv('TWILIO_API_KEY_SECRET')
+app.config['VIDEO_TOKEN_TTL'] = int(os.getenv('VIDEO_TOKEN_TTL', 3600))
+app.config['VIDEO_TOKEN_REFRESH'] = int(os.getenv('VIDEO_TOKEN_REFRESH', 300))
+app.config['VIDEO_TOKEN_CACHE_SIZE'] = int(
+    os.getenv('VIDEO_TOKEN_CACHE_SIZE', 1024))
+
+configure_logging(app.config['LOG_LEVEL'], app.config['LOG_FORMAT'])
+set_default_codec(create_text_codec(app.config))
 
 # Initialize Flask extensions
 db.init_app(app)
-migrate = Migrate(app, db)
 bcrypt = Bcrypt(app)
 proxied = FlaskBehindProxy(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
+request_metrics = RequestMetrics(
+    app, slow_seconds=app.config['SLOW_REQUEST_SECONDS'],
+    profile=app.config['PROFILE_SLOW_REQUESTS'],
+    profile_interval=app.config['PROFILE_INTERVAL'])
+page_cache = PageCache(
+    max_entries=int(os.getenv('PAGE_CACHE_SIZE', 256)))
+user_cache = UserCache(User, max_entries=app.config['USER_CACHE_SIZE'],
+                       ttl=app.config['USER_CACHE_TTL'])
+
+
+def run_course_generation(title, description, level, **callbacks):
+    return generate_modules_and_lessons(
+        title, description, level,
+        max_workers=app.config['COURSE_GEN_MAX_WORKERS'],
+        timeout=app.config['COURSE_GEN_TIMEOUT'],
+        retries=app.config['COURSE_GEN_RETRIES'],
+        backoff=app.config['COURSE_GEN_BACKOFF'],
+        **callbacks)
+
+
+job_runner = JobRunner(app, run_course_generation,
+                       max_workers=app.config['COURSE_JOB_WORKERS'],
+                       lease_seconds=app.config['COURSE_JOB_LEASE'])
+
+
+def init_migrate():
+    # Flask-Migrate pulls in alembic, so only `flask db ...` imports it
+    from flask_migrate import Migrate
+    Migrate(app, db)  # Replaces the LazyGroup on app.cli with the real group
+    return app.cli.commands['db']
+
+
+app.cli.add_command(LazyGroup('db', init_migrate,
+                              help='Perform database migrations.'))
+
+# Kept in step with every ORM write to courses, modules and lessons
+search_index = SearchIndex(app.config['SEARCH_BACKEND'])
+
+
+@app.cli.command('rebuild-search')
+def rebuild_search():
+    """Re-index every course, module and lesson for search."""
+    click.echo(f'Indexed {search_index.rebuild()} documents')
+
+
+# The schema comes from `flask db upgrade`; nothing touches the database
+# until the first request. Requests then pick up jobs left by a dead
+# process, checking again every third of the lease
+@app.before_request
+def recover_jobs():
+    job_runner.recover_due()
 
-with app.app_context():
-    db.create_all()
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
-    #return db.session.get(User, int(user_id))
-
-def generate_token(identity, room_name):
-    token = AccessToken(
-        os.getenv('TWILIO_ACCOUNT_SID'),
-        os.getenv('TWILIO_API_KEY_SID'),
-        os.getenv('TWILIO_API_KEY_SECRET'),
-        identity=identity
-    )
-    video_grant = VideoGrant(room=room_name)
-    token.add_grant(video_grant)
-    return token.to_jwt()
+    return user_cache.get(int(user_id), db.session)
+
+
+# Return the request's database connection to the pool before a long wait on
+# another service. Under the gevent worker (gunicorn.conf.py) far more
+# requests wait at once than the pool has connections. current_user stays
+# usable, detached with the columns already loaded
+def release_db():
+    db.session.close()
+
+
+# Twilio Video tokens for /video_call and /token, signed once per user and room
+video_tokens = create_video_tokens(app.config)
 
 @app.route("/")
 def landing():
@@ -87,93 +257,218 @@ def login():
 
 @app.route("/logout")
 def logout():
+    if 'chat_id' in session:
+        conversations.discard(conversation_key())
+        session.pop('chat_id')
     logout_user()
     return redirect(url_for('home'))
 
 @app.route("/video_call/<room_name>")
 @login_required
 def video_call(room_name):
-    token = generate_token(current_user.username, room_name)
+    token = video_tokens.get(current_user.username, room_name)
     return render_template('video_call.html', token=token, room_name=room_name)
 
-# Global matchmaking queue and temporary storage for room assignments
-matchmaking_queue = []
-room_assignments = {}
 
-lock = threading.Lock()  # Lock to handle concurrent access to matchmaking_queue and room_assignments
+# Matchmaking queue and room assignments; see MATCHMAKING_BACKEND
+matchmaker = create_matchmaker(app.config)
+
+code_runner = create_runner(app.config)
+
+# Time to first token and total time of streamed chat answers
+chat_latency = LatencyStats()
+
+conversations = ConversationStore(
+    max_sessions=app.config['CHAT_MAX_SESSIONS'],
+    idle_ttl=app.config['CHAT_SESSION_TTL'],
+    history_tokens=app.config['CHAT_HISTORY_TOKENS'],
+    summary_tokens=app.config['CHAT_SUMMARY_TOKENS'])
+
+
+# Counters the caches and the LLM gateway keep themselves, added to /metrics
+def collect_app_metrics():
+    gateway = get_default_gateway().metrics()
+    yield ('llm_gateway_events_total', 'counter',
+           'LLM gateway calls by outcome.',
+           [({'event': name}, gateway[name])
+            for name in ('calls', 'upstream_calls', 'coalesced',
+                         'rate_limited', 'rejected')])
+    yield ('llm_gateway_queue_depth', 'gauge',
+           'LLM requests waiting for admission.',
+           [({'priority': priority}, depth)
+            for priority, depth in gateway['queue_depth'].items()])
+    yield ('llm_gateway_active', 'gauge', 'LLM calls in flight.',
+           [({}, gateway['active'])])
+    llm = get_default_cache().stats()
+    yield ('llm_cache_lookups_total', 'counter', 'LLM response cache lookups.',
+           [({'result': 'memory_hit'}, llm['memory_hits']),
+            ({'result': 'disk_hit'}, llm['disk_hits']),
+            ({'result': 'miss'}, llm['misses'])])
+    yield ('page_cache_lookups_total', 'counter',
+           'Rendered page cache lookups.',
+           [({'result': 'hit'}, page_cache.hits),
+            ({'result': 'miss'}, page_cache.misses),
+            ({'result': 'not_modified'}, page_cache.not_modified)])
+    users = user_cache.stats()
+    yield ('user_cache_lookups_total', 'counter',
+           'Logged-in user cache lookups.',
+           [({'result': 'hit'}, users['hits']),
+            ({'result': 'miss'}, users['misses'])])
+    runs = code_runner.stats()
+    yield ('compile_cache_lookups_total', 'counter',
+           'Code run result cache lookups.',
+           [({'result': 'hit'}, runs['hits']),
+            ({'result': 'miss'}, runs['misses']),
+            ({'result': 'shared'}, runs['shared'])])
+    tokens = video_tokens.stats()
+    yield ('video_token_lookups_total', 'counter',
+           'Twilio Video token cache lookups.',
+           [({'result': 'hit'}, tokens['hits']),
+            ({'result': 'miss'}, tokens['misses'])])
+    yield ('chat_sessions', 'gauge', 'Tutor conversations held in memory.',
+           [({}, len(conversations))])
+    yield ('chat_stream_latency_seconds', 'gauge',
+           'Recent tutor stream timings.',
+           [({'timing': timing, 'quantile': quantile}, summary[key])
+            for timing, summary in chat_latency.summary().items()
+            for quantile, key in (('0.5', 'p50'), ('0.95', 'p95'),
+                                  ('0.99', 'p99'))])
+
+
+registry.collect(collect_app_metrics)
+
+
+# Prometheus scrape endpoint and recent slow requests; only served to
+# requests with the METRICS_TOKEN bearer token
+@app.route("/metrics")
+def prometheus_metrics():
+    if not authorized(app.config['METRICS_TOKEN']):
+        abort(404)
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+
+@app.route("/debug/slow_requests")
+def slow_requests():
+    if not authorized(app.config['METRICS_TOKEN']):
+        abort(404)
+    return jsonify(list(request_metrics.slow_requests))
+
 
 @app.route("/join_queue")
 @login_required
 def join_queue():
-    print("Join queue route accessed")
-
     # Clear room_name from session if present
-    if 'room_name' in session:
-        print(f"Clearing room_name from session for user {current_user.username}")
-        session.pop('room_name', None)
-
-    # Check if the user is already in the matchmaking queue
-    with lock:
-        if current_user.username in matchmaking_queue:
-            print(f"User {current_user.username} is already in the queue")
-            return jsonify({'matched': False, 'message': 'You are already in the queue'})
-
-        # Add the user to the queue
-        matchmaking_queue.append(current_user.username)
-        print(f"User {current_user.username} added to queue. Current queue: {matchmaking_queue}")
-
-        # Check if there are exactly two users in the queue
-        if len(matchmaking_queue) >= 2:
-            user1 = matchmaking_queue.pop(0)
-            user2 = matchmaking_queue.pop(0)
-            room_name = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-            room_assignments[user1] = room_name
-            room_assignments[user2] = room_name
-
-            print(f"Room {room_name} created with users: {user1} and {user2}")
-            print(f"Matchmaking queue: {matchmaking_queue}")
-
-            # Return response with room details for the current user
-            session['room_name'] = room_name
-            return jsonify({'matched': True, 'room_name': room_name})
+    session.pop('room_name', None)
+
+    # Add the user to the queue, pairing them if a partner is waiting
+    queued, room_name = matchmaker.join(
+        current_user.username,
+        language=request.args.get('language') or None,
+        level=request.args.get('level') or None)
+    if not queued:
+        app.logger.debug("%s is already in the queue", current_user.username,
+                         extra={'user': current_user.username})
+        return jsonify({'matched': False,
+                        'message': 'You are already in the queue'})
+
+    if room_name:
+        app.logger.info("Matched %s into room %s", current_user.username,
+                        room_name, extra={'user': current_user.username,
+                                          'room': room_name})
+        # Return response with room details for the current user
+        session['room_name'] = room_name
+        return jsonify({'matched': True, 'room_name': room_name})
 
     # If not enough users, return waiting message
-    print(f"User {current_user.username} waiting for a partner")
+    app.logger.debug("%s is waiting for a partner", current_user.username,
+                     extra={'user': current_user.username})
     return jsonify({'matched': False, 'message': 'You have been added to the queue and are waiting for a partner'})
 
 @app.route("/check_match")
 @login_required
 def check_match():
-    username = current_user.username
-    if username in room_assignments:
-        room_name = room_assignments[username]
+    room_name = matchmaker.room_for(current_user.username)
+    if room_name:
         session['room_name'] = room_name
         return jsonify({'matched': True, 'room_name': room_name})
+    matchmaker.touch(current_user.username)
     return jsonify({'matched': False})
 
+
+def long_poll_timeout(requested):
+    """Seconds this request may be held open, at most MATCH_WAIT_TIMEOUT.
+
+    A sync gunicorn worker serves one request at a time, so holding one
+    would stall every other user, including the partner whose /join_queue
+    completes the match. Only servers that run requests concurrently
+    (gevent or threaded ones) set wsgi.multithread.
+    """
+    if not request.environ.get('wsgi.multithread'):
+        return 0
+    return max(min(requested, app.config['MATCH_WAIT_TIMEOUT']), 0)
+
+
+@app.route("/wait_match")
+@long_running
+@login_required
+def wait_match():
+    """Long-poll variant of check_match: holds the request open until the
+    user is paired or the timeout passes, so a waiting page needs one
+    request per timeout instead of one every few seconds. Where the server
+    cannot hold requests it answers at once, with retry_after seconds for
+    the page to wait before asking again."""
+    timeout = long_poll_timeout(request.args.get(
+        'timeout', app.config['MATCH_WAIT_TIMEOUT'], type=float))
+    release_db()
+    room_name = matchmaker.wait_for_room(current_user.username, timeout)
+    waiting = room_name is None and \
+        matchmaker.is_waiting(current_user.username)
+    if room_name is None and not waiting:
+        # Paired after the wait ended; answering waiting: false would make
+        # the page join again and leave the partner alone in the room
+        room_name = matchmaker.room_for(current_user.username)
+    if room_name:
+        session['room_name'] = room_name
+        return jsonify({'matched': True, 'room_name': room_name})
+    response = {'matched': False, 'waiting': waiting}
+    if not timeout:
+        response['retry_after'] = app.config['MATCH_POLL_INTERVAL']
+    return jsonify(response)
+
 @app.route("/token")
 @login_required
 def token():
     room_name = session.get('room_name')
     if not room_name:
         return jsonify({'error': 'No room name found'}), 404
-    token = generate_token(current_user.username, room_name)
+    token = video_tokens.get(current_user.username, room_name)
     return jsonify({'token': token})
 
 # JDoodle API endpoint
 @app.route("/compile", methods=['POST'])
 def compile_code():
-    data = request.json
-    payload = {
-        'script': data['script'],
-        'language': data['language'],
-        'stdin': data['stdin'],
-        'versionIndex': '0',
-        'clientId': os.environ.get('JDOODLE_CLIENT_ID'),
-        'clientSecret': os.environ.get('JDOODLE_CLIENT_SECRET')
-    }
-    response = requests.post('https://api.jdoodle.com/v1/execute', json=payload)
-    return jsonify(response.json())
+    # Local runs execute on this host, so they are never anonymous
+    if app.config['COMPILE_BACKEND'] == 'local' and \
+            not current_user.is_authenticated:
+        return login_manager.unauthorized()
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('script'), str) or \
+            not isinstance(data.get('language'), str):
+        return jsonify({'error': 'script and language are required'}), 400
+    if not isinstance(data.get('stdin') or '', str):
+        return jsonify({'error': 'stdin must be a string'}), 400
+    # Limit runs per user, or per address for anonymous callers
+    user = current_user.get_id() if current_user.is_authenticated \
+        else request.remote_addr
+    release_db()
+    try:
+        result = code_runner.run(data['script'], data['language'],
+                                 stdin=data.get('stdin') or '',
+                                 version_index=data.get('versionIndex', '0'),
+                                 user=user)
+    except RunError as error:
+        return jsonify({'error': str(error)}), error.status
+    return jsonify(result)
 
 @app.route("/end_call", methods=['POST'])
 @login_required
@@ -200,63 +495,143 @@ def manage_courses():
         db.session.commit()
         flash('Course added successfully!', 'success')
         return redirect(url_for('manage_courses'))"""
-    id = current_user.id
-    courses = Course.query.filter_by(user_id=id,completed=False).all()
-    return render_template('courses.html', courses=courses)
+    courses, next_cursor = course_page(completed=False)
+    return render_template('courses.html', courses=courses,
+                           next_cursor=next_cursor)
+
+
+# One page of the current user's courses, continuing after ?after=<cursor>
+def course_page(completed, limit=None):
+    try:
+        return list_courses(current_user.id, completed,
+                            after=request.args.get('after') or None,
+                            limit=limit or app.config['COURSES_PAGE_SIZE'])
+    except ValueError:
+        abort(400)
+
+
+@app.route('/api/courses')
+@login_required
+def api_courses():
+    """Course summaries, newest first: ?status=active|completed, ?limit=
+    (at most 100) and ?after= with the previous page's next cursor."""
+    status = request.args.get('status', 'active')
+    if status not in ('active', 'completed'):
+        return jsonify(
+            {'error': "status must be 'active' or 'completed'"}), 400
+    limit = request.args.get('limit', app.config['COURSES_PAGE_SIZE'],
+                             type=int)
+    limit = min(max(limit, 1), 100)
+    try:
+        rows, next_cursor = list_courses(
+            current_user.id, status == 'completed',
+            after=request.args.get('after') or None, limit=limit)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    courses = [{'id': row.id, 'title': row.title,
+                'description': row.description,
+                'completed_at': row.completed_at.isoformat()
+                if row.completed_at else None}
+               for row in rows]
+    next_url = url_for('api_courses', status=status, limit=limit,
+                       after=next_cursor) if next_cursor else None
+    return jsonify({'courses': courses, 'next': next_cursor,
+                    'next_url': next_url})
+
+
+def search_result_url(result):
+    if result['kind'] == 'course':
+        return url_for('view_course', course_id=result['id'])
+    if result['kind'] == 'module':
+        return url_for('manage_modules', course_id=result['parent_id'])
+    return url_for('manage_lessons', module_id=result['parent_id'])
+
+
+@app.route('/api/search')
+@login_required
+def api_search():
+    """The current user's courses, modules and lessons matching every word
+    of ?q=, best first; ?limit= (at most 100) results."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    results = search_index.search(current_user.id, query, limit=limit)
+    for result in results:
+        result['url'] = search_result_url(result)
+    return jsonify({'query': query, 'results': results})
 
 @app.route('/courses/<int:course_id>/delete', methods=['POST'])
 def delete_course(course_id):
     course = Course.query.get(course_id)
     if course:
+        # The cascade deletes the modules too, so their pages go stale
+        module_ids = [module.id for module in course.modules]
         db.session.delete(course)
+        bump_version(course_key(course_id),
+                     *(module_key(module_id) for module_id in module_ids))
         db.session.commit()
         flash('Course deleted successfully!', 'success')
     return redirect(url_for('manage_courses'))
 
 @app.route('/courses/<int:course_id>/modules', methods=['GET', 'POST'])
+@page_cache.cached(course_key)
 def manage_modules(course_id):
-    course = Course.query.get(course_id)
     if request.method == 'POST':
         title = request.form['title']
         description = request.form['description']
         new_module = Module(title=title, description=description, course_id=course_id)
         db.session.add(new_module)
+        bump_version(course_key(course_id))
         db.session.commit()
         flash('Module added successfully!', 'success')
         return redirect(url_for('manage_modules', course_id=course_id))
     
-    modules = Module.query.filter_by(course_id=course_id).all()
-    return render_template('modules.html', course=course, modules=modules)
+    course = load_course_tree(course_id, lessons=False)
+    if course is None:
+        abort(404)
+    return render_template('modules.html', course=course,
+                           modules=course.modules)
 
 @app.route('/modules/<int:module_id>/delete', methods=['POST'])
 def delete_module(module_id):
     module = Module.query.get(module_id)
     if module:
         db.session.delete(module)
+        bump_version(course_key(module.course_id), module_key(module_id))
         db.session.commit()
         flash('Module deleted successfully!', 'success')
     return redirect(url_for('manage_modules', course_id=module.course_id))
 
 @app.route('/modules/<int:module_id>/lessons', methods=['GET', 'POST'])
+@page_cache.cached(module_key)
 def manage_lessons(module_id):
-    module = Module.query.get(module_id)
     if request.method == 'POST':
         title = request.form['title']
         content = request.form['content']
         new_lesson = Lesson(title=title, content=content, module_id=module_id)
         db.session.add(new_lesson)
+        module = Module.query.get(module_id)
+        if module:
+            bump_version(course_key(module.course_id))
+        bump_version(module_key(module_id))
         db.session.commit()
         flash('Lesson added successfully!', 'success')
         return redirect(url_for('manage_lessons', module_id=module_id))
     
-    lessons = Lesson.query.filter_by(module_id=module_id).all()
-    return render_template('lessons.html', module=module, lessons=lessons)
+    module = load_module_tree(module_id)
+    if module is None:
+        abort(404)
+    return render_template('lessons.html', module=module,
+                           lessons=module.lessons)
 
 @app.route('/lessons/<int:lesson_id>/delete', methods=['POST'])
 def delete_lesson(lesson_id):
     lesson = Lesson.query.get(lesson_id)
     if lesson:
         db.session.delete(lesson)
+        bump_version(module_key(lesson.module_id),
+                     course_key(lesson.module.course_id))
         db.session.commit()
         flash('Lesson deleted successfully!', 'success')
     return redirect(url_for('manage_lessons', module_id=lesson.module_id))
@@ -267,106 +642,83 @@ def chat():
     return render_template('chatbot.html')
 
 @app.route("/chat", methods=['POST'])
+@long_running
 @login_required
 def chatting():
     if request.is_json:
         user_msg = request.json.get('message', '')
-        bot_msg = get_user_response(user_msg)
+        conversation = conversations.get(conversation_key())
+        release_db()
+        if request.accept_mimetypes.best == 'text/event-stream':
+            return stream_chat(user_msg, conversation)
+        if app.config['CHAT_BACKEND'] == 'fake':
+            bot_msg = ''.join(stream_user_response(
+                user_msg, stream=fake_chat_stream, conversation=conversation))
+        else:
+            try:
+                bot_msg = get_user_response(user_msg,
+                                            conversation=conversation)
+            except GatewayBusy as error:
+                return jsonify({'message': str(error)}), 503
         response = {'message': bot_msg}
         return jsonify(response), 200
 
 
-def generate_modules_and_lessons(course_title, course_description, level):
-    # Modify the prompt to include the user's level and request a more structured output
-    if level.lower() == 'beginner':
-        level_specific_prompt = (f"Generate 5 foundational modules for a course on {course_title} with the following description: {course_description}. "
-                                 f"The user is a beginner, so focus on introductory and basic concepts. Format each module as follows:\n"
-                                 f"Module Title: <title>\n"
-                                 f"Module Description: <description>\n"
-                                 f"Lessons:\n"
-                                 f"1. <Lesson Title>: <Lesson Description>\n"
-                                 f"2. <Lesson Title>: <Lesson Description>\n"
-                                 f"3. ...")
-    elif level.lower() == 'intermediate':
-        level_specific_prompt = (f"Generate 5 advanced modules for a course on {course_title} with the following description: {course_description}. "
-                                 f"The user is at an intermediate level, so avoid basic topics and focus on advanced concepts. Format each module as follows:\n"
-                                 f"Module Title: <title>\n"
-                                 f"Module Description: <description>\n"
-                                 f"Lessons:\n"
-                                 f"1. <Lesson Title>: <Lesson Description>\n"
-                                 f"2. <Lesson Title>: <Lesson Description>\n"
-                                 f"3. ...")
-    else:
-        level_specific_prompt = (f"Generate 5 expert-level modules for a course on {course_title} with the following description: {course_description}. "
-                                 f"The user is advanced, so focus on highly specialized and complex concepts. Format each module as follows:\n"
-                                 f"Module Title: <title>\n"
-                                 f"Module Description: <description>\n"
-                                 f"Lessons:\n"
-                                 f"1. <Lesson Title>: <Lesson Description>\n"
-                                 f"2. <Lesson Title>: <Lesson Description>\n"
-                                 f"3. ...")
-
-    # Generate modules using OpenAI
-    modules_response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": level_specific_prompt}],
-        max_tokens=1500  # Set max tokens to avoid exceeding the context length
-    )
-    modules_content = modules_response.choices[0].message['content'].split('\n')
-
-    modules = []
-    module = None
-
-    for line in modules_content:
-        line = line.strip()
-        if line.startswith("Module Title:"):
-            if module:
-                modules.append(module)
-            module = {
-                "title": line.replace("Module Title:", "").strip(),
-                "description": "",
-                "lessons": []
-            }
-        elif line.startswith("Module Description:"):
-            module["description"] = line.replace("Module Description:", "").strip()
-        elif line.startswith("Lessons:") or line == "":
-            continue
-        elif line[0].isdigit() and line[1] == '.':
-            lesson_title, lesson_desc = line.split(":", 1)
-            lesson = {
-                "title": lesson_title.strip()[2:],  # remove the number and space
-                "content": lesson_desc.strip()
-            }
-            module["lessons"].append(lesson)
-
-    if module:
-        modules.append(module)
-
-    for module in modules:
-        for lesson in module["lessons"]:
-            self_check_prompt = f"Review and enhance the following lesson for a {level} level course on {course_title}: {lesson['content']}"
-            self_check_response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": self_check_prompt}],
-                max_tokens=500  # Set max tokens to avoid exceeding the context length
-            )
-            lesson["content"] = self_check_response.choices[0].message['content']
-
-    return modules
-    # Verify the content using OpenAI
-    """self_check_results = []
-    for module in modules:
-        for lesson in module["lessons"]:
-            self_check_prompt = f"Verify if the following lesson is appropriate for a {level} level course on {course_title}: {lesson['content']}"
-            self_check_response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": self_check_prompt}],
-                max_tokens=500  # Set max tokens to avoid exceeding the context length
-            )
-            lesson["self_check_result"] = self_check_response.choices[0].message['content']
-            self_check_results.append(lesson["self_check_result"])
-
-    return modules, self_check_results"""
+def fake_chat_stream(messages):
+    return fake_stream(messages, delay=app.config['CHAT_FAKE_DELAY'])
+
+
+# Each browser session (and user) gets its own tutor conversation
+def conversation_key():
+    if 'chat_id' not in session:
+        session['chat_id'] = secrets.token_hex(16)
+    return f"{current_user.get_id()}:{session['chat_id']}"
+
+
+def sse(data, event=None):
+    frame = f"data: {json.dumps(data)}\n\n"
+    return f"event: {event}\n{frame}" if event else frame
+
+
+# Relay the answer as server-sent events: a {"delta": ...} message per piece,
+# then a "done" event with the timings (or an "error" event)
+def stream_chat(user_msg, conversation=None):
+    backend = fake_chat_stream if app.config['CHAT_BACKEND'] == 'fake' \
+        else None
+    start = time.perf_counter()
+
+    def events():
+        first = None
+        try:
+            for delta in stream_user_response(user_msg, stream=backend,
+                                              conversation=conversation):
+                if first is None:
+                    first = time.perf_counter() - start
+                yield sse({'delta': delta})
+        except GatewayBusy as error:
+            yield sse({'error': str(error)}, event='error')
+            return
+        except Exception:
+            app.logger.exception("Chat stream failed")
+            yield sse({'error': 'The AI tutor is unavailable right now'},
+                      event='error')
+            return
+        total = time.perf_counter() - start
+        first = total if first is None else first
+        chat_latency.record(ttft=first, total=total)
+        app.logger.info("Chat stream: first token %.0f ms, total %.0f ms",
+                        first * 1000, total * 1000)
+        yield sse({'ttft_ms': round(first * 1000),
+                   'total_ms': round(total * 1000)}, event='done')
+
+    return Response(stream_with_context(events()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
+
+
+def wants_json():
+    return request.accept_mimetypes.best == 'application/json'
 
 @app.route('/generate_course', methods=['GET', 'POST'])
 @login_required
@@ -380,33 +732,61 @@ def generate_course():
         description_course = Course.query.filter_by(user_id=current_user.id, description=description).first()
         title_course = Course.query.filter_by(user_id=current_user.id, title=title).first()
         if description_course or title_course:
-            flash('Course with this description already exists or title already exists.', 'danger')
+            message = ('Course with this description already exists or '
+                       'title already exists.')
+            if wants_json():
+                return jsonify({'error': message}), 409
+            flash(message, 'danger')
             return redirect(url_for('generate_course'))
 
-        modules = generate_modules_and_lessons(title, description, level)
-        print(modules)
-        new_course = Course(title=title, description=description, user_id=user_id)
-        db.session.add(new_course)
-        db.session.commit()
+        job, created = enqueue_job(user_id, title, description, level)
+        if created:
+            job_runner.submit(job.id)
+
+        if wants_json():
+            return jsonify({
+                'job_id': job.id,
+                'status_url': url_for('job_status', job_id=job.id),
+                'result_url': url_for('job_result', job_id=job.id)
+            }), 202
+        flash('Your course is being generated and will appear here when it '
+              'is ready.', 'success')
+        return redirect(url_for('manage_courses'))
+
+    return render_template('generate_course.html')
 
-        for module_data in modules:
-            new_module = Module(title=module_data['title'], description=module_data['description'], course_id=new_course.id)
-            db.session.add(new_module)
-            db.session.commit()
 
-            for lesson_data in module_data['lessons']:
-                new_lesson = Lesson(title=lesson_data['title'], content=lesson_data['content'], module_id=new_module.id)
-                db.session.add(new_lesson)
-                db.session.commit()
+@app.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = GenerationJob.query.filter_by(
+        id=job_id, user_id=current_user.id).first_or_404()
+    return jsonify(job_to_dict(job))
 
-        flash('Course generated and saved successfully!', 'success')
-        return redirect(url_for('manage_courses'))
 
-    return render_template('generate_course.html')
+@app.route('/jobs/<int:job_id>/result')
+@login_required
+def job_result(job_id):
+    job = GenerationJob.query.filter_by(
+        id=job_id, user_id=current_user.id).first_or_404()
+    if job.status == SUCCEEDED:
+        return jsonify({
+            'job_id': job.id,
+            'course_id': job.course_id,
+            'course_url': url_for('view_course', course_id=job.course_id)
+        })
+    if job.status == FAILED:
+        return jsonify({'job_id': job.id, 'status': job.status,
+                        'error': job.error}), 409
+    # Still queued or running
+    return jsonify(job_to_dict(job)), 202
 
 @app.route('/courses/<int:course_id>', methods=['GET'])
+@page_cache.cached(course_key)
 def view_course(course_id):
-    course = Course.query.get_or_404(course_id)
+    course = load_course_tree(course_id)
+    if course is None:
+        abort(404)
     return render_template('view_course.html', course=course)
 
 
@@ -422,6 +802,8 @@ def interview():
 def complete_course(course_id):
     course = Course.query.get_or_404(course_id)
     course.completed = True
+    course.completed_at = datetime.datetime.utcnow()
+    bump_version(course_key(course_id))
     db.session.commit()
     flash('Course marked as completed!', 'success')
     return redirect(url_for('manage_courses'))
@@ -429,14 +811,17 @@ def complete_course(course_id):
 @app.route('/completed_courses')
 @login_required
 def completed_courses():
-    completed_courses = Course.query.filter_by(completed=True, user_id=current_user.id).all()
-    return render_template('completed_courses.html', completed_courses=completed_courses)
+    completed_courses, next_cursor = course_page(completed=True)
+    return render_template('completed_courses.html',
+                           completed_courses=completed_courses,
+                           next_cursor=next_cursor)
 
 @app.route('/courses/<int:course_id>/complete', methods=['POST'])
 @login_required
 def mark_course_completed(course_id):
     course = Course.query.get_or_404(course_id)
-    course.completed_at = datetime.utcnow()
+    course.completed_at = datetime.datetime.utcnow()
+    bump_version(course_key(course_id))
     db.session.commit()
     flash('Course marked as completed!', 'success')
     return redirect(url_for('manage_courses'))
@@ -447,6 +832,7 @@ def mark_course_incomplete(course_id):
     course = Course.query.get_or_404(course_id)
     course.completed = False
     course.completed_at = None
+    bump_version(course_key(course_id))
     db.session.commit()
     flash('Course marked as incomplete!', 'success')
     return redirect(url_for('completed_courses'))
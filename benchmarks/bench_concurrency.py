@@ -0,0 +1,261 @@
+'''
+Benchmark: tutor chats one gunicorn process keeps in flight, sync vs gevent.
+
+A local stand-in for the OpenAI chat completions API answers each call
+after --upstream-delay seconds. For each WORKER_CLASS and --concurrency
+level, one gunicorn worker process (gunicorn.conf.py) is started against
+it, and that many logged-in clients POST distinct questions to /chat for
+--duration seconds. The table shows completed chats per second, their
+latency, requests the clients gave up on after --timeout seconds, and the
+chats in flight upstream: the time-averaged and peak number of calls the
+process had open at once. A sync worker holds one chat at a time however
+many users wait; a gevent worker holds one per client, up to
+LLM_MAX_CONCURRENT.
+
+    python benchmarks/bench_concurrency.py --concurrency 1,16,64,128
+    python benchmarks/bench_concurrency.py --workers gevent \\
+        --concurrency 256,512 --upstream-delay 2
+
+Needs gunicorn on PATH, and gevent for the gevent rows.
+'''
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import seed_data  # noqa: E402
+from load_test import HTTPClient, login  # noqa: E402
+
+
+class StubUpstream(ThreadingHTTPServer):
+    """Answers chat completion calls after ``delay`` seconds.
+
+    Keeps the integral of calls in flight over time, so the average over
+    a window is the concurrency the app sustained against it.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, delay):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.active = self.peak = 0
+            self.area = 0.0
+            self.changed = self.started = time.monotonic()
+
+    def _step(self, change):
+        with self.lock:
+            now = time.monotonic()
+            self.area += self.active * (now - self.changed)
+            self.changed = now
+            self.active += change
+            self.peak = max(self.peak, self.active)
+
+    def in_flight(self):
+        self._step(0)
+        with self.lock:
+            return self.area / (self.changed - self.started), self.peak
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(
+            int(self.headers['Content-Length'])))
+        self.server._step(1)
+        try:
+            time.sleep(self.server.delay)
+        finally:
+            self.server._step(-1)
+        answer = 'Stub answer to ' + body['messages'][-1]['content']
+        data = json.dumps({
+            'id': 'chatcmpl-stub', 'object': 'chat.completion',
+            'created': int(time.time()), 'model': body['model'],
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {
+                'role': 'assistant', 'content': answer}}],
+            'usage': {'prompt_tokens': 1, 'completion_tokens': 1,
+                      'total_tokens': 2},
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(worker_class, env, port):
+    env = dict(env, WORKER_CLASS=worker_class, WEB_CONCURRENCY='1')
+    process = subprocess.Popen(
+        [shutil.which('gunicorn'), '-c', 'gunicorn.conf.py',
+         '-b', f'127.0.0.1:{port}', 'app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'gunicorn ({worker_class}) did not start')
+
+
+def run_level(base_url, clients, args, upstream):
+    latencies, errors, timeouts = [], [0], [0]
+    lock = threading.Lock()
+    start = threading.Barrier(len(clients) + 1)
+    stop = threading.Event()
+
+    def chat(vu, client):
+        start.wait()
+        n = 0
+        while not stop.is_set():
+            n += 1
+            began = time.perf_counter()
+            try:
+                status, _ = client.request(
+                    'POST', '/chat', json={'message': f'Question {vu}.{n}'},
+                    headers={'Accept': 'application/json'})
+            except requests.Timeout:
+                with lock:
+                    timeouts[0] += 1
+                continue
+            except requests.RequestException:
+                status = None
+            elapsed = time.perf_counter() - began
+            with lock:
+                if status == 200 and not stop.is_set():
+                    latencies.append(elapsed)
+                elif status != 200:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=chat, args=(vu, client), daemon=True)
+               for vu, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    upstream.reset()
+    time.sleep(args.duration)
+    average, peak = upstream.in_flight()
+    stop.set()
+    for thread in threads:
+        thread.join(args.timeout + 1)
+    return {
+        'chats_per_second': round(len(latencies) / args.duration, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000)
+        if latencies else None,
+        'p95_ms': round(statistics.quantiles(latencies, n=20)[-1] * 1000)
+        if len(latencies) > 1 else None,
+        'errors': errors[0], 'timeouts': timeouts[0],
+        'in_flight_avg': round(average, 1), 'in_flight_peak': peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--workers', default='sync,gevent',
+                        help='WORKER_CLASS values to compare')
+    parser.add_argument('--concurrency', default='1,16,64,128',
+                        help='comma-separated numbers of clients')
+    parser.add_argument('--upstream-delay', type=float, default=1.0,
+                        help='seconds the stub takes per completion')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--timeout', type=float, default=15,
+                        help='seconds a client waits for an answer')
+    parser.add_argument('--llm-max-concurrent', type=int, default=1000,
+                        help='LLM_MAX_CONCURRENT for the app')
+    parser.add_argument('--output', help='also write the JSON report here')
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    upstream = StubUpstream(args.upstream_delay)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    workdir = tempfile.mkdtemp(prefix='bench-concurrency-')
+    env = dict(
+        os.environ, DATABASE_URL='sqlite:///' + os.path.join(workdir, 'db'),
+        COURSE_JOB_WORKERS='0', LOG_LEVEL='WARNING', CHAT_BACKEND='openai',
+        OPENAI_API_BASE=f'http://127.0.0.1:{upstream.server_port}/v1',
+        OPENAI_API_KEY='sk-bench', LLM_CACHE_PATH='', LLM_RATE='1000000',
+        LLM_BURST='1000000', LLM_MAX_CONCURRENT=str(args.llm_max_concurrent))
+    os.environ.update(DATABASE_URL=env['DATABASE_URL'],
+                      COURSE_JOB_WORKERS='0')
+    from app import app, db
+    with app.app_context():
+        seed_data.seed(db, users=max(levels), courses=0, password_rounds=4)
+
+    report = []
+    print(f"{'worker':<8}{'clients':>8}{'chats/s':>9}{'p50 ms':>8}"
+          f"{'p95 ms':>8}{'errors':>7}{'timeouts':>9}{'in flight':>10}"
+          f"{'peak':>6}", file=sys.stderr)
+    try:
+        for worker_class in args.workers.split(','):
+            for level in levels:
+                # A fresh process per level, so requests a sync worker still
+                # has queued do not spill into the next measurement
+                port = free_port()
+                server = start_server(worker_class, env, port)
+                try:
+                    base_url = f'http://127.0.0.1:{port}'
+                    clients = [HTTPClient(base_url, timeout=args.timeout)
+                               for _ in range(level)]
+                    for n, client in enumerate(clients):
+                        login(client, n)
+                    # The first chat imports the OpenAI client; keep every
+                    # client from waiting on that import in the measurement
+                    clients[0].request(
+                        'POST', '/chat', json={'message': 'Warm up'},
+                        headers={'Accept': 'application/json'})
+                    row = run_level(base_url, clients, args, upstream)
+                finally:
+                    server.terminate()
+                    server.wait()
+                row.update(worker=worker_class, clients=level)
+                report.append(row)
+                print(f"{worker_class:<8}{level:>8}"
+                      f"{row['chats_per_second']:>9.1f}"
+                      f"{row['p50_ms'] or 0:>8}{row['p95_ms'] or 0:>8}"
+                      f"{row['errors']:>7}{row['timeouts']:>9}"
+                      f"{row['in_flight_avg']:>10.1f}"
+                      f"{row['in_flight_peak']:>6}", file=sys.stderr)
+    finally:
+        upstream.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
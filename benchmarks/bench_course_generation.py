@@ -0,0 +1,96 @@
+'''
+Wall-clock benchmark for course generation against a local OpenAI stub.
+
+Every stub call sleeps for a random latency, so the sequential pipeline
+costs the sum of all latencies while the concurrent one should cost about
+the outline call plus the slowest lesson.
+
+    python benchmarks/bench_course_generation.py --lessons 4 --latency 0.5
+'''
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from course_generator import generate_modules_and_lessons  # noqa: E402
+from llm_cache import LLMCache, set_default_cache  # noqa: E402
+from llm_gateway import LLMGateway, set_default_gateway  # noqa: E402
+
+
+def make_outline(modules, lessons):
+    blocks = []
+    for m in range(1, modules + 1):
+        lines = [f"Module Title: Module {m}",
+                 f"Module Description: About module {m}",
+                 "Lessons:"]
+        lines += [f"{n}. Lesson {m}.{n}: Lesson {m}.{n} summary"
+                  for n in range(1, lessons + 1)]
+        blocks.append('\n'.join(lines))
+    return '\n\n'.join(blocks)
+
+
+class StubOpenAI:
+    def __init__(self, outline, latency, jitter, seed):
+        self.outline = outline
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.slept = []
+
+    def create(self, model, messages, max_tokens, stream=False, **kwargs):
+        delay = self.latency + self.rng.uniform(0, self.jitter)
+        self.slept.append(delay)
+        prompt = messages[-1]['content']
+        if stream:
+            return self.stream(self.outline, delay)
+        time.sleep(delay)
+        return type('Response', (), {
+            'choices': [type('Choice', (), {'message': {'content': prompt}})]
+        })
+
+    def stream(self, text, delay):
+        # The outline arrives line by line over the whole delay
+        lines = text.splitlines(keepends=True)
+        for line in lines:
+            time.sleep(delay / len(lines))
+            yield type('Chunk', (), {
+                'choices': [type('Choice', (), {'delta': {'content': line}})]
+            })
+
+
+def run(max_workers, args):
+    # Nothing cached from an earlier run, and no rate limit on the stub
+    set_default_cache(LLMCache())
+    set_default_gateway(LLMGateway(rate=1000, burst=1000))
+    stub = StubOpenAI(make_outline(args.modules, args.lessons),
+                      args.latency, args.jitter, args.seed)
+    start = time.perf_counter()
+    generate_modules_and_lessons("Benchmarks", "Stubbed course", "beginner",
+                                 create=stub.create, max_workers=max_workers)
+    elapsed = time.perf_counter() - start
+    outline, lessons = stub.slept[0], stub.slept[1:]
+    return elapsed, sum(stub.slept), outline + max(lessons)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--modules', type=int, default=5)
+    parser.add_argument('--lessons', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.3)
+    parser.add_argument('--jitter', type=float, default=0.2)
+    parser.add_argument('--workers', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'mode':<12}{'wall (s)':>10}{'sum (s)':>10}"
+          f"{'outline+max (s)':>17}")
+    for label, workers in (('sequential', 1), ('concurrent', args.workers)):
+        elapsed, total, floor = run(workers, args)
+        print(f"{label:<12}{elapsed:>10.2f}{total:>10.2f}{floor:>17.2f}")
+
+
+if __name__ == '__main__':
+    main()
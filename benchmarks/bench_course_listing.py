@@ -0,0 +1,87 @@
+'''
+Benchmark: course listing latency as one user's course count grows.
+
+Compares loading every course as ORM objects (what /courses used to do)
+with one keyset page from list_courses(), both the first page and a deep
+page near the oldest course. The full listing grows with the course count;
+each page should stay flat. Point DATABASE_URL at a file or server
+database to include real I/O.
+
+    python benchmarks/bench_course_listing.py --sizes 100,1000,10000,50000
+'''
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('COURSE_JOB_WORKERS', '0')
+
+from app import app, db, Course, User  # noqa: E402
+from course_store import encode_cursor, list_courses  # noqa: E402
+
+
+def create_courses(user_id, count, description_chars):
+    start = datetime(2024, 1, 1)
+    description = 'x' * description_chars
+    db.session.execute(Course.__table__.insert(), [
+        {'title': f'Course {user_id}-{n}', 'description': description,
+         'user_id': user_id, 'completed': n % 5 == 0,
+         'created_at': start + timedelta(seconds=n)}
+        for n in range(count)])
+    db.session.commit()
+
+
+def timed(func, repeat):
+    func()  # Warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='100,1000,10000,50000',
+                        help='comma-separated course counts per user')
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--description-chars', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'courses':>8}{'all ms':>10}{'page 1 ms':>11}{'deep ms':>10}")
+    with app.app_context():
+        db.create_all()
+        for n, size in enumerate(int(s) for s in args.sizes.split(',')):
+            user = User(username=f'list{n}', email=f'list{n}@example.com',
+                        password_hash='x')
+            db.session.add(user)
+            db.session.commit()
+            create_courses(user.id, size, args.description_chars)
+            oldest = db.session.execute(
+                db.select(Course.id, Course.created_at)
+                .where(Course.user_id == user.id, Course.completed.is_(False))
+                .order_by(Course.created_at, Course.id)
+                .offset(args.page_size)).first()
+            deep = encode_cursor(oldest) if oldest else None
+
+            def load_all():
+                Course.query.filter_by(user_id=user.id,
+                                       completed=False).all()
+                db.session.expunge_all()
+
+            def first_page():
+                list_courses(user.id, False, limit=args.page_size)
+
+            def deep_page():
+                list_courses(user.id, False, deep, limit=args.page_size)
+
+            print(f"{size:>8}{timed(load_all, args.repeat):>10.2f}"
+                  f"{timed(first_page, args.repeat):>11.2f}"
+                  f"{timed(deep_page, args.repeat):>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+'''
+Insert throughput for generated courses: per-row commits vs one transaction.
+
+Each size is a (modules, lessons per module) pair. Both strategies write the
+same trees into a fresh SQLite file, so every commit pays its real fsync.
+
+    python benchmarks/bench_course_store.py --courses 5
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+
+from models import db, User, Course, Module, Lesson  # noqa: E402
+from course_store import save_course_tree  # noqa: E402
+
+SIZES = [(5, 4), (10, 10), (20, 25)]
+
+
+def make_modules(tag, modules, lessons):
+    return [{
+        'title': f"{tag} module {m}",
+        'description': f"{tag} module {m} description",
+        'lessons': [{'title': f"Lesson {m}.{n}",
+                     'content': f"Lesson {m}.{n} content " * 40}
+                    for n in range(lessons)],
+    } for m in range(modules)]
+
+
+def save_per_row(user_id, title, description, modules):
+    """The original generate_course loop: one commit per row."""
+    new_course = Course(title=title, description=description, user_id=user_id)
+    db.session.add(new_course)
+    db.session.commit()
+    for module_data in modules:
+        new_module = Module(title=module_data['title'],
+                            description=module_data['description'],
+                            course_id=new_course.id)
+        db.session.add(new_module)
+        db.session.commit()
+        for lesson_data in module_data['lessons']:
+            new_lesson = Lesson(title=lesson_data['title'],
+                                content=lesson_data['content'],
+                                module_id=new_module.id)
+            db.session.add(new_lesson)
+            db.session.commit()
+
+
+def measure(save, label, size, courses):
+    modules, lessons = size
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = \
+            'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            user = User(username='bench', email='bench@example.com',
+                        password_hash='x')
+            db.session.add(user)
+            db.session.commit()
+
+            trees = [make_modules(f"{label}{c}", modules, lessons)
+                     for c in range(courses)]
+            start = time.perf_counter()
+            for c, tree in enumerate(trees):
+                save(user.id, f"Course {c}", f"Description {c}", tree)
+            elapsed = time.perf_counter() - start
+            db.session.remove()
+            db.engine.dispose()
+    rows = courses * (1 + modules + modules * lessons)
+    return rows, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--courses', type=int, default=5,
+                        help='courses inserted per size')
+    args = parser.parse_args()
+
+    print(f"{'size':<10}{'rows':>8}{'per-row rows/s':>17}"
+          f"{'batched rows/s':>17}{'speedup':>9}")
+    for size in SIZES:
+        rows, before = measure(save_per_row, 'row', size, args.courses)
+        _, after = measure(save_course_tree, 'batch', size, args.courses)
+        print(f"{'%dx%d' % size:<10}{rows:>8}{rows / before:>17.0f}"
+              f"{rows / after:>17.0f}{before / after:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
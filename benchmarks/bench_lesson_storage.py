@@ -0,0 +1,113 @@
+'''
+Benchmark: database size and lesson page latency, plain vs compressed text.
+
+Seeds the same corpus (benchmarks/seed_data.py) once per TEXT_COMPRESSION
+setting into a SQLite file, vacuums it and reports its size. Then it times
+a module's lesson list loaded the old way, with every lesson body
+("eager"), and the new way, with the bodies deferred ("deferred"). It also
+times the /modules/<id>/lessons page (with the page cache off) and a full
+course tree, which has to read and decompress every body.
+
+The seeder builds lessons from a small vocabulary, so they compress better
+than real lesson text would; --lesson-chars sets their length (about 2500
+for a 500-token lesson).
+
+    python benchmarks/bench_lesson_storage.py --users 200 --lessons 20
+'''
+import argparse
+import importlib.util
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+WORKDIR = tempfile.mkdtemp(prefix='bench-lesson-storage-')
+DATABASE = os.path.join(WORKDIR, 'lessons.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DATABASE
+os.environ.setdefault('COURSE_JOB_WORKERS', '0')
+
+from sqlalchemy.orm import selectinload  # noqa: E402
+
+import seed_data  # noqa: E402
+from app import app, db, page_cache, Course, Lesson, Module  # noqa: E402
+from compressed_text import TextCodec, set_default_codec  # noqa: E402
+from course_store import load_course_tree, load_module_tree  # noqa: E402
+
+
+def eager_module_tree(module_id):
+    # What the lesson list loaded before content and quiz were deferred
+    return db.session.execute(
+        db.select(Module).options(
+            selectinload(Module.lessons).undefer(Lesson.content)
+            .undefer(Lesson.quiz))
+        .filter_by(id=module_id)).scalar_one()
+
+
+def timed(func, ids, repeat):
+    func(ids[0])  # Warm up
+    start = time.perf_counter()
+    for n in range(repeat):
+        func(ids[n % len(ids)])
+        db.session.expunge_all()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    seed_data.add_arguments(parser)
+    parser.set_defaults(users=200, lessons=20)
+    parser.add_argument('--lesson-chars', type=int, default=2500)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--algorithms', default='none,zlib,zstd',
+                        help='TEXT_COMPRESSION values to compare')
+    args = parser.parse_args()
+
+    algorithms = [name for name in args.algorithms.split(',')
+                  if name != 'zstd' or importlib.util.find_spec('zstandard')]
+    page_cache.max_entries = 0
+    client = app.test_client()
+    print(f"{'':<6}{'db MB':>8}{'eager ms':>10}{'deferred ms':>13}"
+          f"{'page ms':>9}{'course ms':>11}")
+    try:
+        with app.app_context():
+            for algorithm in algorithms:
+                set_default_codec(TextCodec(algorithm))
+                db.drop_all()
+                seed_data.seed(db, users=args.users, courses=args.courses,
+                               modules=args.modules, lessons=args.lessons,
+                               seed=args.seed, lesson_chars=args.lesson_chars,
+                               password_rounds=4)
+                db.session.execute(db.text('VACUUM'))
+                size = os.path.getsize(DATABASE) / 2 ** 20
+
+                rng = random.Random(args.seed)
+                module_ids = rng.sample(range(1, db.session.query(
+                    Module).count() + 1), 50)
+                course_ids = rng.sample(range(1, db.session.query(
+                    Course).count() + 1), 50)
+
+                def page(module_id):
+                    response = client.get(f'/modules/{module_id}/lessons')
+                    assert response.status_code == 200, response.status
+
+                def course(course_id):
+                    for module in load_course_tree(course_id).modules:
+                        for lesson in module.lessons:
+                            lesson.content
+
+                eager, deferred, page_ms = (
+                    timed(func, module_ids, args.repeat)
+                    for func in (eager_module_tree, load_module_tree, page))
+                print(f"{algorithm:<6}{size:>8.1f}{eager:>10.2f}"
+                      f"{deferred:>13.2f}{page_ms:>9.2f}"
+                      f"{timed(course, course_ids, args.repeat):>11.2f}")
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+'''
+Load test: requests per waiting user, interval polling vs long-polling.
+
+Users arrive at random over a window, join the queue through /join_queue
+and then wait for a partner either by polling /check_match on a fixed
+interval (what mock_interview.html used to do) or by long-polling
+/wait_match. Times are scaled down by --scale so a run takes seconds; the
+reported rates are scaled back to real time.
+
+    python benchmarks/bench_match_polling.py --users 20 --scale 0.05
+'''
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('COURSE_JOB_WORKERS', '0')
+
+from app import app, bcrypt, db, User, matchmaker  # noqa: E402
+
+POLL_INTERVAL = 3
+LONG_POLL_TIMEOUT = 25
+THREADED = {'wsgi.multithread': True}
+
+
+def create_users(count):
+    password_hash = bcrypt.generate_password_hash('password').decode('utf-8')
+    with app.app_context():
+        db.create_all()
+        for n in range(count):
+            db.session.add(User(username=f'user{n}',
+                                email=f'user{n}@example.com',
+                                password_hash=password_hash))
+        db.session.commit()
+
+
+def run_user(n, mode, args, delay, results):
+    time.sleep(delay)
+    client = app.test_client()
+    client.post('/login', data={'email': f'user{n}@example.com',
+                                'password': 'password'})
+    data = client.get('/join_queue').get_json()
+    joined = time.perf_counter()
+    requests = 0
+    while not data['matched']:
+        if mode == 'interval':
+            time.sleep(POLL_INTERVAL * args.scale)
+            data = client.get('/check_match').get_json()
+        else:
+            # Threads serve these requests, so /wait_match may hold them
+            data = client.get('/wait_match?timeout=%f' %
+                              (LONG_POLL_TIMEOUT * args.scale),
+                              environ_overrides=THREADED).get_json()
+        requests += 1
+    matched = time.perf_counter()
+    results.append((requests, matched - joined))
+
+
+def run(mode, args):
+    matchmaker.reset()
+    rng = random.Random(args.seed)
+    window = args.window * args.scale
+    delays = sorted(rng.uniform(0, window) for _ in range(args.users))
+    results = []
+    threads = [threading.Thread(target=run_user,
+                                args=(n, mode, args, delay, results))
+               for n, delay in enumerate(delays)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    requests = sum(r for r, _ in results)
+    waited = sum(w for _, w in results) / args.scale
+    per_minute = requests / (waited / 60) if waited else 0.0
+    return requests, per_minute
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--window', type=float, default=600,
+                        help='arrival window in real seconds')
+    parser.add_argument('--scale', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    args.users -= args.users % 2  # Everyone needs a partner
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    create_users(args.users)
+    app.config['MATCH_WAIT_TIMEOUT'] = LONG_POLL_TIMEOUT * args.scale
+    print(f"{'mode':<12}{'polls':>8}{'polls/waiting-user/min':>25}")
+    for mode in ('interval', 'long-poll'):
+        # The routes print queue activity; keep the table readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            requests, per_minute = run(mode, args)
+        print(f"{mode:<12}{requests:>8}{per_minute:>25.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+'''
+Benchmark: in-memory matchmaking with a large waiting queue.
+
+Fills the queue with --users waiting users whose (language, level) buckets
+are all distinct, then drains it by joining one partner for each. The
+"list" column is the original implementation (a list scanned for
+membership and popped from the front); "deque" is InMemoryMatchmaker.
+
+    python benchmarks/bench_matchmaking_throughput.py --users 10000
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matchmaking import InMemoryMatchmaker, make_room_name  # noqa: E402
+
+
+class ListMatchmaker:
+    """The pre-deque queue: O(n) membership test and pop(0)."""
+
+    def __init__(self):
+        self.queue = []
+        self.rooms = {}
+
+    def join(self, username, language=None, level=None):
+        if any(user == username for user, _ in self.queue):
+            return False, None
+        # Skill-aware pairing on a plain list means scanning for a partner
+        for index, (other, key) in enumerate(self.queue):
+            if key == (language, level):
+                self.queue.pop(index)
+                room_name = make_room_name()
+                self.rooms[other] = self.rooms[username] = room_name
+                return True, room_name
+        self.queue.append((username, (language, level)))
+        return True, None
+
+
+def run(matchmaker, users):
+    start = time.perf_counter()
+    for n in range(users):
+        matchmaker.join(f'a{n}', 'python', str(n))
+    filled = time.perf_counter()
+    for n in range(users):
+        matchmaker.join(f'b{n}', 'python', str(n))
+    drained = time.perf_counter()
+    return users / (filled - start), users / (drained - filled)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"{'backend':<10}{'joins/s':>14}{'matches/s':>14}")
+    for name, matchmaker in (
+            ('list', ListMatchmaker()),
+            ('deque', InMemoryMatchmaker(mode='skill', skill_window=3600))):
+        joins, matches = run(matchmaker, args.users)
+        print(f"{name:<10}{joins:>14,.0f}{matches:>14,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+'''
+Benchmark: outline parsing over the corpus in tests/outlines.
+
+First, parse throughput and failures of the original line-splitting parser
+against OutlineParser. The original raised on several real-world outline
+shapes, throwing the generation away.
+
+Second, when course generation can start on its lessons: waiting for the
+whole outline, against streaming it through OutlineParser. The outline is
+replayed at --tokens-per-second (about four characters per token), and the
+table gives the time the first and the last module became available.
+
+    python benchmarks/bench_outline_parser.py --tokens-per-second 40
+'''
+import argparse
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from outline_parser import OutlineParser, parse_outline  # noqa: E402
+
+CORPUS = os.path.join(ROOT, 'tests', 'outlines')
+
+
+def original_parse(outline):
+    """parse_modules as it was before OutlineParser."""
+    modules = []
+    module = None
+    for line in outline.split('\n'):
+        line = line.strip()
+        if line.startswith("Module Title:"):
+            if module:
+                modules.append(module)
+            module = {"title": line.replace("Module Title:", "").strip(),
+                      "description": "", "lessons": []}
+        elif line.startswith("Module Description:"):
+            module["description"] = line.replace(
+                "Module Description:", "").strip()
+        elif line.startswith("Lessons:") or line == "":
+            continue
+        elif line[0].isdigit() and line[1] == '.':
+            lesson_title, lesson_desc = line.split(":", 1)
+            module["lessons"].append({"title": lesson_title.strip()[2:],
+                                      "content": lesson_desc.strip()})
+    if module:
+        modules.append(module)
+    return modules
+
+
+def load_corpus():
+    corpus = {}
+    for path in sorted(glob.glob(os.path.join(CORPUS, '*.txt'))):
+        with open(path, newline='') as f:
+            corpus[os.path.basename(path)] = f.read()
+    return corpus
+
+
+def throughput(parse, corpus, rounds):
+    failures = set()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for name, text in corpus.items():
+            try:
+                parse(text)
+            except Exception:
+                failures.add(name)
+    elapsed = time.perf_counter() - start
+    size = sum(len(text) for text in corpus.values()) * rounds
+    return size / elapsed / 1e6, failures
+
+
+def availability(text, chars_per_second):
+    """Seconds until the first and last module are available when the
+    outline streams in token-sized chunks."""
+    chunk = 4
+    parser = OutlineParser()
+    seen = []
+    for start in range(0, len(text), chunk):
+        clock = (start + chunk) / chars_per_second
+        seen += [clock] * len(parser.feed(text[start:start + chunk]))
+    end = len(text) / chars_per_second
+    seen += [end] * len(parser.close())
+    return seen[0], seen[-1], end
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--tokens-per-second', type=float, default=40)
+    args = parser.parse_args()
+    corpus = load_corpus()
+
+    print(f"{'parser':<14}{'MB/s':>8}  failures")
+    for label, parse in (('original', original_parse),
+                         ('OutlineParser', parse_outline)):
+        rate, failures = throughput(parse, corpus, args.rounds)
+        print(f"{label:<14}{rate:>8.1f}  "
+              f"{', '.join(sorted(failures)) or '-'}")
+
+    print()
+    print(f"{'outline':<22}{'whole (s)':>10}{'first (s)':>11}"
+          f"{'last (s)':>10}")
+    chars_per_second = args.tokens_per_second * 4
+    for name, text in corpus.items():
+        first, last, whole = availability(text, chars_per_second)
+        print(f"{name:<22}{whole:>10.1f}{first:>11.1f}{last:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+'''
+Benchmark: /api/search query latency, FTS5 vs in-memory index vs LIKE.
+
+Seeds benchmarks/seed_data.py's corpus into a SQLite file (by default
+10000 users with 100 lessons each, a million lessons) and builds each
+search backend over it with SearchIndex.rebuild(), reporting how long that
+took and how much it added to the database file or the process's peak
+memory. It then runs the same --queries searches for random users against
+each backend and against "like": the user's courses, modules and lessons
+filtered with LIKE '%word%', which is what searching took before there was
+an index. LIKE can only rank what it has fetched, so it fetches every
+match.
+
+Half of the searches are one or two "common" words of the seeder's
+34-word vocabulary. Almost every lesson matches those, the worst case for
+an index, whose posting lists are as long as they can be. The other half
+are "rare": the number of one of the user's courses, which matches only
+that course's modules. Lessons are stored uncompressed
+(TEXT_COMPRESSION=none) so that LIKE can read them.
+
+    python benchmarks/bench_search.py --users 10000
+    python benchmarks/bench_search.py --users 1000 --backends fts5,like
+'''
+import argparse
+import os
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+WORKDIR = tempfile.mkdtemp(prefix='bench-search-')
+DATABASE = os.path.join(WORKDIR, 'search.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DATABASE
+os.environ.setdefault('COURSE_JOB_WORKERS', '0')
+
+import seed_data  # noqa: E402
+from app import app, db  # noqa: E402
+from compressed_text import TextCodec, set_default_codec  # noqa: E402
+from search_index import DEFAULT_LIMIT, SearchIndex, words  # noqa: E402
+
+LIKE = '''
+SELECT 'course', courses.id, courses.title FROM courses
+WHERE courses.user_id = :user_id AND {courses}
+UNION ALL
+SELECT 'module', modules.id, modules.title FROM modules
+JOIN courses ON courses.id = modules.course_id
+WHERE courses.user_id = :user_id AND {modules}
+UNION ALL
+SELECT 'lesson', lessons.id, lessons.title FROM lessons
+JOIN modules ON modules.id = lessons.module_id
+JOIN courses ON courses.id = modules.course_id
+WHERE courses.user_id = :user_id AND {lessons}
+'''
+
+
+def like_search(user_id, query, limit=DEFAULT_LIMIT):
+    terms = words(query)
+    params = {f'term{n}': f'%{term}%' for n, term in enumerate(terms)}
+
+    def where(title, body):
+        return ' AND '.join(f"({title} || ' ' || {body}) LIKE :term{n}"
+                            for n in range(len(terms)))
+
+    return db.session.execute(db.text(LIKE.format(
+        courses=where('courses.title', 'courses.description'),
+        modules=where('modules.title', 'modules.description'),
+        lessons=where('lessons.title', 'CAST(lessons.content AS TEXT)'))),
+        dict(params, user_id=user_id)).all()[:limit]
+
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    seed_data.add_arguments(parser)
+    parser.set_defaults(users=10000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--backends', default='like,fts5,memory',
+                        help='search backends to compare, and "like"')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    queries = {'common': [], 'rare': []}
+    for _ in range(args.queries // 2):
+        user = rng.randrange(args.users)
+        queries['common'].append((user + 1, ' '.join(
+            rng.sample(seed_data.WORDS, rng.choice((1, 2))))))
+        queries['rare'].append((user + 1, str(
+            user * args.courses + rng.randrange(args.courses) + 1)))
+    set_default_codec(TextCodec('none'))
+    try:
+        with app.app_context():
+            start = time.perf_counter()
+            counts = seed_data.seed(
+                db, users=args.users, courses=args.courses,
+                modules=args.modules, lessons=args.lessons, seed=args.seed,
+                password_rounds=4)
+            print(f"seeded {counts['lessons']} lessons in "
+                  f"{time.perf_counter() - start:.0f} s")
+            print(f"{'':<8}{'build s':>9}{'added MB':>10}"
+                  + ''.join(f'{mix + " p50":>12}{"p95 ms":>8}{"results":>9}'
+                            for mix in queries))
+            for name in args.backends.split(','):
+                if name == 'like':
+                    search, build, added = like_search, 0.0, 0.0
+                    index = None
+                else:
+                    index = SearchIndex(name)
+                    before = os.path.getsize(DATABASE) / 2 ** 20, peak_mb()
+                    start = time.perf_counter()
+                    index.rebuild()
+                    build = time.perf_counter() - start
+                    added = (os.path.getsize(DATABASE) / 2 ** 20 - before[0]
+                             if name == 'fts5' else peak_mb() - before[1])
+                    search = index.search
+                row = f'{name:<8}{build:>9.1f}{added:>10.0f}'
+                for mix in queries.values():
+                    search(*mix[0])  # Warm up
+                    latencies, found = [], 0
+                    for user_id, query in mix:
+                        start = time.perf_counter()
+                        found += len(search(user_id, query))
+                        latencies.append(
+                            (time.perf_counter() - start) * 1000)
+                        db.session.rollback()  # End the read, as a request
+                    p95 = statistics.quantiles(latencies, n=20)[-1]
+                    row += (f'{statistics.median(latencies):>12.2f}'
+                            f'{p95:>8.2f}{found / len(mix):>9.1f}')
+                if index is not None:
+                    index.close()
+                print(row)
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+'''
+Benchmark: cold start of the app, as each gunicorn worker and test run pays.
+
+Every run is a fresh interpreter that imports the app and serves its first
+request, so nothing is cached between runs. The import is timed with
+``python -X importtime`` as well, to show which imports the time goes to;
+modules that are meant to load only on first use (openai, twilio, alembic,
+requests) are listed if the import pulled them in anyway.
+
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --max-import-ms 400  # Fail if slower
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ('openai', 'twilio', 'alembic', 'flask_migrate', 'requests')
+
+RUN = f'''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.app.test_client().get('/')
+served = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - start) * 1000,
+    'first_request_ms': (served - imported) * 1000,
+    'eager': [name for name in {LAZY_MODULES!r} if name in sys.modules],
+}}))
+'''
+
+
+def environment(database):
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + database,
+               COURSE_JOB_WORKERS='0', LOG_LEVEL='WARNING')
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [ROOT, env.get('PYTHONPATH')]))
+    return env
+
+
+def run(env, *args):
+    return subprocess.run([sys.executable, *args], env=env, cwd=ROOT,
+                          capture_output=True, text=True, check=True)
+
+
+def import_breakdown(env, top):
+    """The app's direct imports that took longest, cumulative ms."""
+    stderr = run(env, '-X', 'importtime', '-c', 'import app').stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            rows.append((int(cumulative) / 1000, name.strip()))
+        elif depth == 0:
+            # Children are listed before their parent; skip site's imports
+            if name.strip() == 'app':
+                break
+            rows = []
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=12,
+                        help='slowest imports to list')
+    parser.add_argument('--max-import-ms', type=float,
+                        help='exit 1 if the median import is slower')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = environment(os.path.join(workdir, 'startup.db'))
+        run(env, '-c', 'from app import app, db\n'
+                       'with app.app_context(): db.create_all()')
+        results = [json.loads(run(env, '-c', RUN).stdout.splitlines()[-1])
+                   for _ in range(args.runs)]
+        breakdown = import_breakdown(env, args.top)
+
+    import_ms = statistics.median(r['import_ms'] for r in results)
+    request_ms = statistics.median(r['first_request_ms'] for r in results)
+    print(f"import app          {import_ms:8.1f} ms (median of {args.runs})")
+    print(f"first request       {request_ms:8.1f} ms")
+    print(f"loaded eagerly      {', '.join(results[0]['eager']) or 'none'}")
+    print()
+    print(f"{'cumulative ms':>13}  import")
+    for ms, name in breakdown:
+        print(f"{ms:>13.1f}  {name}")
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        sys.exit(f'import took {import_ms:.0f} ms, over '
+                 f'--max-import-ms {args.max_import_ms:.0f}')
+
+
+if __name__ == '__main__':
+    main()
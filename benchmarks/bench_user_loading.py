@@ -0,0 +1,78 @@
+'''
+Benchmark: /check_match requests per second with and without the user cache.
+
+A few logged-in users poll /check_match in turn, as waiting interview users
+do. With the cache off, Flask-Login's user_loader runs a SELECT for every
+request; with it on, the user comes from memory. Point DATABASE_URL at a
+file or server database to include real round-trip latency.
+
+    python benchmarks/bench_user_loading.py --requests 5000
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('COURSE_JOB_WORKERS', '0')
+
+from app import app, bcrypt, db, User, user_cache  # noqa: E402
+from instrumentation import QueryCounter  # noqa: E402
+
+
+def create_users(count):
+    password_hash = bcrypt.generate_password_hash('password').decode('utf-8')
+    with app.app_context():
+        db.create_all()
+        for n in range(count):
+            db.session.add(User(username=f'bench{n}',
+                                email=f'bench{n}@example.com',
+                                password_hash=password_hash))
+        db.session.commit()
+
+
+def login_clients(count):
+    clients = []
+    for n in range(count):
+        client = app.test_client()
+        response = client.post('/login', data={
+            'email': f'bench{n}@example.com', 'password': 'password'})
+        assert response.status_code == 302, 'login failed'
+        clients.append(client)
+    return clients
+
+
+def run(clients, requests):
+    with app.app_context():
+        engine = db.engine
+    with QueryCounter(engine) as queries:
+        start = time.perf_counter()
+        for n in range(requests):
+            clients[n % len(clients)].get('/check_match')
+        elapsed = time.perf_counter() - start
+    return requests / elapsed, queries.count / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    create_users(args.users)
+    clients = login_clients(args.users)
+    size = user_cache.max_entries
+
+    print(f"{'user cache':<12}{'req/s':>10}{'queries/req':>13}")
+    for label, max_entries in (('off', 0), ('on', size)):
+        user_cache.clear()
+        user_cache.max_entries = max_entries
+        run(clients, len(clients))  # Warm up (and fill the cache)
+        rate, per_request = run(clients, args.requests)
+        print(f"{label:<12}{rate:>10.0f}{per_request:>13.2f}")
+
+
+if __name__ == '__main__':
+    main()
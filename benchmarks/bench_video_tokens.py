@@ -0,0 +1,77 @@
+'''
+Benchmark: Twilio Video tokens per second, signed every time vs cached.
+
+"mint" signs a new AccessToken per call, as /video_call and /token used to;
+"cached" asks VideoTokens for tokens of --users identities in one room,
+which signs each once and then serves it from memory. The /token rows time
+the route itself through the test client with the cache off and on.
+
+    python benchmarks/bench_video_tokens.py --calls 20000
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('COURSE_JOB_WORKERS', '0')
+os.environ.setdefault('TWILIO_ACCOUNT_SID', 'AC' + '0' * 32)
+os.environ.setdefault('TWILIO_API_KEY_SID', 'SK' + '0' * 32)
+os.environ.setdefault('TWILIO_API_KEY_SECRET', 'bench-secret-' + '0' * 19)
+
+from app import app, bcrypt, db, User, video_tokens  # noqa: E402
+
+
+def rate(func, calls):
+    func(0)  # Warm up (imports twilio)
+    start = time.perf_counter()
+    for n in range(calls):
+        func(n)
+    return calls / (time.perf_counter() - start)
+
+
+def route_client():
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        password_hash = bcrypt.generate_password_hash('password')
+        db.session.add(User(username='bench', email='bench@example.com',
+                            password_hash=password_hash.decode('utf-8')))
+        db.session.commit()
+    client = app.test_client()
+    response = client.post('/login', data={'email': 'bench@example.com',
+                                           'password': 'password'})
+    assert response.status_code == 302, 'login failed'
+    with client.session_transaction() as session:
+        session['room_name'] = 'bench-room'
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=100,
+                        help='distinct identities asking for tokens')
+    args = parser.parse_args()
+
+    size = video_tokens.max_entries
+    print(f"{'':<16}{'tokens/s':>12}")
+    minted = rate(lambda n: video_tokens.mint(f'u{n}', 'room'), args.calls)
+    print(f"{'mint':<16}{minted:>12.0f}")
+    video_tokens.clear()
+    cached = rate(lambda n: video_tokens.get(f'u{n % args.users}', 'room'),
+                  args.calls)
+    print(f"{'cached':<16}{cached:>12.0f}")
+
+    client = route_client()
+    for label, max_entries in (('/token, off', 0), ('/token, on', size)):
+        video_tokens.clear()
+        video_tokens.max_entries = max_entries
+        requests = max(args.calls // 10, 1)
+        print(f"{label:<16}"
+              f"{rate(lambda n: client.get('/token'), requests):>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+'''
+Load test of the main routes, with per-route latency percentiles as JSON.
+
+Virtual users log in as seeded users and then, until --duration runs out,
+request a weighted random mix of /courses, /courses/<id>,
+/completed_courses, /join_queue, /check_match and POST /chat. The JSON on
+stdout gives each route's request count, errors, throughput and p50, p95,
+p99 and max latency in milliseconds; a table goes to stderr.
+
+By default the app runs in this process against a fresh SQLite file seeded
+with seed_data.py, with the fake tutor backend as the LLM stub. Use
+--base-url to load a running server instead; seed its database first with
+seed_data.py and the same --users/--courses, and start it with
+CHAT_BACKEND=fake.
+
+    python benchmarks/load_test.py --users 1000 --concurrency 16 --duration 20
+    python benchmarks/load_test.py --base-url http://127.0.0.1:8000 \\
+        --users 100000 --concurrency 64 --duration 60 --output load.json
+'''
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import seed_data  # noqa: E402
+from instrumentation import LatencyStats  # noqa: E402
+
+ROUTES = {
+    'courses': ('GET', '/courses'),
+    'course': ('GET', '/courses/{course_id}'),
+    'completed_courses': ('GET', '/completed_courses'),
+    'join_queue': ('GET', '/join_queue'),
+    'check_match': ('GET', '/check_match'),
+    'chat': ('POST', '/chat'),
+}
+DEFAULT_MIX = 'courses=3,course=3,completed_courses=2,join_queue=1,' \
+              'check_match=3,chat=1'
+CSRF_RE = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+QUESTIONS = ('What is a hash map?', 'Explain binary search.',
+             'When should I use a heap?', 'What is dynamic programming?')
+
+
+class LocalClient:
+    """Requests to the app in this process through Flask's test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, **kwargs):
+        response = self.client.open(path, method=method, **kwargs)
+        response.get_data()  # Consume streamed bodies as a browser would
+        return response.status_code, response.get_data(as_text=True)
+
+
+class HTTPClient:
+    """Requests to a running server over keep-alive HTTP."""
+
+    def __init__(self, base_url, timeout=30):
+        import requests
+        self.session = requests.Session()
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, **kwargs):
+        response = self.session.request(
+            method, self.base_url + path, allow_redirects=False,
+            timeout=self.timeout, **kwargs)
+        return response.status_code, response.text
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ROUTES:
+            raise SystemExit(f'unknown route {name!r} in --mix')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def login(client, n):
+    # Works with CSRF on or off: the token field is only there when it is on
+    _, page = client.request('GET', '/login')
+    data = {'email': seed_data.email(n), 'password': seed_data.PASSWORD}
+    match = CSRF_RE.search(page)
+    if match:
+        data['csrf_token'] = match.group(1)
+    status, _ = client.request('POST', '/login', data=data)
+    if status != 302:
+        raise RuntimeError(f'login as {seed_data.email(n)} failed '
+                           f'({status}); is the database seeded?')
+
+
+def virtual_user(vu, args, make_client, mix, start, stop, results):
+    rng = random.Random(args.seed * 1000003 + vu)
+    n = vu % args.users
+    client = make_client()
+    login(client, n)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    total_courses = args.users * args.courses
+    start.wait()
+    while not stop.is_set():
+        name = rng.choices(names, weights)[0]
+        method, path = ROUTES[name]
+        kwargs = {}
+        if name == 'course':
+            path = path.format(course_id=rng.randint(1, total_courses))
+        elif name == 'chat':
+            kwargs['json'] = {'message': rng.choice(QUESTIONS)}
+        began = time.perf_counter()
+        try:
+            status, _ = client.request(method, path, **kwargs)
+        except Exception:
+            status = None
+        results.record(name, time.perf_counter() - began, status)
+
+
+class Results:
+    def __init__(self):
+        self.latency = LatencyStats(size=None)  # Keep every sample
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, status):
+        self.latency.record(**{name: seconds})
+        if status is None or status >= 400:
+            with self._lock:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def report(self, elapsed):
+        routes = {}
+        for name, summary in sorted(self.latency.summary().items()):
+            routes[name] = {
+                'requests': summary['count'],
+                'errors': self.errors.get(name, 0),
+                'rps': round(summary['count'] / elapsed, 1),
+                **{key: round(summary[key] * 1000, 2)
+                   for key in ('p50', 'p95', 'p99', 'max')},
+            }
+        total = sum(route['requests'] for route in routes.values())
+        return {'elapsed_seconds': round(elapsed, 2), 'requests': total,
+                'rps': round(total / elapsed, 1),
+                'errors': sum(self.errors.values()), 'routes': routes}
+
+
+def local_app(args):
+    """Import the app against a fresh, seeded SQLite file."""
+    workdir = tempfile.mkdtemp(prefix='load-test-')
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' +
+                          os.path.join(workdir, 'load.db'))
+    os.environ.setdefault('COURSE_JOB_WORKERS', '0')
+    os.environ.setdefault('CHAT_BACKEND', 'fake')
+    os.environ.setdefault('CHAT_FAKE_DELAY', '0.001')
+    from app import app, db
+    if not args.no_seed:
+        with app.app_context():
+            seed_data.seed(db, users=args.users, courses=args.courses,
+                           modules=args.modules, lessons=args.lessons,
+                           seed=args.seed)
+    return app
+
+
+def print_table(report, stream):
+    print(f"{'route':<20}{'requests':>9}{'errors':>8}{'req/s':>9}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}",
+          file=stream)
+    for name, route in report['routes'].items():
+        print(f"{name:<20}{route['requests']:>9}{route['errors']:>8}"
+              f"{route['rps']:>9.1f}{route['p50']:>9.1f}{route['p95']:>9.1f}"
+              f"{route['p99']:>9.1f}{route['max']:>9.1f}", file=stream)
+    print(f"{'total':<20}{report['requests']:>9}{report['errors']:>8}"
+          f"{report['rps']:>9.1f}", file=stream)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    seed_data.add_arguments(parser)
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='virtual users making requests at once')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='seconds of load after everyone logged in')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help='route=weight pairs (default %(default)s)')
+    parser.add_argument('--base-url',
+                        help='load this server instead of an in-process app')
+    parser.add_argument('--no-seed', action='store_true',
+                        help='use the database as it is')
+    parser.add_argument('--output', help='also write the JSON report here')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    if args.base_url:
+        def make_client():
+            return HTTPClient(args.base_url)
+    else:
+        app = local_app(args)
+
+        def make_client():
+            return LocalClient(app)
+
+    results = Results()
+    start = threading.Barrier(args.concurrency + 1)
+    stop = threading.Event()
+    threads = [threading.Thread(target=virtual_user, daemon=True,
+                                args=(vu, args, make_client, mix, start,
+                                      stop, results))
+               for vu in range(args.concurrency)]
+    # The app prints as users join the queue; keep stdout for the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        start.wait()
+        began = time.perf_counter()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+    report = results.report(elapsed)
+    report['config'] = {key: value for key, value in vars(args).items()
+                        if key != 'output'}
+    print_table(report, sys.stderr)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+'''
+Reproducible synthetic data for load tests.
+
+Inserts users, each with ``--courses`` courses of ``--modules`` modules of
+``--lessons`` lessons, plus one quiz per course, into DATABASE_URL. Rows go
+in with bulk executemany inserts in batches of ``--batch``, so millions of
+lessons take minutes, not hours. The same ``--seed`` always produces the
+same data; on an empty database user n (from 0) is ``load{n}@example.com``
+with password ``password`` and owns courses n*courses+1 to (n+1)*courses.
+
+    DATABASE_URL=sqlite:////tmp/load.db python benchmarks/seed_data.py \\
+        --users 100000 --courses 5 --modules 4 --lessons 5
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = 'password'
+WORDS = ('array', 'graph', 'tree', 'heap', 'hash', 'queue', 'stack', 'sort',
+         'search', 'string', 'dynamic', 'greedy', 'recursion', 'pointer',
+         'matrix', 'interval', 'window', 'trie', 'union', 'bit', 'system',
+         'design', 'cache', 'shard', 'index', 'thread', 'lock', 'network',
+         'python', 'java', 'complexity', 'memory', 'binary', 'linked')
+PARAGRAPHS = 256  # Distinct lesson bodies to draw from
+
+
+def email(n):
+    return f'load{n}@example.com'
+
+
+def words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def seed(db, users=1000, courses=5, modules=4, lessons=5, seed=0,
+         completed=0.3, lesson_chars=600, batch=10000, password_rounds=None):
+    """Insert the dataset through ``db`` (inside an app context).
+
+    Returns the number of rows inserted per table. Ids are assigned here,
+    continuing from the largest in each table, so no insert needs to read
+    back generated keys. ``password_rounds`` below the app's bcrypt cost
+    makes logging in many virtual users quick.
+    """
+    from app import bcrypt
+    from models import User, Course, Module, Lesson, Quiz
+
+    db.create_all()  # A fresh database has no tables until it is migrated
+    rng = random.Random(seed)
+    # One bcrypt hash for everyone: hashing 100k passwords would take hours
+    password_hash = bcrypt.generate_password_hash(
+        PASSWORD, password_rounds).decode('utf-8')
+    bodies = [words(rng, lesson_chars // 7) for _ in range(PARAGRAPHS)]
+    epoch = datetime(2024, 1, 1)
+
+    models = (User, Course, Module, Lesson, Quiz)
+    next_id = {}
+    for model in models:
+        largest = db.session.execute(db.select(db.func.max(model.id))).scalar()
+        next_id[model] = (largest or 0) + 1
+    buffers = {model: [] for model in models}
+    counts = {model.__tablename__: 0 for model in models}
+
+    def add(model, row):
+        row['id'] = next_id[model]
+        next_id[model] += 1
+        buffers[model].append(row)
+        if len(buffers[model]) >= batch:
+            flush()
+        return row['id']
+
+    def flush():
+        # Parents first, so foreign keys hold on databases that check them
+        for model in models:
+            if buffers[model]:
+                db.session.execute(model.__table__.insert(), buffers[model])
+                counts[model.__tablename__] += len(buffers[model])
+                buffers[model].clear()
+        db.session.commit()
+
+    for n in range(users):
+        user_id = add(User, {'username': f'load{n}', 'email': email(n),
+                             'password_hash': password_hash})
+        for c in range(courses):
+            topic = words(rng, 3)
+            created = epoch + timedelta(minutes=rng.randrange(525600))
+            done = rng.random() < completed
+            course_id = add(Course, {
+                'title': f'{topic.title()} {n}.{c}',
+                'description': f'Interview preparation: {topic} ({n}.{c})',
+                'created_at': created, 'enrolled': True, 'completed': done,
+                'completed_at': created + timedelta(days=7) if done else None,
+                'user_id': user_id})
+            add(Quiz, {'course_id': course_id, 'questions': json.dumps([
+                {'question': f'What is {rng.choice(WORDS)}?',
+                 'answer': words(rng, 8)} for _ in range(5)])})
+            for m in range(modules):
+                # Module titles and descriptions are unique across courses
+                module_id = add(Module, {
+                    'title': f'{words(rng, 2).title()} {course_id}.{m}',
+                    'description': f'{words(rng, 12)} ({course_id}.{m})',
+                    'created_at': created, 'course_id': course_id})
+                for x in range(lessons):
+                    add(Lesson, {
+                        'title': f'{words(rng, 3).title()} {m}.{x}',
+                        'content': rng.choice(bodies), 'quiz': None,
+                        'created_at': created, 'module_id': module_id,
+                        'is_completed': done, 'completion_date': None})
+    flush()
+    return counts
+
+
+def add_arguments(parser):
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--courses', type=int, default=5,
+                        help='courses per user')
+    parser.add_argument('--modules', type=int, default=4,
+                        help='modules per course')
+    parser.add_argument('--lessons', type=int, default=5,
+                        help='lessons per module')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument('--batch', type=int, default=10000)
+    args = parser.parse_args()
+
+    os.environ.setdefault('COURSE_JOB_WORKERS', '0')
+    from app import app, db
+
+    start = time.perf_counter()
+    with app.app_context():
+        counts = seed(db, users=args.users, courses=args.courses,
+                      modules=args.modules, lessons=args.lessons,
+                      seed=args.seed, batch=args.batch)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'rows': counts, 'seconds': round(elapsed, 2),
+                      'rows_per_second': round(sum(counts.values()) /
+                                               elapsed)}))
+
+
+if __name__ == '__main__':
+    main()
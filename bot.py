@@ -5,27 +5,88 @@ their personal finances.
 '''
 # Adding local imports
 # pip install python-dotenv flask openai
-import openai
-from dotenv import load_dotenv
-import os
+import time
+from conversations import build_messages
+from llm_cache import get_default_cache
+from llm_gateway import INTERACTIVE, get_default_gateway
 
-# Load environment variables
-load_dotenv()
-
-# Set API key for OpenAI client
-openai.api_key = os.getenv("OPENAI_API_KEY")
+MODEL = "gpt-3.5-turbo"
+MAX_TOKENS = 150
+TEMPERATURE = 0.5
+# Longest a chat question waits for the LLM gateway before giving up
+ADMISSION_TIMEOUT = 15
+SYSTEM_MESSAGES = [
+    {"role": "system", "content": "You are an AI tutor specializing in computer science. Your task is to provide detailed, clear, and accurate explanations to help students understand complex concepts and interview guidance. Your responses should be tailored to the user's current level of knowledge and aim to clarify difficult topics effectively."},
+    {"role": "system", "content": "You should also know the directions of your Website which is E-Learn. To find courses you navigate to the courses tab in the navbar and there you can create/delete/complete your courses. For mock interviews you can navigate to your mock interview tab where you can join a interview queue and practice with real life people! For a more in depth use of myself(AI Tutor) you can go visit the AI Tutor tab where I can help you with any of your computer science needs"},
+]
 
 # Function to get AI's response
 # Assumes user_message is a string input
-def get_user_response(user_message):
-    response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        max_tokens=150,
-        temperature=0.5,
-        messages=[
-            {"role": "system", "content": "You are an AI tutor specializing in computer science. Your task is to provide detailed, clear, and accurate explanations to help students understand complex concepts and interview guidance. Your responses should be tailored to the user's current level of knowledge and aim to clarify difficult topics effectively."},
-            {"role": "system", "content": "You should also know the directions of your Website which is E-Learn. To find courses you navigate to the courses tab in the navbar and there you can create/delete/complete your courses. For mock interviews you can navigate to your mock interview tab where you can join a interview queue and practice with real life people! For a more in depth use of myself(AI Tutor) you can go visit the AI Tutor tab where I can help you with any of your computer science needs"},
-            {"role": "user", "content": user_message}
-        ]
+# Identical questions are answered from the shared LLM cache
+# With a conversation (see conversations.py) its recent history is sent
+# along and the new exchange is recorded in it
+def get_user_response(user_message, conversation=None):
+    messages = build_messages(SYSTEM_MESSAGES, user_message, conversation)
+
+    def call():
+        response = get_default_gateway().call(
+            INTERACTIVE,
+            timeout=ADMISSION_TIMEOUT,
+            model=MODEL,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            messages=messages
+        )
+        return response.choices[0].message['content']
+
+    reply = get_default_cache().get_or_call(
+        call, MODEL, messages, MAX_TOKENS, TEMPERATURE)
+    if conversation is not None and reply:
+        conversation.add_exchange(user_message, reply)
+    return reply
+
+
+# Yields the completion for messages piece by piece as OpenAI streams it
+def openai_stream(messages):
+    chunks = get_default_gateway().stream(
+        INTERACTIVE,
+        timeout=ADMISSION_TIMEOUT,
+        model=MODEL,
+        max_tokens=MAX_TOKENS,
+        temperature=TEMPERATURE,
+        messages=messages
     )
-    return response.choices[0].message['content']
+    for chunk in chunks:
+        content = chunk.choices[0].delta.get('content')
+        if content:
+            yield content
+
+# Offline stand-in for openai_stream (CHAT_BACKEND=fake): a canned answer
+# sent a word at a time, so streaming can be tried without an API key
+def fake_stream(messages, delay=0.05):
+    question = messages[-1]['content']
+    reply = (f'You asked: "{question}". This is the offline tutor, which '
+             'streams a canned answer one word at a time.')
+    words = reply.split(' ')
+    for n, word in enumerate(words):
+        time.sleep(delay)
+        yield word if n == len(words) - 1 else word + ' '
+
+# Streaming version of get_user_response: yields the answer in pieces.
+# Answers from OpenAI are cached once complete, and a cached answer is
+# yielded in one piece; other backends (such as fake_stream) bypass the cache
+def stream_user_response(user_message, stream=None, conversation=None):
+    messages = build_messages(SYSTEM_MESSAGES, user_message, conversation)
+    if stream is not None:
+        pieces = stream(messages)
+    else:
+        pieces = get_default_cache().get_or_stream(
+            lambda: openai_stream(messages),
+            MODEL, messages, MAX_TOKENS, TEMPERATURE)
+    parts = []
+    for part in pieces:
+        parts.append(part)
+        yield part
+    # Only a completed answer becomes part of the conversation
+    if conversation is not None and parts:
+        conversation.add_exchange(user_message, ''.join(parts))
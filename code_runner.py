@@ -0,0 +1,291 @@
+'''
+Code execution for the interview editor's /compile route.
+
+Submissions are forwarded to the JDoodle execute API through one pooled
+``requests.Session``, so connections are kept alive between runs and every
+call has a connect and a read timeout. requests is imported and the session
+built on the first run, so processes that never run code skip both. In
+front of the upstream call sit:
+
+* a bounded, expiring cache of results keyed on script, language, stdin and
+  version, since candidates tend to re-run unchanged code;
+* in-flight de-duplication, so concurrent identical submissions share one
+  upstream call;
+* a per-user limit on runs in flight, so one user cannot take every worker;
+* a cap on the size of stdin.
+
+COMPILE_BACKEND=local swaps JDoodle for the sandboxed subprocesses in
+sandbox.py, behind the same cache and limits. Those run on this host, so
+the backend is refused unless SANDBOX_ALLOW_UNSAFE is also set.
+'''
+import hashlib
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from metrics import outbound
+
+JDOODLE_URL = 'https://api.jdoodle.com/v1/execute'
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 15
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_CACHE_TTL = 3600
+DEFAULT_MAX_PER_USER = 2
+DEFAULT_MAX_STDIN_BYTES = 64 * 1024
+
+
+class RunError(Exception):
+    """A run that could not be completed; ``status`` is the HTTP status the
+    /compile route should answer with."""
+
+    status = 502
+
+
+class UpstreamTimeout(RunError):
+    status = 504
+
+
+class TooManyRuns(RunError):
+    status = 429
+
+
+class InputTooLarge(RunError):
+    status = 413
+
+
+def run_key(script, language, stdin, version_index):
+    payload = json.dumps([script, language, stdin, str(version_index)],
+                         separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class _Flight:
+    """One upstream call that concurrent identical runs wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class CodeRunner(ABC):
+    """Result cache, de-duplication and per-user limits around ``_execute``.
+
+    Subclasses implement ``_execute(script, language, stdin, version_index)``
+    returning a JSON-able dict with at least ``output`` (and, if the run
+    failed, ``statusCode`` other than 200). All methods are thread safe.
+    """
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE,
+                 cache_ttl=DEFAULT_CACHE_TTL,
+                 max_per_user=DEFAULT_MAX_PER_USER,
+                 max_stdin_bytes=DEFAULT_MAX_STDIN_BYTES):
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.max_per_user = max_per_user
+        self.max_stdin_bytes = max_stdin_bytes
+        self._results = OrderedDict()  # key -> (stored_at, result)
+        self._flights = {}
+        self._running = {}  # user -> runs in flight
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    @abstractmethod
+    def _execute(self, script, language, stdin, version_index):
+        """Run ``script`` once, uncached; see the class docstring."""
+
+    def _cached(self, key, now):
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        if now - stored_at > self.cache_ttl:
+            del self._results[key]
+            return None
+        self._results.move_to_end(key)
+        return result
+
+    def _store(self, key, result, now):
+        # Failed runs (including JDoodle's own errors) are not worth keeping
+        if result.get('statusCode', 200) != 200 or 'error' in result:
+            return
+        self._results[key] = (now, result)
+        self._results.move_to_end(key)
+        while len(self._results) > self.cache_size:
+            self._results.popitem(last=False)
+
+    def run(self, script, language, stdin='', version_index='0', user=None):
+        """Run ``script`` and return the result dict.
+
+        Raises InputTooLarge if ``stdin`` is over ``max_stdin_bytes``,
+        TooManyRuns if ``user`` already has ``max_per_user`` runs in flight,
+        and RunError (or UpstreamTimeout) if the run failed.
+        """
+        if len(stdin.encode('utf-8')) > self.max_stdin_bytes:
+            raise InputTooLarge(f'stdin is limited to '
+                                f'{self.max_stdin_bytes} bytes')
+        key = run_key(script, language, stdin, version_index)
+        with self._lock:
+            result = self._cached(key, time.time())
+            if result is not None:
+                self.hits += 1
+                return result
+            if self._running.get(user, 0) >= self.max_per_user:
+                raise TooManyRuns('Too many runs in progress; '
+                                  'wait for one to finish')
+            self._running[user] = self._running.get(user, 0) + 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.shared += 1
+
+        try:
+            if leader:
+                self._fly(key, flight, script, language, stdin,
+                          version_index)
+            else:
+                flight.done.wait()
+        finally:
+            with self._lock:
+                self._running[user] -= 1
+                if not self._running[user]:
+                    del self._running[user]
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def _fly(self, key, flight, script, language, stdin, version_index):
+        try:
+            flight.result = self._execute(script, language, stdin,
+                                          version_index)
+        except RunError as error:
+            flight.error = error
+        except Exception as error:
+            flight.error = RunError(f'Code execution failed: {error}')
+        with self._lock:
+            if flight.result is not None:
+                self._store(key, flight.result, time.time())
+            del self._flights[key]
+        flight.done.set()
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'shared': self.shared, 'cached': len(self._results),
+                    'in_flight': len(self._flights)}
+
+
+class JDoodleRunner(CodeRunner):
+    """Runs code on the JDoodle execute API over a pooled session."""
+
+    def __init__(self, client_id, client_secret, url=JDOODLE_URL,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT,
+                 pool_size=DEFAULT_POOL_SIZE, **kwargs):
+        super().__init__(**kwargs)
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1,
+                                      pool_maxsize=self.pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def _execute(self, script, language, stdin, version_index):
+        import requests
+        payload = {
+            'script': script,
+            'language': language,
+            'stdin': stdin,
+            'versionIndex': str(version_index),
+            'clientId': self.client_id,
+            'clientSecret': self.client_secret,
+        }
+        try:
+            with outbound('jdoodle'):
+                response = self.session.post(self.url, json=payload,
+                                             timeout=self.timeout)
+        except requests.Timeout:
+            raise UpstreamTimeout('The code runner did not respond in time')
+        except requests.RequestException:
+            raise RunError('Could not reach the code runner')
+        try:
+            result = response.json()
+        except ValueError:
+            result = None
+        if not isinstance(result, dict):
+            raise RunError('The code runner sent an invalid response')
+        if response.status_code != 200:
+            result.setdefault('statusCode', response.status_code)
+        return result
+
+
+def create_runner(config):
+    """Build the backend named by COMPILE_BACKEND ('jdoodle'/'local')."""
+    options = {
+        'cache_size': config.get('COMPILE_CACHE_SIZE', DEFAULT_CACHE_SIZE),
+        'cache_ttl': config.get('COMPILE_CACHE_TTL', DEFAULT_CACHE_TTL),
+        'max_per_user': config.get('COMPILE_MAX_PER_USER',
+                                   DEFAULT_MAX_PER_USER),
+        'max_stdin_bytes': config.get('COMPILE_MAX_STDIN_BYTES',
+                                      DEFAULT_MAX_STDIN_BYTES),
+    }
+    backend = config.get('COMPILE_BACKEND', 'jdoodle')
+    if backend == 'local':
+        if not config.get('SANDBOX_ALLOW_UNSAFE'):
+            raise ValueError(
+                'COMPILE_BACKEND=local runs submitted code on this host '
+                'without isolation; set SANDBOX_ALLOW_UNSAFE=1 to allow it')
+        from sandbox import LocalRunner
+        sandbox_options = {
+            'workers': 'SANDBOX_WORKERS',
+            'cpu_seconds': 'SANDBOX_CPU_SECONDS',
+            'wall_seconds': 'SANDBOX_WALL_SECONDS',
+            'memory_mb': 'SANDBOX_MEMORY_MB',
+            'output_bytes': 'SANDBOX_OUTPUT_BYTES',
+            'processes': 'SANDBOX_PROCESSES',
+            'cache_dir': 'SANDBOX_CACHE_DIR',
+        }
+        for option, key in sandbox_options.items():
+            if config.get(key) is not None:
+                options[option] = config[key]
+        return LocalRunner(**options)
+    if backend == 'jdoodle':
+        return JDoodleRunner(
+            config.get('JDOODLE_CLIENT_ID'),
+            config.get('JDOODLE_CLIENT_SECRET'),
+            url=config.get('JDOODLE_URL', JDOODLE_URL),
+            connect_timeout=config.get('JDOODLE_CONNECT_TIMEOUT',
+                                       DEFAULT_CONNECT_TIMEOUT),
+            read_timeout=config.get('JDOODLE_READ_TIMEOUT',
+                                    DEFAULT_READ_TIMEOUT),
+            pool_size=config.get('JDOODLE_POOL_SIZE', DEFAULT_POOL_SIZE),
+            **options)
+    raise ValueError(f"Unknown COMPILE_BACKEND {backend!r}")
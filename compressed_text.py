@@ -0,0 +1,136 @@
+'''
+Compressed storage for the large text columns: lesson content, lesson and
+course quizzes.
+
+A lesson body is a few thousand characters of LLM output and quizzes are
+JSON, and both were stored as plain Text. CompressedText keeps them in a
+binary column instead and compresses each value on its way into the
+database, and decompresses it on its way out, so the models and templates
+still see ``str``. Values shorter than ``min_size`` bytes are stored as
+plain UTF-8, since compressing them saves next to nothing.
+
+A compressed value starts with a NUL byte and a letter naming the
+algorithm. Plain text never starts with NUL, so rows written before the
+columns were compressed (plain UTF-8, or ``str`` from SQLite) and rows
+written with compression off read back unchanged, and changing
+TEXT_COMPRESSION never needs a data migration. ``zstd`` needs
+`pip install zstandard`; ``zlib`` is in the standard library.
+'''
+import threading
+import zlib
+
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+ALGORITHMS = ('none', 'zlib', 'zstd')
+DEFAULT_ALGORITHM = 'zlib'
+DEFAULT_MIN_SIZE = 256
+MARKER = b'\x00'
+RAW, ZLIB, ZSTD = b'r', b'z', b's'
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError('zstd compression needs the zstandard package '
+                           '(pip install zstandard)') from None
+    return zstandard
+
+
+class TextCodec:
+    """Turns text into the stored bytes and back.
+
+    ``algorithm`` only affects writes: every codec reads all formats.
+    """
+
+    def __init__(self, algorithm=DEFAULT_ALGORITHM,
+                 min_size=DEFAULT_MIN_SIZE, level=None):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f'Unknown compression {algorithm!r}; '
+                             f'expected one of {", ".join(ALGORITHMS)}')
+        self.algorithm = algorithm
+        self.min_size = min_size
+        self.level = level
+        self._local = threading.local()  # zstd contexts are not thread-safe
+        if algorithm == 'zstd':
+            _zstd()  # Fail at startup, not on the first write
+
+    def encode(self, text):
+        data = text.encode('utf-8')
+        if self.algorithm != 'none' and len(data) >= self.min_size:
+            if self.algorithm == 'zlib':
+                packed = zlib.compress(
+                    data, -1 if self.level is None else self.level)
+                tag = ZLIB
+            else:
+                packed = self._compressor().compress(data)
+                tag = ZSTD
+            if len(packed) + 2 < len(data):
+                return MARKER + tag + packed
+        if data.startswith(MARKER):
+            return MARKER + RAW + data
+        return data
+
+    def decode(self, value):
+        if isinstance(value, str):
+            return value
+        value = bytes(value)
+        if not value.startswith(MARKER):
+            return value.decode('utf-8')
+        tag, packed = value[1:2], value[2:]
+        if tag == ZLIB:
+            data = zlib.decompress(packed)
+        elif tag == ZSTD:
+            data = self._decompressor().decompress(packed)
+        elif tag == RAW:
+            data = packed
+        else:
+            raise ValueError(f'Unknown text encoding {tag!r}')
+        return data.decode('utf-8')
+
+    def _compressor(self):
+        compressor = getattr(self._local, 'compressor', None)
+        if compressor is None:
+            compressor = self._local.compressor = _zstd().ZstdCompressor(
+                level=3 if self.level is None else self.level)
+        return compressor
+
+    def _decompressor(self):
+        decompressor = getattr(self._local, 'decompressor', None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = \
+                _zstd().ZstdDecompressor()
+        return decompressor
+
+
+class CompressedText(TypeDecorator):
+    """A Text column stored through the default TextCodec."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else get_default_codec().encode(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else get_default_codec().decode(value)
+
+
+_default_codec = TextCodec()
+
+
+def get_default_codec():
+    return _default_codec
+
+
+def set_default_codec(codec):
+    """Use ``codec`` for CompressedText columns from now on."""
+    global _default_codec
+    _default_codec = codec
+
+
+def create_text_codec(config):
+    """Build the codec from the TEXT_COMPRESSION* config."""
+    return TextCodec(
+        config.get('TEXT_COMPRESSION', DEFAULT_ALGORITHM),
+        min_size=config.get('TEXT_COMPRESSION_MIN_BYTES', DEFAULT_MIN_SIZE))
@@ -0,0 +1,143 @@
+'''
+Server-side memory for AI tutor conversations.
+
+Each chat session keeps its recent turns, so the tutor can answer follow-up
+questions, but the history it sends is bounded by a token budget: once the
+turns exceed ``history_tokens`` the oldest are folded into a short summary
+of what was asked earlier, which is itself capped at ``summary_tokens``.
+The static system prompts are never stored in a conversation, only added
+once when the request is built, so a request costs at most the system
+prompts plus both budgets plus the new message however long the chat runs.
+
+Conversations live in this process. The store keeps at most
+``max_sessions`` of them, dropping the least recently used, and forgets any
+left idle for ``idle_ttl`` seconds.
+'''
+import threading
+import time
+from collections import OrderedDict, deque
+
+DEFAULT_HISTORY_TOKENS = 1000
+DEFAULT_SUMMARY_TOKENS = 200
+DEFAULT_MAX_SESSIONS = 1000
+DEFAULT_IDLE_TTL = 30 * 60
+
+# Characters in an evicted question that make it into the summary
+SUMMARY_SNIPPET = 120
+
+
+def estimate_tokens(text):
+    """Rough token count: about four characters per token for English,
+    plus the few tokens of framing each chat message costs."""
+    return len(text) // 4 + 4
+
+
+class Conversation:
+    """Recent turns of one chat plus a summary of the evicted ones."""
+
+    def __init__(self, history_tokens=DEFAULT_HISTORY_TOKENS,
+                 summary_tokens=DEFAULT_SUMMARY_TOKENS):
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.turns = deque()  # (role, content, tokens)
+        self.tokens = 0
+        self.topics = deque()  # Snippets of evicted questions, oldest first
+        self.last_used = time.time()
+        self._lock = threading.Lock()
+
+    def add_exchange(self, question, answer):
+        """Record a question and its answer, then trim to the budget."""
+        with self._lock:
+            for role, content in (('user', question), ('assistant', answer)):
+                tokens = estimate_tokens(content)
+                self.turns.append((role, content, tokens))
+                self.tokens += tokens
+            while self.tokens > self.history_tokens and self.turns:
+                role, content, tokens = self.turns.popleft()
+                self.tokens -= tokens
+                if role == 'user':
+                    self._remember_topic(content)
+            self.last_used = time.time()
+
+    def _remember_topic(self, question):
+        snippet = ' '.join(question.split())
+        if len(snippet) > SUMMARY_SNIPPET:
+            snippet = snippet[:SUMMARY_SNIPPET].rsplit(' ', 1)[0] + '...'
+        self.topics.append(snippet)
+        while (len(self.topics) > 1 and
+               estimate_tokens('; '.join(self.topics)) > self.summary_tokens):
+            self.topics.popleft()
+
+    def summary(self):
+        with self._lock:
+            if not self.topics:
+                return None
+            return ('Earlier in this conversation the student asked about: ' +
+                    '; '.join(self.topics))
+
+    def messages(self):
+        """The history as chat messages: the summary, then recent turns."""
+        summary = self.summary()
+        with self._lock:
+            history = [{'role': role, 'content': content}
+                       for role, content, _ in self.turns]
+        if summary:
+            history.insert(0, {'role': 'system', 'content': summary})
+        return history
+
+
+def build_messages(system_messages, user_message, conversation=None):
+    """The request for ``user_message``: system prompts, history, question."""
+    history = conversation.messages() if conversation is not None else []
+    return (list(system_messages) + history +
+            [{'role': 'user', 'content': user_message}])
+
+
+class ConversationStore:
+    """Bounded, expiring map of session key to Conversation."""
+
+    def __init__(self, max_sessions=DEFAULT_MAX_SESSIONS,
+                 idle_ttl=DEFAULT_IDLE_TTL,
+                 history_tokens=DEFAULT_HISTORY_TOKENS,
+                 summary_tokens=DEFAULT_SUMMARY_TOKENS):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the conversation for ``key``, starting one if needed."""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            conversation = self._conversations.get(key)
+            if conversation is None:
+                conversation = Conversation(self.history_tokens,
+                                            self.summary_tokens)
+                self._conversations[key] = conversation
+                while len(self._conversations) > self.max_sessions:
+                    self._conversations.popitem(last=False)
+                    self.evictions += 1
+            self._conversations.move_to_end(key)
+            conversation.last_used = now
+            return conversation
+
+    def _expire(self, now):
+        # Least recently used first, so stop at the first live one
+        while self._conversations:
+            key, conversation = next(iter(self._conversations.items()))
+            if now - conversation.last_used <= self.idle_ttl:
+                return
+            del self._conversations[key]
+            self.evictions += 1
+
+    def discard(self, key):
+        with self._lock:
+            self._conversations.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._conversations)
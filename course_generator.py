@@ -0,0 +1,249 @@
+'''
+Course generation pipeline.
+
+Streams a module outline from OpenAI, parsing it as it arrives, and runs
+the per-lesson "review and enhance" calls concurrently on a bounded thread
+pool. Each module's lessons start as soon as its block of the outline is
+complete, so a course costs little more than the outline call plus the
+slowest lesson instead of the sum of every call.
+'''
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from llm_cache import get_default_cache
+from llm_gateway import BATCH, get_default_gateway
+from outline_parser import OutlineParser, parse_outline
+
+logger = logging.getLogger(__name__)
+
+MODEL = "gpt-3.5-turbo"
+OUTLINE_MAX_TOKENS = 1500
+LESSON_MAX_TOKENS = 500
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_TIMEOUT = 60
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 1.0
+
+
+# Errors worth another attempt; anything else (bad key, bad request) is not.
+# Only evaluated in except clauses, so openai is imported once a call has
+# failed rather than with this module
+def retryable_errors():
+    import openai
+    return (
+        openai.error.Timeout,
+        openai.error.APIError,
+        openai.error.APIConnectionError,
+        openai.error.RateLimitError,
+        openai.error.ServiceUnavailableError,
+    )
+
+
+LEVEL_PROMPTS = {
+    'beginner': (
+        "foundational",
+        "The user is a beginner, so focus on introductory and basic "
+        "concepts."),
+    'intermediate': (
+        "advanced",
+        "The user is at an intermediate level, so avoid basic topics and "
+        "focus on advanced concepts."),
+}
+EXPERT_PROMPT = (
+    "expert-level",
+    "The user is advanced, so focus on highly specialized and complex "
+    "concepts.")
+
+
+def build_outline_prompt(course_title, course_description, level):
+    kind, guidance = LEVEL_PROMPTS.get(level.lower(), EXPERT_PROMPT)
+    return (f"Generate 5 {kind} modules for a course on {course_title} "
+            f"with the following description: {course_description}. "
+            f"{guidance} Format each module as follows:\n"
+            f"Module Title: <title>\n"
+            f"Module Description: <description>\n"
+            f"Lessons:\n"
+            f"1. <Lesson Title>: <Lesson Description>\n"
+            f"2. <Lesson Title>: <Lesson Description>\n"
+            f"3. ...")
+
+
+def build_lesson_prompt(lesson, course_title, level):
+    return (f"Review and enhance the following lesson for a {level} level "
+            f"course on {course_title}: {lesson['content']}")
+
+
+def parse_modules(outline):
+    """Parse a complete outline; see outline_parser for the accepted forms."""
+    return parse_outline(outline)
+
+
+def complete(prompt, max_tokens, create=None, timeout=DEFAULT_TIMEOUT,
+             retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, cache=None,
+             gateway=None):
+    """Run one chat completion, retrying transient failures.
+
+    Answers from ``cache`` (the shared LLM cache by default) when the same
+    prompt has been completed before. Otherwise calls ``create`` (OpenAI
+    by default) through ``gateway`` at BATCH priority, sleeps ``backoff *
+    2 ** attempt`` seconds between attempts and re-raises the last error
+    once ``retries`` extra attempts have been used up.
+    """
+    cache = cache or get_default_cache()
+    gateway = gateway or get_default_gateway()
+    messages = [{"role": "user", "content": prompt}]
+
+    def call():
+        for attempt in range(retries + 1):
+            try:
+                response = gateway.call(
+                    BATCH,
+                    create=create,
+                    model=MODEL,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    request_timeout=timeout
+                )
+                return response.choices[0].message['content']
+            except retryable_errors() as e:
+                if attempt == retries:
+                    raise
+                delay = backoff * 2 ** attempt
+                logger.warning("OpenAI call failed (%s), retrying in %.1fs",
+                               e, delay)
+                time.sleep(delay)
+
+    return cache.get_or_call(call, MODEL, messages, max_tokens)
+
+
+def stream_outline(prompt, create=None, timeout=DEFAULT_TIMEOUT,
+                   retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                   cache=None, gateway=None):
+    """Stream the outline for ``prompt``, yielding each module once its
+    block is complete.
+
+    A cached outline arrives in one piece. Otherwise the completion is
+    streamed through ``gateway`` at BATCH priority and cached once it has
+    finished. A failure before any module has been yielded is retried like
+    complete(); after that the modules already yielded are kept, and the
+    partial one is dropped, rather than paying for the outline again.
+    """
+    cache = cache or get_default_cache()
+    gateway = gateway or get_default_gateway()
+    messages = [{"role": "user", "content": prompt}]
+
+    def stream():
+        chunks = gateway.stream(
+            BATCH,
+            create=create,
+            model=MODEL,
+            messages=messages,
+            max_tokens=OUTLINE_MAX_TOKENS,
+            request_timeout=timeout
+        )
+        for chunk in chunks:
+            content = chunk.choices[0].delta.get('content')
+            if content:
+                yield content
+
+    for attempt in range(retries + 1):
+        parser = OutlineParser()
+        yielded = 0
+        try:
+            for text in cache.get_or_stream(stream, MODEL, messages,
+                                            OUTLINE_MAX_TOKENS):
+                for module in parser.feed(text):
+                    yielded += 1
+                    yield module
+        except retryable_errors() as e:
+            if yielded:
+                logger.error("Outline stream failed after %d modules, "
+                             "keeping them: %s", yielded, e)
+                return
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+            logger.warning("OpenAI call failed (%s), retrying in %.1fs",
+                           e, delay)
+            time.sleep(delay)
+            continue
+        yield from parser.close()
+        return
+
+
+def _enhance(modules_in, course_title, level, create, max_workers, timeout,
+             retries, backoff, on_outline=None, on_module_done=None):
+    """Enhance the lessons of each module as ``modules_in`` yields it.
+
+    Lesson calls are submitted as soon as their module arrives, so they
+    run while a streamed outline is still being generated. Callbacks run
+    in the calling thread: ``on_outline`` once every module has arrived,
+    then ``on_module_done`` as each module's lessons finish.
+    """
+    modules = []
+    remaining = []
+
+    def enhance(lesson):
+        prompt = build_lesson_prompt(lesson, course_title, level)
+        return complete(prompt, LESSON_MAX_TOKENS, create=create,
+                        timeout=timeout, retries=retries, backoff=backoff)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {}
+        for module in modules_in:
+            index = len(modules)
+            modules.append(module)
+            remaining.append(len(module["lessons"]))
+            for lesson in module["lessons"]:
+                futures[executor.submit(enhance, lesson)] = (index, lesson)
+
+        if on_outline:
+            on_outline(modules)
+        if on_module_done:
+            for index, module in enumerate(modules):
+                if not remaining[index]:
+                    on_module_done(index, module)
+        for future in as_completed(futures):
+            index, lesson = futures[future]
+            try:
+                lesson["content"] = future.result()
+            except retryable_errors() as e:
+                logger.error("Keeping outline text for lesson %r: %s",
+                             lesson["title"], e)
+            remaining[index] -= 1
+            if on_module_done and not remaining[index]:
+                on_module_done(index, modules[index])
+    return modules
+
+
+def enhance_lessons(modules, course_title, level, create=None,
+                    max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_TIMEOUT,
+                    retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                    on_module_done=None):
+    """Replace every lesson's content with its enhanced version, in place.
+
+    At most ``max_workers`` calls are in flight at once. A lesson whose call
+    still fails after its retries keeps the description from the outline
+    rather than discarding the rest of the course. ``on_module_done(index,
+    module)`` is called from the calling thread as each module finishes.
+    """
+    _enhance(modules, course_title, level, create, max_workers, timeout,
+             retries, backoff, on_module_done=on_module_done)
+    return modules
+
+
+def generate_modules_and_lessons(course_title, course_description, level,
+                                 create=None,
+                                 max_workers=DEFAULT_MAX_WORKERS,
+                                 timeout=DEFAULT_TIMEOUT,
+                                 retries=DEFAULT_RETRIES,
+                                 backoff=DEFAULT_BACKOFF,
+                                 on_outline=None, on_module_done=None):
+    prompt = build_outline_prompt(course_title, course_description, level)
+    outline = stream_outline(prompt, create=create, timeout=timeout,
+                             retries=retries, backoff=backoff)
+    return _enhance(outline, course_title, level, create, max_workers,
+                    timeout, retries, backoff, on_outline=on_outline,
+                    on_module_done=on_module_done)
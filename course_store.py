@@ -0,0 +1,131 @@
+'''
+Persistence and loading for course trees.
+
+A generated course used to be written with one commit per Course, Module
+and Lesson row. save_course_tree() writes the whole Course -> Module ->
+Lesson tree in a single transaction instead: the rows are linked through
+their relationships, so one flush inserts each table in a batch and fills in
+the foreign keys, and a failure anywhere rolls the whole tree back.
+
+The loaders fetch a course or module together with its children using
+selectin loading, so rendering a tree costs a fixed number of queries (one
+per level) however many modules and lessons it has. Lesson bodies are
+deferred columns: load_course_tree() fetches them with the lessons for the
+course page, while load_module_tree(), behind the lesson list, leaves them
+in the database.
+
+Course listings are paged with a keyset on (created_at, id), newest first:
+each page continues from the last row of the previous one through an index
+range, so a page costs the same however many courses come before it, and
+only the summary columns are loaded.
+'''
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import selectinload
+
+from models import db, Course, Module, Lesson
+
+DEFAULT_PAGE_SIZE = 20
+SUMMARY_COLUMNS = (Course.id, Course.title, Course.description,
+                   Course.completed_at, Course.created_at)
+
+
+def build_course_tree(user_id, title, description, modules):
+    """Build (but do not add) a Course with its Module and Lesson children."""
+    return Course(
+        title=title,
+        description=description,
+        user_id=user_id,
+        modules=[
+            Module(
+                title=module_data['title'],
+                description=module_data['description'],
+                lessons=[Lesson(title=lesson_data['title'],
+                                content=lesson_data['content'])
+                         for lesson_data in module_data['lessons']])
+            for module_data in modules
+        ])
+
+
+def save_course_tree(user_id, title, description, modules, commit=True):
+    """Insert a generated course tree in one transaction.
+
+    ``modules`` is the structure returned by generate_modules_and_lessons.
+    With ``commit=False`` the rows are flushed (so ids are assigned) but the
+    transaction is left open for the caller to commit alongside its own
+    changes. Any error rolls back every row of the tree and is re-raised.
+    """
+    course = build_course_tree(user_id, title, description, modules)
+    try:
+        db.session.add(course)
+        db.session.flush()
+        if commit:
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return course
+
+
+def load_course_tree(course_id, lessons=True):
+    """Return the Course with its modules (and their lessons) preloaded.
+
+    Costs two queries, or three with ``lessons`` (whose content is loaded
+    too); returns None if there is no such course.
+    """
+    modules = selectinload(Course.modules)
+    if lessons:
+        modules = modules.selectinload(Module.lessons).undefer(
+            Lesson.content)
+    return db.session.execute(
+        db.select(Course).options(modules).filter_by(id=course_id)
+    ).scalar_one_or_none()
+
+
+def load_module_tree(module_id):
+    """Return the Module with its lessons preloaded, or None (two queries).
+
+    The lessons' content and quiz stay deferred until read.
+    """
+    return db.session.execute(
+        db.select(Module).options(selectinload(Module.lessons))
+        .filter_by(id=module_id)
+    ).scalar_one_or_none()
+
+
+def encode_cursor(row):
+    """An opaque token for the position just after ``row``."""
+    data = json.dumps([row.created_at.isoformat(), row.id])
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token):
+    """Inverse of encode_cursor; raises ValueError for a bad token."""
+    try:
+        created_at, course_id = json.loads(base64.urlsafe_b64decode(
+            token.encode('ascii')))
+        return datetime.fromisoformat(created_at), int(course_id)
+    except (TypeError, ValueError, UnicodeError) as error:
+        raise ValueError(f'Invalid cursor {token!r}') from error
+
+
+def list_courses(user_id, completed, after=None, limit=DEFAULT_PAGE_SIZE):
+    """One page of a user's courses, newest first.
+
+    Returns ``(rows, next_cursor)``: rows with the SUMMARY_COLUMNS as
+    attributes (not Course objects), and the token for the next page, or
+    None on the last one. ``after`` is a token from a previous call.
+    """
+    query = db.select(*SUMMARY_COLUMNS).where(
+        Course.user_id == user_id, Course.completed == completed)
+    if after is not None:
+        query = query.where(tuple_(Course.created_at, Course.id) <
+                            tuple_(*decode_cursor(after)))
+    query = query.order_by(Course.created_at.desc(), Course.id.desc())
+    rows = db.session.execute(query.limit(limit + 1)).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit \
+        else None
+    return rows[:limit], next_cursor
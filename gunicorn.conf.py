@@ -0,0 +1,44 @@
+'''
+Gunicorn settings, picked by environment variables.
+
+WORKER_CLASS=gevent (the default) runs each request in a green thread.
+Before the app is imported, the worker patches sockets, ssl, threading,
+time and subprocess, so the requests sessions behind openai and the JDoodle
+runner, the LLM gateway's locks and the matchmaking waits all yield while
+they wait, and one process keeps up to WORKER_CONNECTIONS requests in
+flight. CPU-bound work and SQLite queries still run one at a time per
+process.
+
+WORKER_CLASS=sync serves one request per worker process at a time. /chat,
+/compile and /generate_course spend nearly all of that time waiting on
+OpenAI or JDoodle, so a few slow requests can tie up every worker. It
+therefore starts several processes, which share the interview queue
+through SQLite (MATCHMAKING_BACKEND=sqlite) unless told otherwise, and
+/wait_match answers at once instead of long-polling.
+
+    gunicorn -c gunicorn.conf.py app:app
+    WORKER_CLASS=sync gunicorn -c gunicorn.conf.py app:app
+'''
+import multiprocessing
+import os
+
+worker_class = os.getenv('WORKER_CLASS', 'gevent')
+if worker_class not in ('sync', 'gevent'):
+    raise RuntimeError(f'Unknown WORKER_CLASS {worker_class!r}')
+
+# One gevent process by default: the in-memory matchmaking queue only pairs
+# users served by the same process (see MATCHMAKING_BACKEND)
+default_workers = 1 if worker_class == 'gevent' else \
+    multiprocessing.cpu_count() * 2 + 1
+workers = int(os.getenv('WEB_CONCURRENCY', default_workers))
+if workers > 1:
+    # Read by the app in each worker, which inherits this environment
+    os.environ.setdefault('MATCHMAKING_BACKEND', 'sqlite')
+worker_connections = int(os.getenv('WORKER_CONNECTIONS', 1000))
+# Longer than a /wait_match long-poll, so one is never taken for a hung
+# worker
+timeout = int(os.getenv(
+    'GUNICORN_TIMEOUT', float(os.getenv('MATCH_WAIT_TIMEOUT', 25)) + 30))
+# Importing the app in the master would create its locks, pools and threads
+# before the gevent worker patches them
+preload_app = False
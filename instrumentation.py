@@ -0,0 +1,90 @@
+'''
+Hooks for measuring what the app does.
+
+QueryCounter records every SQL statement an engine executes while it is
+active, so tests can assert how many queries a page costs, and
+query_plan shows how SQLite would run each of them. LatencyStats
+keeps the most recent timings of a request type (such as the chat
+stream's time to first token) for percentile summaries.
+'''
+import threading
+from collections import deque
+
+from sqlalchemy import event
+
+
+class QueryCounter:
+    """Context manager counting statements executed on ``engine``.
+
+        with QueryCounter(db.engine) as queries:
+            render_course(course_id)
+        assert queries.count <= 3
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self.parameters = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        self.statements.append(statement)
+        self.parameters.append(parameters)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+        return False
+
+
+def query_plan(connection, statement, parameters=()):
+    """SQLite's EXPLAIN QUERY PLAN for ``statement`` as a list of steps,
+    such as ``'SEARCH courses USING INDEX ix_courses_user_id_completed
+    (user_id=? AND completed=?)'`` or ``'SCAN courses'``.
+
+    ``statement`` and ``parameters`` are in DBAPI form, as QueryCounter
+    records them.
+    """
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement,
+                                      tuple(parameters))
+    return [row[-1] for row in rows]
+
+
+class LatencyStats:
+    """The last ``size`` samples of each named timing, in seconds.
+
+        stats.record(ttft=0.4, total=2.1)
+        stats.summary()['ttft']['p95']
+    """
+
+    def __init__(self, size=1000):
+        self.size = size
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, **timings):
+        with self._lock:
+            for name, seconds in timings.items():
+                samples = self._samples.setdefault(
+                    name, deque(maxlen=self.size))
+                samples.append(seconds)
+
+    def summary(self):
+        """Count, p50, p95, p99 and max of each timing over the kept
+        samples."""
+        with self._lock:
+            snapshot = {name: sorted(samples)
+                        for name, samples in self._samples.items()}
+        return {name: {'count': len(samples),
+                       'p50': samples[int(0.50 * (len(samples) - 1))],
+                       'p95': samples[int(0.95 * (len(samples) - 1))],
+                       'p99': samples[int(0.99 * (len(samples) - 1))],
+                       'max': samples[-1]}
+                for name, samples in snapshot.items()}
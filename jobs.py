@@ -0,0 +1,266 @@
+'''
+Background course generation jobs.
+
+A POST to /generate_course only records a GenerationJob row and hands its
+id to a local thread pool; the worker claims the row, generates the course
+and saves it while updating per-module progress on the row. Because the
+queue lives in the database, queued jobs and jobs whose worker died are
+picked up again by JobRunner.recover(), which the app runs on its first
+request and again every third of the lease while it serves requests, so a
+job orphaned by a restart is retried once its lease runs out even though
+the new process started inside it. While a job runs, a heartbeat thread refreshes its row every
+third of the lease, so a module whose lessons take longer than the lease
+is not mistaken for a dead worker.
+'''
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from course_store import save_course_tree
+from models import db, GenerationJob
+from page_cache import bump_version, course_key
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+MAX_ATTEMPTS = 3
+
+
+def job_key(user_id, title, description, level):
+    """Identify submissions that would generate the same course."""
+    raw = '\x1f'.join([str(user_id), title.strip().lower(),
+                       description.strip().lower(), level.lower()])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def enqueue_job(user_id, title, description, level):
+    """Create a queued job, or return the live job for the same submission.
+
+    Returns ``(job, created)``. Two racing identical submissions both try
+    to insert the same ``active_key``; the loser's insert fails on the
+    unique constraint and it returns the winner's job instead.
+    """
+    key = job_key(user_id, title, description, level)
+    existing = GenerationJob.query.filter_by(active_key=key).first()
+    if existing:
+        return existing, False
+
+    job = GenerationJob(user_id=user_id, title=title, description=description,
+                        level=level, active_key=key, status=QUEUED)
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        existing = GenerationJob.query.filter_by(active_key=key).first()
+        if existing is None:
+            raise
+        return existing, False
+    return job, True
+
+
+def job_progress(job):
+    return json.loads(job.progress) if job.progress else []
+
+
+def job_to_dict(job):
+    progress = job_progress(job)
+    return {
+        'id': job.id,
+        'status': job.status,
+        'title': job.title,
+        'modules_total': len(progress),
+        'modules_done': sum(1 for module in progress if module['done']),
+        'modules': progress,
+        'course_id': job.course_id,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at':
+            job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class JobRunner:
+    """Runs generation jobs on a local thread pool.
+
+    ``generate`` is called as ``generate(title, description, level,
+    on_outline=..., on_module_done=...)`` and returns the module list that
+    course_generator.generate_modules_and_lessons produces. With
+    ``max_workers=0`` jobs run inline in the submitting thread, which is
+    what tests use.
+    """
+
+    def __init__(self, app, generate, max_workers=2, lease_seconds=300):
+        self.app = app
+        self.generate = generate
+        self.lease = timedelta(seconds=lease_seconds)
+        self.heartbeat_interval = lease_seconds / 3
+        self.executor = (ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='course-job')
+                         if max_workers else None)
+        self._next_recovery = 0
+        self._recover_lock = threading.Lock()
+        self._submitted = set()  # Job ids handed to this process's pool
+
+    def submit(self, job_id):
+        with self._recover_lock:
+            self._submitted.add(job_id)
+        if self.executor is None:
+            self.run(job_id)
+        else:
+            self.executor.submit(self.run, job_id)
+
+    def recover(self):
+        """Requeue jobs orphaned by a dead worker and resubmit queued ones.
+
+        A running job whose heartbeat is older than the lease is assumed to
+        have lost its worker. Claiming is atomic, so several processes can
+        recover at once without running a job twice. Queued jobs this
+        process has already submitted are not submitted again.
+        """
+        with self.app.app_context():
+            cutoff = datetime.utcnow() - self.lease
+            GenerationJob.query.filter(
+                GenerationJob.status == RUNNING,
+                GenerationJob.heartbeat_at < cutoff
+            ).update({'status': QUEUED}, synchronize_session=False)
+            db.session.commit()
+            job_ids = [job_id for (job_id,) in db.session.query(
+                GenerationJob.id).filter_by(status=QUEUED)]
+        with self._recover_lock:
+            job_ids = [job_id for job_id in job_ids
+                       if job_id not in self._submitted]
+        for job_id in job_ids:
+            self.submit(job_id)
+        return job_ids
+
+    def recover_due(self):
+        """Run recover() unless it ran in the last third of the lease.
+
+        The app calls this before each request instead of recovering at
+        import, so importing it (tests, CLI commands) touches no database.
+        Repeating it catches jobs whose lease had not yet run out when the
+        process started. A failure is logged rather than failing the
+        request.
+        """
+        now = time.monotonic()
+        with self._recover_lock:
+            if now < self._next_recovery:
+                return
+            self._next_recovery = now + self.heartbeat_interval
+        try:
+            self.recover()
+        except Exception:
+            logger.exception("Could not recover generation jobs")
+
+    def run(self, job_id):
+        with self.app.app_context():
+            try:
+                self._run(job_id)
+            except Exception:
+                logger.exception("Course generation job %s failed", job_id)
+                db.session.rollback()
+                self._finish(job_id, FAILED, error='Course generation failed')
+            finally:
+                db.session.remove()
+                with self._recover_lock:
+                    self._submitted.discard(job_id)
+
+    def _claim(self, job_id):
+        now = datetime.utcnow()
+        claimed = GenerationJob.query.filter_by(
+            id=job_id, status=QUEUED
+        ).update({
+            'status': RUNNING,
+            'started_at': now,
+            'heartbeat_at': now,
+            'attempts': GenerationJob.attempts + 1,
+        }, synchronize_session=False)
+        db.session.commit()
+        return db.session.get(GenerationJob, job_id) if claimed else None
+
+    def _run(self, job_id):
+        job = self._claim(job_id)
+        if job is None:
+            return  # Another worker got it first, or it already finished
+        if job.attempts > MAX_ATTEMPTS:
+            self._finish(job_id, FAILED, error='Too many attempts')
+            return
+
+        stop = threading.Event()
+        keeper = threading.Thread(target=self._keep_alive,
+                                  args=(job_id, stop), daemon=True,
+                                  name=f'course-job-{job_id}-heartbeat')
+        keeper.start()
+        try:
+            self._generate(job, job_id)
+        finally:
+            stop.set()
+            keeper.join()
+
+    def _generate(self, job, job_id):
+        progress = []
+
+        def on_outline(modules):
+            progress[:] = [{'title': module['title'],
+                            'lessons': len(module['lessons']),
+                            'done': False} for module in modules]
+            self._heartbeat(job, progress)
+
+        def on_module_done(index, module):
+            progress[index]['done'] = True
+            self._heartbeat(job, progress)
+
+        modules = self.generate(job.title, job.description, job.level,
+                                on_outline=on_outline,
+                                on_module_done=on_module_done)
+        # Saved in the same transaction that marks the job finished, so a
+        # worker dying part way never leaves a course behind a queued job
+        course = save_course_tree(job.user_id, job.title, job.description,
+                                  modules, commit=False)
+        bump_version(course_key(course.id))
+        self._finish(job_id, SUCCEEDED, course_id=course.id)
+
+    def _keep_alive(self, job_id, stop):
+        """Refresh the running job's heartbeat until ``stop`` is set."""
+        with self.app.app_context():
+            try:
+                while not stop.wait(self.heartbeat_interval):
+                    try:
+                        GenerationJob.query.filter_by(
+                            id=job_id, status=RUNNING
+                        ).update({'heartbeat_at': datetime.utcnow()},
+                                 synchronize_session=False)
+                        db.session.commit()
+                    except Exception:
+                        logger.exception("Could not refresh the heartbeat "
+                                         "of generation job %s", job_id)
+                        db.session.rollback()
+            finally:
+                db.session.remove()
+
+    def _heartbeat(self, job, progress):
+        job.progress = json.dumps(progress)
+        job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+
+    def _finish(self, job_id, status, course_id=None, error=None):
+        job = db.session.get(GenerationJob, job_id)
+        if job is None:
+            return
+        job.status = status
+        job.course_id = course_id
+        job.error = error
+        job.active_key = None  # Frees the key for a later resubmission
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
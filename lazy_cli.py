@@ -0,0 +1,30 @@
+'''
+Command groups that are only imported when they are run.
+
+Flask-Migrate imports all of alembic, the slowest import in the app's
+startup, to register a `flask db` command that web workers and tests never
+use. A LazyGroup stands in for such a group on
+``app.cli``: the real one is built by ``load()`` the first time the group
+is listed or invoked, so only `flask db ...` pays for the import.
+'''
+import click
+
+
+class LazyGroup(click.Group):
+    """Delegates to the group returned by ``load()``, built on first use."""
+
+    def __init__(self, name, load, **kwargs):
+        super().__init__(name, **kwargs)
+        self._load = load
+        self._loaded = None
+
+    def loaded(self):
+        if self._loaded is None:
+            self._loaded = self._load()
+        return self._loaded
+
+    def list_commands(self, ctx):
+        return self.loaded().list_commands(ctx)
+
+    def get_command(self, ctx, cmd_name):
+        return self.loaded().get_command(ctx, cmd_name)
@@ -0,0 +1,245 @@
+'''
+Content-addressed cache for OpenAI chat completions.
+
+Responses are keyed on a hash of the model, messages, max_tokens and
+temperature, so the same prompt is only paid for once. Lookups go through a
+bounded in-memory LRU first and then a SQLite file shared by every process
+on the host; both tiers expire entries after a TTL.
+'''
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_DISK_MAX_ENTRIES = 50000
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'instance', 'llm_cache.db')
+
+# Trim the disk tier once every this many writes rather than on each one
+PRUNE_EVERY = 100
+
+
+def cache_key(model, messages, max_tokens, temperature=None):
+    payload = json.dumps({
+        'model': model,
+        'messages': messages,
+        'max_tokens': max_tokens,
+        'temperature': temperature,
+    }, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """Two-tier (memory LRU + SQLite) cache of completion text.
+
+    ``path=None`` keeps the cache in memory only. All methods are thread
+    safe; the SQLite tier uses one connection per thread.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL,
+                 path=None, disk_max_entries=DEFAULT_DISK_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.disk_max_entries = disk_max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        self._counters = dict.fromkeys(
+            ['memory_hits', 'disk_hits', 'misses', 'evictions',
+             'expirations'], 0)
+        self._hit_seconds = 0.0
+        self._miss_seconds = 0.0
+        if path:
+            self._connect().execute(
+                'CREATE TABLE IF NOT EXISTS llm_cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'expires_at REAL NOT NULL, accessed_at REAL NOT NULL)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, seconds=0.0, bucket=None):
+        with self._lock:
+            self._counters[name] += 1
+            if bucket == 'hit':
+                self._hit_seconds += seconds
+            elif bucket == 'miss':
+                self._miss_seconds += seconds
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._memory[key] = (value, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def get(self, key):
+        """Return the cached value for ``key``, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    return entry[0]
+                del self._memory[key]
+                self._counters['expirations'] += 1
+
+        if not self.path:
+            return None
+        conn = self._connect()
+        row = conn.execute('SELECT value, expires_at FROM llm_cache '
+                           'WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at <= now:
+            conn.execute('DELETE FROM llm_cache WHERE key = ?', (key,))
+            self._count('expirations')
+            return None
+        conn.execute('UPDATE llm_cache SET accessed_at = ? WHERE key = ?',
+                     (now, key))
+        self._remember(key, value, expires_at)
+        return value
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        if not self.path:
+            return
+        conn = self._connect()
+        conn.execute('INSERT OR REPLACE INTO llm_cache '
+                     '(key, value, expires_at, accessed_at) '
+                     'VALUES (?, ?, ?, ?)',
+                     (key, value, expires_at, time.time()))
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """Drop expired disk entries and trim the least recently used."""
+        if not self.path:
+            return
+        conn = self._connect()
+        expired = conn.execute('DELETE FROM llm_cache WHERE expires_at <= ?',
+                               (time.time(),)).rowcount
+        evicted = conn.execute(
+            'DELETE FROM llm_cache WHERE key IN ('
+            'SELECT key FROM llm_cache ORDER BY accessed_at DESC '
+            'LIMIT -1 OFFSET ?)', (self.disk_max_entries,)).rowcount
+        with self._lock:
+            self._counters['expirations'] += expired
+            self._counters['evictions'] += evicted
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.path:
+            self._connect().execute('DELETE FROM llm_cache')
+
+    def get_or_call(self, call, model, messages, max_tokens,
+                    temperature=None):
+        """Return the cached completion, or run ``call()`` and cache it."""
+        key = cache_key(model, messages, max_tokens, temperature)
+        start = time.perf_counter()
+        with self._lock:
+            in_memory = key in self._memory
+        value = self.get(key)
+        if value is not None:
+            self._count('memory_hits' if in_memory else 'disk_hits',
+                        time.perf_counter() - start, 'hit')
+            return value
+
+        value = call()
+        self._count('misses', time.perf_counter() - start, 'miss')
+        if value:
+            self.set(key, value)
+        return value
+
+    def get_or_stream(self, stream, model, messages, max_tokens,
+                      temperature=None):
+        """Yield the cached completion in one piece, or relay the pieces
+        of ``stream()`` and cache their concatenation once it finishes.
+
+        A stream that fails or is abandoned part way is not cached.
+        """
+        key = cache_key(model, messages, max_tokens, temperature)
+        start = time.perf_counter()
+        with self._lock:
+            in_memory = key in self._memory
+        value = self.get(key)
+        if value is not None:
+            self._count('memory_hits' if in_memory else 'disk_hits',
+                        time.perf_counter() - start, 'hit')
+            yield value
+            return
+
+        parts = []
+        for part in stream():
+            parts.append(part)
+            yield part
+        self._count('misses', time.perf_counter() - start, 'miss')
+        if parts:
+            self.set(key, ''.join(parts))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            hits = stats['memory_hits'] + stats['disk_hits']
+            lookups = hits + stats['misses']
+            stats['hits'] = hits
+            stats['hit_ratio'] = hits / lookups if lookups else 0.0
+            stats['avg_hit_ms'] = \
+                1000 * self._hit_seconds / hits if hits else 0.0
+            stats['avg_miss_ms'] = (1000 * self._miss_seconds /
+                                    stats['misses'] if stats['misses']
+                                    else 0.0)
+            stats['memory_entries'] = len(self._memory)
+        return stats
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache():
+    """The process-wide cache, configured from LLM_CACHE_* on first use.
+
+    Set LLM_CACHE_PATH to an empty string for a memory-only cache.
+    """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache(
+                max_entries=int(os.getenv('LLM_CACHE_SIZE',
+                                          DEFAULT_MAX_ENTRIES)),
+                ttl=float(os.getenv('LLM_CACHE_TTL', DEFAULT_TTL)),
+                path=os.getenv('LLM_CACHE_PATH', DEFAULT_PATH) or None,
+                disk_max_entries=int(os.getenv('LLM_CACHE_DISK_SIZE',
+                                               DEFAULT_DISK_MAX_ENTRIES)))
+        return _default_cache
+
+
+def set_default_cache(cache):
+    global _default_cache
+    with _default_lock:
+        _default_cache = cache
@@ -0,0 +1,296 @@
+'''
+Single gateway for every OpenAI chat completion the app makes.
+
+The tutor chat and both stages of course generation used to call OpenAI
+independently, so a burst of course generations could use up the rate limit
+and starve chat users, and upstream 429s surfaced as errors. All calls now
+go through one LLMGateway per process, which:
+
+* admits requests through a token bucket (``rate`` per second, bursts of up
+  to ``burst``) and at most ``max_concurrent`` calls at a time;
+* serves waiting requests by priority class: INTERACTIVE (chat) is always
+  admitted before BATCH (course generation), first come first served
+  within a class;
+* coalesces identical concurrent requests into one upstream call, except
+  that a request is never held behind a lower priority one that is still
+  waiting to be admitted;
+* pauses admissions for ``cooldown`` seconds after an upstream 429.
+
+metrics() reports queue depth per class, calls in flight, counters and
+admission wait-time percentiles. The upstream client is injectable, so the
+whole gateway can be exercised against a local mock.
+
+openai (and aiohttp under it) is the slowest import in the app, so it is
+imported on the first upstream call rather than with this module; openai
+reads OPENAI_API_KEY from the environment then. get_default_gateway() loads
+.env into the environment first, so bot.py and course_generator.py work
+without app.py having loaded it.
+'''
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from instrumentation import LatencyStats
+from metrics import outbound
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BATCH: 'batch'}
+
+DEFAULT_RATE = 3.0
+DEFAULT_BURST = 10
+DEFAULT_MAX_CONCURRENT = 8
+DEFAULT_COOLDOWN = 1.0
+
+
+class GatewayBusy(Exception):
+    """A request waited longer than its timeout to be admitted."""
+
+
+def request_key(kwargs):
+    # request_timeout only bounds our wait, so it does not make a request
+    # different
+    payload = {k: v for k, v in kwargs.items() if k != 'request_timeout'}
+    data = json.dumps(payload, sort_keys=True, separators=(',', ':'),
+                      default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def openai_create(**kwargs):
+    # Looked up per call so tests can patch openai.ChatCompletion.create
+    import openai
+    return openai.ChatCompletion.create(**kwargs)
+
+
+def rate_limit_error():
+    # Only evaluated in except clauses, once an error is already raised
+    import openai
+    return openai.error.RateLimitError
+
+
+class _Flight:
+    def __init__(self, priority):
+        self.priority = priority
+        # Set once the leader is admitted, or has failed
+        self.admitted = threading.Event()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class LLMGateway:
+    """Rate-limited, prioritised, coalescing front for ``create``."""
+
+    def __init__(self, create=openai_create, rate=DEFAULT_RATE,
+                 burst=DEFAULT_BURST, max_concurrent=DEFAULT_MAX_CONCURRENT,
+                 cooldown=DEFAULT_COOLDOWN):
+        self.create = create
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.cooldown = cooldown
+        self._cond = threading.Condition()
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiting = []  # Heap of (priority, sequence) tickets
+        self._sequence = itertools.count()
+        self._active = 0
+        self._flights = {}
+        self._counters = dict.fromkeys(
+            ['calls', 'upstream_calls', 'coalesced', 'rate_limited',
+             'rejected'], 0)
+        self.wait_times = LatencyStats()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def _admit(self, priority, timeout):
+        """Block until this request may call upstream.
+
+        Only the head of the queue may take a token, so a waiting
+        INTERACTIVE request is always admitted before any BATCH one.
+        """
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        with self._cond:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    head = self._waiting[0] == ticket
+                    free = self._active < self.max_concurrent
+                    if (head and free and now >= self._paused_until and
+                            self._tokens >= 1):
+                        heapq.heappop(self._waiting)
+                        self._tokens -= 1
+                        self._active += 1
+                        break
+                    delay = None  # Until someone else changes the state
+                    if head and free:
+                        delay = max(self._paused_until - now,
+                                    (1 - self._tokens) / self.rate, 0.001)
+                    if deadline is not None:
+                        if now >= deadline:
+                            self._counters['rejected'] += 1
+                            raise GatewayBusy('Too many AI requests right '
+                                              'now; try again shortly')
+                        remaining = deadline - now
+                        delay = remaining if delay is None else min(
+                            delay, remaining)
+                    self._cond.wait(delay)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                raise
+            finally:
+                # The head of the queue may have changed
+                self._cond.notify_all()
+        self.wait_times.record(
+            **{PRIORITY_NAMES[priority]: time.monotonic() - start})
+
+    def _release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def _cool_down(self):
+        with self._cond:
+            self._counters['rate_limited'] += 1
+            self._tokens = 0.0
+            self._paused_until = time.monotonic() + self.cooldown
+
+    def _count(self, name):
+        with self._cond:
+            self._counters[name] += 1
+
+    def _upstream(self, create, kwargs):
+        self._count('upstream_calls')
+        try:
+            with outbound('openai'):
+                return (create or self.create)(**kwargs)
+        except rate_limit_error():
+            self._cool_down()
+            raise
+
+    def _upstream_stream(self, create, kwargs):
+        # Timed until the last chunk, not just until the stream opens
+        self._count('upstream_calls')
+        try:
+            with outbound('openai_stream'):
+                yield from (create or self.create)(**kwargs)
+        except rate_limit_error():
+            self._cool_down()
+            raise
+
+    def call(self, priority=INTERACTIVE, create=None, timeout=None,
+             **kwargs):
+        """Run ``create(**kwargs)`` once admitted and return its response.
+
+        A request identical to one already in flight waits for and shares
+        that call's response (or error) instead, unless that call has a
+        lower priority and is not admitted yet; this request then leads a
+        flight of its own. ``timeout`` bounds the wait for admission, the
+        leader's when sharing; GatewayBusy is raised when it runs out.
+        """
+        self._count('calls')
+        key = request_key(kwargs)
+        with self._cond:
+            flight = self._flights.get(key)
+            leader = flight is None or (priority < flight.priority and
+                                        not flight.admitted.is_set())
+            if leader:
+                flight = self._flights[key] = _Flight(priority)
+            else:
+                self._counters['coalesced'] += 1
+        if not leader:
+            if not flight.admitted.wait(timeout):
+                self._count('rejected')
+                raise GatewayBusy('Too many AI requests right now; '
+                                  'try again shortly')
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            self._admit(priority, timeout)
+            flight.admitted.set()
+            try:
+                flight.result = self._upstream(create, kwargs)
+            finally:
+                self._release()
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._cond:
+                # A higher priority request may have taken over the key
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.admitted.set()
+            flight.done.set()
+        return flight.result
+
+    def stream(self, priority=INTERACTIVE, create=None, timeout=None,
+               **kwargs):
+        """Yield the chunks of a streamed completion once admitted.
+
+        Streams are never coalesced. The concurrency slot is held until the
+        stream is exhausted or closed.
+        """
+        self._count('calls')
+        self._admit(priority, timeout)
+        try:
+            yield from self._upstream_stream(create, dict(kwargs, stream=True))
+        finally:
+            self._release()
+
+    def metrics(self):
+        with self._cond:
+            self._refill(time.monotonic())
+            depth = dict.fromkeys(PRIORITY_NAMES.values(), 0)
+            for priority, _ in self._waiting:
+                depth[PRIORITY_NAMES[priority]] += 1
+            metrics = dict(self._counters, queue_depth=depth,
+                           active=self._active,
+                           tokens=round(self._tokens, 2))
+        metrics['wait_seconds'] = self.wait_times.summary()
+        return metrics
+
+
+_default_gateway = None
+_default_lock = threading.Lock()
+
+
+def get_default_gateway():
+    """The process-wide gateway, configured from LLM_RATE, LLM_BURST,
+    LLM_MAX_CONCURRENT and LLM_COOLDOWN (from .env if not set)."""
+    global _default_gateway
+    with _default_lock:
+        if _default_gateway is None:
+            load_dotenv()  # Never overrides variables already set
+            _default_gateway = LLMGateway(
+                rate=float(os.getenv('LLM_RATE', DEFAULT_RATE)),
+                burst=int(os.getenv('LLM_BURST', DEFAULT_BURST)),
+                max_concurrent=int(os.getenv('LLM_MAX_CONCURRENT',
+                                             DEFAULT_MAX_CONCURRENT)),
+                cooldown=float(os.getenv('LLM_COOLDOWN', DEFAULT_COOLDOWN)))
+        return _default_gateway
+
+
+def set_default_gateway(gateway):
+    """Replace the process-wide gateway (None rebuilds it from the env)."""
+    global _default_gateway
+    with _default_lock:
+        _default_gateway = gateway
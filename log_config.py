@@ -0,0 +1,51 @@
+'''
+Logging setup for the app.
+
+LOG_LEVEL gates what is emitted, so debug detail such as each queue join
+costs nothing unless asked for. LOG_FORMAT=json writes one JSON object per
+line: the usual time, level, logger and message plus any fields passed
+with ``extra=``, so log processors can filter on them without parsing the
+message. The default text format is for reading in a terminal.
+'''
+import json
+import logging
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# Attributes every LogRecord has; anything else came in through extra=
+_STANDARD = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class _AppHandler(logging.StreamHandler):
+    """Marks the handler configure_logging installed, to replace it."""
+
+
+def configure_logging(level='INFO', fmt='text'):
+    """Send all logs to stderr at ``level`` in ``fmt`` ('text'/'json')."""
+    if fmt not in ('text', 'json'):
+        raise ValueError(f'Unknown log format {fmt!r}')
+    handler = _AppHandler()
+    handler.setFormatter(JsonFormatter() if fmt == 'json'
+                         else logging.Formatter(TEXT_FORMAT))
+    root = logging.getLogger()
+    for old in [h for h in root.handlers if isinstance(h, _AppHandler)]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
@@ -0,0 +1,502 @@
+'''
+Mock interview matchmaking.
+
+Users join a queue and are paired into a freshly named video room, either
+first come first served or, in skill mode, with someone who shares their
+preferred language and level (falling back to first come first served once
+they have waited long enough). Instead of polling /check_match every few
+seconds, a waiting user can block in wait_for_room(), which wakes the
+moment join() pairs them.
+
+Two backends share one interface:
+
+* InMemoryMatchmaker keeps everything in the process. It is the fastest
+  option but users in different gunicorn workers can never be matched.
+* SQLiteMatchmaker keeps the queue and rooms in a SQLite file that every
+  worker process on the host opens, pairing under a write transaction so
+  two processes can never hand out the same user.
+
+Both forget queue entries whose user has not been seen for ``queue_ttl``
+seconds (they closed the page) and room assignments older than
+``room_ttl`` seconds.
+'''
+import os
+import random
+import sqlite3
+import string
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+
+DEFAULT_QUEUE_TTL = 120
+DEFAULT_ROOM_TTL = 3600
+DEFAULT_SKILL_WINDOW = 30
+
+
+def make_room_name():
+    return ''.join(random.choices(string.ascii_uppercase + string.digits,
+                                  k=8))
+
+
+class Matchmaker(ABC):
+    """Interface shared by the matchmaking backends."""
+
+    def __init__(self, queue_ttl=DEFAULT_QUEUE_TTL,
+                 room_ttl=DEFAULT_ROOM_TTL, mode='fifo',
+                 skill_window=DEFAULT_SKILL_WINDOW):
+        if mode not in ('fifo', 'skill'):
+            raise ValueError(f"Unknown matchmaking mode {mode!r}")
+        self.queue_ttl = queue_ttl
+        self.room_ttl = room_ttl
+        self.mode = mode
+        self.skill_window = skill_window
+        # Waiters in this process: username -> [Event set when matched,
+        # number of requests waiting on it]
+        self._waiters = {}
+        self._waiters_lock = threading.Lock()
+
+    @abstractmethod
+    def join(self, username, language=None, level=None):
+        """Queue ``username`` and pair them if a partner is waiting.
+
+        In 'fifo' mode the partner is simply the longest-waiting user. In
+        'skill' mode it is the longest-waiting user with the same
+        ``language`` and ``level``, or failing that anyone who has waited
+        longer than ``skill_window`` seconds.
+
+        Returns ``(queued, room_name)``: ``queued`` is False if the user
+        was already waiting, and ``room_name`` is set if this join matched
+        them.
+        """
+
+    @abstractmethod
+    def room_for(self, username):
+        """The room ``username`` was matched into, or None."""
+
+    @abstractmethod
+    def is_waiting(self, username):
+        """Whether ``username`` is queued and has not expired."""
+
+    @abstractmethod
+    def touch(self, username):
+        """Record that a waiting user is still there."""
+
+    @abstractmethod
+    def reset(self):
+        """Forget every queued user and room."""
+
+    def _waiter(self, username):
+        with self._waiters_lock:
+            waiter = self._waiters.setdefault(
+                username, [threading.Event(), 0])
+            waiter[1] += 1
+            return waiter[0]
+
+    def _release_waiter(self, username, event):
+        """Forget ``event`` once its last waiter gives up unmatched."""
+        with self._waiters_lock:
+            waiter = self._waiters.get(username)
+            if waiter is not None and waiter[0] is event:
+                waiter[1] -= 1
+                if not waiter[1]:
+                    del self._waiters[username]
+
+    def _notify(self, *usernames):
+        with self._waiters_lock:
+            for username in usernames:
+                waiter = self._waiters.pop(username, None)
+                if waiter:
+                    waiter[0].set()
+
+    def wait_for_room(self, username, timeout):
+        """Block until ``username`` is matched or ``timeout`` seconds pass.
+
+        Returns the room name, or None if the user is still waiting (or is
+        not queued at all, in which case it returns immediately).
+        """
+        # Register before checking, so a match in between still wakes us
+        event = self._waiter(username)
+        try:
+            room_name = self.room_for(username)
+            if room_name or not self.is_waiting(username):
+                return room_name
+            self.touch(username)
+            event.wait(timeout)
+            return self.room_for(username)
+        finally:
+            self._release_waiter(username, event)
+
+
+class _Entry:
+    """One waiting user. Entries are left in the deques when they leave and
+    skipped once they reach the front, so removal never scans a queue."""
+
+    __slots__ = ('username', 'key', 'joined_at', 'seen_at', 'active')
+
+    def __init__(self, username, key, now):
+        self.username = username
+        self.key = key
+        self.joined_at = now
+        self.seen_at = now
+        self.active = True
+
+
+class InMemoryMatchmaker(Matchmaker):
+    """Queue and room assignments held in this process.
+
+    Waiting users sit in one arrival-ordered deque plus, for skill mode, a
+    deque per (language, level). A username -> entry dict is the membership
+    index, so joining, matching and leaving are all O(1) amortised.
+    ``rooms`` maps a matched username to its room name. Everything is
+    guarded by ``lock``.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.rooms = {}
+        self.lock = threading.Lock()
+        self._fifo = deque()
+        self._buckets = {}  # (language, level) -> deque of entries
+        self._entries = {}  # username -> waiting entry
+        self._assigned = {}  # username -> time the room was assigned
+        self._next_sweep = 0
+
+    @property
+    def queue(self):
+        """Waiting usernames in arrival order (a copy, for display)."""
+        with self.lock:
+            return [entry.username for entry in self._fifo if entry.active]
+
+    def _fresh(self, entry, now):
+        return now - entry.seen_at <= self.queue_ttl
+
+    def _discard(self, entry):
+        entry.active = False
+        del self._entries[entry.username]
+
+    def _head(self, entries, now):
+        """Oldest live entry of ``entries``, dropping dead ones on the way."""
+        while entries:
+            entry = entries[0]
+            if entry.active and self._fresh(entry, now):
+                return entry
+            if entry.active:
+                self._discard(entry)
+            entries.popleft()
+        return None
+
+    def _sweep(self, now):
+        """Drop expired entries and rooms; runs at most once a second."""
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + 1
+        for entry in [entry for entry in self._entries.values()
+                      if not self._fresh(entry, now)]:
+            self._discard(entry)
+        self._fifo = deque(e for e in self._fifo if e.active)
+        for key in list(self._buckets):
+            bucket = deque(e for e in self._buckets[key] if e.active)
+            if bucket:
+                self._buckets[key] = bucket
+            else:
+                del self._buckets[key]
+        for user in [user for user, at in self._assigned.items()
+                     if now - at > self.room_ttl]:
+            del self._assigned[user]
+            self.rooms.pop(user, None)
+
+    def _pair(self, first, second, now):
+        room_name = make_room_name()
+        for user in (first, second):
+            self.rooms[user] = room_name
+            self._assigned[user] = now
+        return room_name
+
+    def _pair_expired(self, now):
+        """Skill mode fallback: pair the two oldest users once both have
+        waited longer than ``skill_window``. Returns the matched users."""
+        matched = []
+        while True:
+            first = self._head(self._fifo, now)
+            if first is None or now - first.joined_at < self.skill_window:
+                return matched
+            self._fifo.popleft()
+            second = self._head(self._fifo, now)
+            if second is None or now - second.joined_at < self.skill_window:
+                self._fifo.appendleft(first)
+                return matched
+            self._discard(first)
+            self._discard(second)
+            self._pair(first.username, second.username, now)
+            matched += [first.username, second.username]
+
+    def _partner_for(self, entry, now):
+        if self.mode == 'fifo':
+            return self._head(self._fifo, now)
+        partner = self._head(self._buckets.get(entry.key, ()), now)
+        if partner is None:
+            # Nobody with the same preferences; fall back to whoever has
+            # waited out the window, oldest first
+            oldest = self._head(self._fifo, now)
+            if oldest and now - oldest.joined_at >= self.skill_window:
+                partner = oldest
+        return partner
+
+    def join(self, username, language=None, level=None):
+        now = time.time()
+        with self.lock:
+            self._sweep(now)
+            entry = self._entries.get(username)
+            if entry is not None and self._fresh(entry, now):
+                return False, None
+            if entry is not None:  # Expired but not yet swept
+                self._discard(entry)
+            # A new search replaces any room from a previous match
+            self.rooms.pop(username, None)
+            self._assigned.pop(username, None)
+
+            matched = self._pair_expired(now) if self.mode == 'skill' else []
+            entry = _Entry(username, (language, level), now)
+            partner = self._partner_for(entry, now)
+            room_name = None
+            if partner is None:
+                self._entries[username] = entry
+                self._fifo.append(entry)
+                if self.mode == 'skill':
+                    self._buckets.setdefault(entry.key, deque()).append(entry)
+            else:
+                self._discard(partner)
+                room_name = self._pair(partner.username, username, now)
+                matched.append(partner.username)
+        self._notify(*matched)
+        return True, room_name
+
+    def room_for(self, username):
+        with self.lock:
+            assigned = self._assigned.get(username)
+            if assigned is None or time.time() - assigned > self.room_ttl:
+                return None
+            return self.rooms.get(username)
+
+    def is_waiting(self, username):
+        with self.lock:
+            entry = self._entries.get(username)
+            return entry is not None and self._fresh(entry, time.time())
+
+    def touch(self, username):
+        now = time.time()
+        with self.lock:
+            entry = self._entries.get(username)
+            if entry is not None:
+                entry.seen_at = now
+            matched = self._pair_expired(now) if self.mode == 'skill' else []
+        self._notify(*matched)
+
+    def reset(self):
+        with self.lock:
+            self.rooms.clear()
+            self._fifo.clear()
+            self._buckets.clear()
+            self._entries.clear()
+            self._assigned.clear()
+
+
+class SQLiteMatchmaker(Matchmaker):
+    """Queue and room assignments shared through a SQLite file.
+
+    Pairing runs inside ``BEGIN IMMEDIATE``, so across all processes only
+    one join at a time can pop users. Membership and room lookups go
+    through primary-key indexes. Waiters in the process that made a match
+    are woken at once; waiters in other processes notice within
+    ``poll_interval`` seconds.
+    """
+
+    def __init__(self, path, poll_interval=0.2, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        with self._transaction() as conn:
+            columns = {row[1] for row in
+                       conn.execute('PRAGMA table_info(match_queue)')}
+            if columns and 'joined_at' not in columns:
+                # Created before skill matching; the rows are short-lived,
+                # so start the queue afresh rather than migrate them
+                conn.execute('DROP TABLE match_queue')
+            conn.execute('CREATE TABLE IF NOT EXISTS match_queue ('
+                         'seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                         'username TEXT NOT NULL UNIQUE, '
+                         'language TEXT, '
+                         'level TEXT, '
+                         'joined_at REAL NOT NULL, '
+                         'seen_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_match_queue_bucket '
+                         'ON match_queue (language, level, seq)')
+            conn.execute('CREATE TABLE IF NOT EXISTS match_rooms ('
+                         'username TEXT PRIMARY KEY, '
+                         'room_name TEXT NOT NULL, '
+                         'assigned_at REAL NOT NULL)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        # Never reuse a connection inherited across fork()
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connect())
+
+    def _pair(self, conn, first, second, now):
+        room_name = make_room_name()
+        conn.execute('DELETE FROM match_queue WHERE username IN (?, ?)',
+                     (first, second))
+        conn.executemany('INSERT OR REPLACE INTO match_rooms '
+                         '(username, room_name, assigned_at) '
+                         'VALUES (?, ?, ?)',
+                         [(first, room_name, now), (second, room_name, now)])
+        return room_name
+
+    def _pair_expired(self, conn, now):
+        """Skill mode fallback: pair the oldest users past the window."""
+        matched = []
+        while True:
+            pair = conn.execute('SELECT username FROM match_queue '
+                                'WHERE joined_at <= ? AND seen_at >= ? '
+                                'ORDER BY seq LIMIT 2',
+                                (now - self.skill_window,
+                                 now - self.queue_ttl)).fetchall()
+            if len(pair) < 2:
+                return matched
+            (first,), (second,) = pair
+            self._pair(conn, first, second, now)
+            matched += [first, second]
+
+    def _partner_for(self, conn, language, level, now):
+        if self.mode == 'fifo':
+            row = conn.execute('SELECT username FROM match_queue '
+                               'ORDER BY seq LIMIT 1').fetchone()
+        else:
+            row = conn.execute('SELECT username FROM match_queue '
+                               'WHERE language IS ? AND level IS ? '
+                               'ORDER BY seq LIMIT 1',
+                               (language, level)).fetchone()
+            if row is None:
+                row = conn.execute('SELECT username FROM match_queue '
+                                   'WHERE joined_at <= ? '
+                                   'ORDER BY seq LIMIT 1',
+                                   (now - self.skill_window,)).fetchone()
+        return row[0] if row else None
+
+    def join(self, username, language=None, level=None):
+        now = time.time()
+        room_name = None
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM match_queue WHERE seen_at < ?',
+                         (now - self.queue_ttl,))
+            conn.execute('DELETE FROM match_rooms WHERE assigned_at < ?',
+                         (now - self.room_ttl,))
+            if conn.execute('SELECT 1 FROM match_queue WHERE username = ?',
+                            (username,)).fetchone():
+                return False, None
+            conn.execute('DELETE FROM match_rooms WHERE username = ?',
+                         (username,))
+
+            matched = (self._pair_expired(conn, now)
+                       if self.mode == 'skill' else [])
+            partner = self._partner_for(conn, language, level, now)
+            if partner is None:
+                conn.execute('INSERT INTO match_queue (username, language, '
+                             'level, joined_at, seen_at) '
+                             'VALUES (?, ?, ?, ?, ?)',
+                             (username, language, level, now, now))
+            else:
+                room_name = self._pair(conn, partner, username, now)
+                matched.append(partner)
+        self._notify(*matched)
+        return True, room_name
+
+    def room_for(self, username):
+        row = self._connect().execute(
+            'SELECT room_name FROM match_rooms WHERE username = ? '
+            'AND assigned_at >= ?',
+            (username, time.time() - self.room_ttl)).fetchone()
+        return row[0] if row else None
+
+    def is_waiting(self, username):
+        return self._connect().execute(
+            'SELECT 1 FROM match_queue WHERE username = ? AND seen_at >= ?',
+            (username, time.time() - self.queue_ttl)).fetchone() is not None
+
+    def touch(self, username):
+        now = time.time()
+        if self.mode == 'fifo':
+            self._connect().execute(
+                'UPDATE match_queue SET seen_at = ? WHERE username = ?',
+                (now, username))
+            return
+        with self._transaction() as conn:
+            conn.execute('UPDATE match_queue SET seen_at = ? '
+                         'WHERE username = ?', (now, username))
+            matched = self._pair_expired(conn, now)
+        self._notify(*matched)
+
+    def reset(self):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM match_queue')
+            conn.execute('DELETE FROM match_rooms')
+
+    def wait_for_room(self, username, timeout):
+        deadline = time.monotonic() + timeout
+        # Woken early if this process makes the match
+        event = self._waiter(username)
+        try:
+            room_name = self.room_for(username)
+            while room_name is None and self.is_waiting(username):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.touch(username)
+                event.wait(min(self.poll_interval, remaining))
+                room_name = self.room_for(username)
+            return room_name
+        finally:
+            self._release_waiter(username, event)
+
+
+class _Transaction:
+    """``BEGIN IMMEDIATE`` ... ``COMMIT``, rolling back on error."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+def create_matchmaker(config):
+    """Build the backend named by MATCHMAKING_BACKEND ('memory'/'sqlite')."""
+    options = {'queue_ttl': config.get('MATCH_QUEUE_TTL', DEFAULT_QUEUE_TTL),
+               'room_ttl': config.get('MATCH_ROOM_TTL', DEFAULT_ROOM_TTL),
+               'mode': config.get('MATCHMAKING_MODE', 'fifo'),
+               'skill_window': config.get('MATCH_SKILL_WINDOW',
+                                          DEFAULT_SKILL_WINDOW)}
+    backend = config.get('MATCHMAKING_BACKEND', 'memory')
+    if backend == 'sqlite':
+        return SQLiteMatchmaker(config['MATCHMAKING_DB'], **options)
+    if backend == 'memory':
+        return InMemoryMatchmaker(**options)
+    raise ValueError(f"Unknown MATCHMAKING_BACKEND {backend!r}")
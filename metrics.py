@@ -0,0 +1,493 @@
+'''
+Per-request metrics in Prometheus text format, and a slow-request profiler.
+
+RequestMetrics hooks a Flask app so every request records, labelled by its
+route rule (not its URL, to keep the number of series bounded):
+
+* http_requests_total{route, method, status}
+* http_request_duration_seconds{route, method}, a histogram;
+* http_request_sql_queries{route} and http_request_sql_seconds{route}, the
+  number and time of the SQL statements the request ran.
+
+Calls to other services wrapped in ``outbound(service)`` (OpenAI, JDoodle)
+are timed in outbound_request_duration_seconds{service, outcome}, and the
+time also counts towards the request that made them.
+
+Requests slower than ``slow_seconds`` are logged with their SQL and
+outbound share, except those of views marked ``@long_running`` (streams
+and long-polls, which are slow by design). With ``profile=True`` a
+background thread samples the stack of every request in flight every
+``profile_interval`` seconds; the samples of a slow request are kept as
+folded stacks (the input format of flamegraph.pl) in ``slow_requests``.
+Sampling costs a little CPU on every request, so it is off by default.
+
+Everything lives in a Registry, whose render() is what /metrics serves.
+Other components publish their own counters through Registry.collect().
+/metrics and /debug/slow_requests answer only requests that carry the
+configured token (see ``authorized``). The peer address is no test: behind
+a reverse proxy on the same host every request comes from loopback.
+'''
+import _thread
+import contextvars
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter as Tally, deque
+from contextlib import contextmanager
+
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+DEFAULT_SLOW_SECONDS = 1.0
+DEFAULT_PROFILE_INTERVAL = 0.005
+DEFAULT_KEEP_SLOW = 20
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return (str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{_escape(value)}"'
+                     for key, value in labels.items())
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.type = 'counter'
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labels, key)), value
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.type = 'histogram'
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for n, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[n] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            return series[-1] if series else 0
+
+    def samples(self):
+        with self._lock:
+            snapshot = {key: list(series)
+                        for key, series in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield (self.name + '_bucket',
+                       dict(labels, le=_format_value(float(bound))),
+                       cumulative)
+            yield self.name + '_sum', labels, series[-2]
+            yield self.name + '_count', labels, series[-1]
+
+
+class Registry:
+    """A set of metrics rendered together in Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collect(self, collector):
+        """Add ``collector()``'s metrics to every render.
+
+        It returns ``(name, type, help, samples)`` tuples, ``samples``
+        being a list of ``(labels, value)`` pairs. A failing collector is
+        logged and skipped.
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} '
+                             f'{_format_value(value)}')
+        for collector in self._collectors:
+            try:
+                collected = list(collector())
+            except Exception:
+                logger.exception('Metrics collector %r failed', collector)
+                continue
+            for name, kind, help, samples in collected:
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(labels)} '
+                                 f'{_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+OUTBOUND_SECONDS = registry.histogram(
+    'outbound_request_duration_seconds',
+    'Time spent in calls to other services.', ('service', 'outcome'))
+
+
+class RequestStats:
+    __slots__ = ('started', 'sql_queries', 'sql_seconds', 'outbound_calls',
+                 'outbound_seconds', 'status')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.outbound_calls = 0
+        self.outbound_seconds = 0.0
+        self.status = None
+
+
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+def current_stats():
+    """The RequestStats of the request being handled here, if any."""
+    return _current.get()
+
+
+@contextmanager
+def outbound(service):
+    """Time a call to ``service``:
+
+        with outbound('openai'):
+            response = openai.ChatCompletion.create(...)
+    """
+    start = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except GeneratorExit:
+        outcome = 'closed'  # A stream the caller stopped reading
+        raise
+    except BaseException:
+        outcome = 'error'
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        OUTBOUND_SECONDS.observe(seconds, service=service, outcome=outcome)
+        stats = _current.get()
+        if stats is not None:
+            stats.outbound_calls += 1
+            stats.outbound_seconds += seconds
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('metrics_query_start', []).append(
+        time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    starts = conn.info.get('metrics_query_start')
+    if not starts:
+        return
+    seconds = time.perf_counter() - starts.pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.sql_queries += 1
+        stats.sql_seconds += seconds
+
+
+def _handle_error(context):
+    starts = context.connection.info.get('metrics_query_start') \
+        if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+_listening = False
+_listening_lock = threading.Lock()
+
+
+def _listen_for_queries():
+    # Once per process, for every engine
+    global _listening
+    with _listening_lock:
+        if _listening:
+            return
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+        _listening = True
+
+
+def fold(frame, max_depth=64):
+    """A stack as one folded line, outermost frame first."""
+    names = []
+    line = frame.f_lineno if frame is not None else 0
+    while frame is not None and len(names) < max_depth:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    if names:
+        names[0] += f':{line}'  # Where in the innermost function
+    return ';'.join(reversed(names))
+
+
+def _os_threads():
+    """``(allocate_lock, get_ident, start_new_thread, sleep, getcurrent)``
+    for the profiler's sampling thread, which must be an OS thread.
+
+    Under gevent's monkey patching the threading and time modules act on
+    greenlets, so the originals gevent saved are used instead, and requests
+    are told apart by greenlet (``getcurrent``), since they share one OS
+    thread. Without it ``getcurrent`` is None.
+    """
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is not None and monkey.is_module_patched('threading'):
+        from greenlet import getcurrent
+        allocate_lock, get_ident, start_new_thread = monkey.get_original(
+            '_thread', ['allocate_lock', 'get_ident', 'start_new_thread'])
+        sleep = monkey.get_original('time', 'sleep')
+        return allocate_lock, get_ident, start_new_thread, sleep, getcurrent
+    return (_thread.allocate_lock, _thread.get_ident,
+            _thread.start_new_thread, time.sleep, None)
+
+
+class SamplingProfiler:
+    """Samples the stacks of the requests in flight.
+
+    Requests register with begin() and collect their samples with end();
+    a daemon OS thread wakes every ``interval`` seconds while any are
+    registered. Under gevent a request is a greenlet: one that is switched
+    out is sampled through its ``gr_frame``, and the one running through
+    its OS thread's frame, which the sampler can read even while that
+    greenlet holds the CPU.
+    """
+
+    def __init__(self, interval=DEFAULT_PROFILE_INTERVAL, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        (allocate_lock, self._get_ident, self._start_thread, self._sleep,
+         self._getcurrent) = _os_threads()
+        # request (thread id, or greenlet) -> (thread id, greenlet, Tally)
+        self._requests = {}
+        self._lock = allocate_lock()
+        self._wake = allocate_lock()  # Held while the sampler may sleep
+        self._wake.acquire()
+        self._started = False
+
+    def _current(self):
+        if self._getcurrent is None:
+            return self._get_ident(), None
+        green = self._getcurrent()
+        return green, green
+
+    def begin(self):
+        key, green = self._current()
+        with self._lock:
+            self._requests[key] = (self._get_ident(), green, Tally())
+            if not self._started:
+                self._started = True
+                self._start_thread(self._run, ())
+        try:
+            self._wake.release()
+        except RuntimeError:
+            pass  # Already awake
+
+    def end(self):
+        key, _ = self._current()
+        with self._lock:
+            entry = self._requests.pop(key, None)
+        return entry[2] if entry is not None else None
+
+    def _run(self):
+        me = self._get_ident()
+        while True:
+            with self._lock:
+                idle = not self._requests
+            if idle:
+                self._wake.acquire()
+                continue
+            self._sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread, green, stacks in self._requests.values():
+                    # A switched out greenlet keeps its frame; the running
+                    # one (gr_frame None) is its thread's current frame
+                    frame = green.gr_frame if green is not None else None
+                    if frame is None and thread != me:
+                        frame = frames.get(thread)
+                    if frame is not None:
+                        stacks[fold(frame, self.max_depth)] += 1
+
+
+def long_running(view):
+    """Mark a view whose requests are meant to stay open (a stream or a
+    long-poll): they are still timed, but never reported as slow. Put it
+    directly under ``@app.route``."""
+    view.long_running = True
+    return view
+
+
+def authorized(token):
+    """Whether the current request sends ``token`` as its bearer token.
+
+    Always False when no token is configured, which turns the routes off.
+    """
+    scheme, _, value = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and \
+        hmac.compare_digest(value.strip().encode(), token.encode())
+
+
+class RequestMetrics:
+    """Flask hooks recording every request into ``registry``."""
+
+    def __init__(self, app=None, registry=registry,
+                 slow_seconds=DEFAULT_SLOW_SECONDS, profile=False,
+                 profile_interval=DEFAULT_PROFILE_INTERVAL,
+                 keep_slow=DEFAULT_KEEP_SLOW):
+        self.registry = registry
+        self.slow_seconds = slow_seconds
+        self.profiler = SamplingProfiler(profile_interval) if profile \
+            else None
+        self.slow_requests = deque(maxlen=keep_slow)
+        self.requests = registry.counter(
+            'http_requests_total', 'Requests handled.',
+            ('route', 'method', 'status'))
+        self.duration = registry.histogram(
+            'http_request_duration_seconds',
+            'Time from the start of a request to the end of its response.',
+            ('route', 'method'))
+        self.sql_queries = registry.histogram(
+            'http_request_sql_queries', 'SQL statements run per request.',
+            ('route',), QUERY_BUCKETS)
+        self.sql_seconds = registry.histogram(
+            'http_request_sql_seconds', 'Time spent in SQL per request.',
+            ('route',))
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        _listen_for_queries()
+        app.before_request(self._before)
+        app.after_request(self._after)
+        # Teardown runs after a streamed response has been sent in full
+        app.teardown_request(self._teardown)
+
+    def _before(self):
+        request.environ['metrics.token'] = _current.set(RequestStats())
+        if self.profiler is not None:
+            self.profiler.begin()
+
+    def _after(self, response):
+        stats = _current.get()
+        if stats is not None:
+            stats.status = response.status_code
+        return response
+
+    def _teardown(self, error=None):
+        token = request.environ.pop('metrics.token', None)
+        stats = _current.get()
+        if token is None or stats is None:
+            return
+        _current.reset(token)
+        stacks = self.profiler.end() if self.profiler is not None else None
+        seconds = time.perf_counter() - stats.started
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        status = stats.status if error is None else 500
+        self.requests.inc(route=route, method=request.method,
+                          status=str(status))
+        self.duration.observe(seconds, route=route, method=request.method)
+        self.sql_queries.observe(stats.sql_queries, route=route)
+        self.sql_seconds.observe(stats.sql_seconds, route=route)
+        view = current_app.view_functions.get(request.endpoint)
+        if seconds >= self.slow_seconds and \
+                not getattr(view, 'long_running', False):
+            self._slow(route, status, seconds, stats, stacks)
+
+    def _slow(self, route, status, seconds, stats, stacks):
+        record = {
+            'route': route,
+            'method': request.method,
+            'status': status,
+            'duration_ms': round(seconds * 1000, 1),
+            'sql_queries': stats.sql_queries,
+            'sql_ms': round(stats.sql_seconds * 1000, 1),
+            'outbound_calls': stats.outbound_calls,
+            'outbound_ms': round(stats.outbound_seconds * 1000, 1),
+            'at': time.time(),
+        }
+        logger.warning('Slow request %s %s: %.0f ms (%d queries, %.0f ms '
+                       'SQL, %.0f ms outbound)', request.method, route,
+                       record['duration_ms'], record['sql_queries'],
+                       record['sql_ms'], record['outbound_ms'],
+                       extra=record)
+        if stacks:
+            record['profile'] = [f'{stack} {count}'
+                                 for stack, count in stacks.most_common()]
+        self.slow_requests.append(record)
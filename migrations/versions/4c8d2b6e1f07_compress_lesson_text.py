@@ -0,0 +1,84 @@
+"""Store lesson content and quizzes as compressed binary
+
+Revision ID: 4c8d2b6e1f07
+Revises: 9d41c7e2a5f0
+Create Date: 2026-10-18 16:00:00.000000
+
+lessons.content, lessons.quiz and quiz.questions become binary columns
+holding the CompressedText format (see compressed_text.py). Existing rows
+are plain UTF-8, which that format reads as is, so they are left alone and
+only new writes are compressed. The downgrade decompresses every row
+before turning the columns back into Text.
+"""
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c8d2b6e1f07'
+down_revision = '9d41c7e2a5f0'
+branch_labels = None
+depends_on = None
+
+COLUMNS = (('lessons', 'content', False), ('lessons', 'quiz', True),
+           ('quiz', 'questions', False))
+
+
+def existing_columns(binary):
+    """The COLUMNS present in the database with (or without) binary type."""
+    inspector = sa.inspect(op.get_bind())
+    found = []
+    for table, column, nullable in COLUMNS:
+        if not inspector.has_table(table):
+            continue
+        types = {info['name']: info['type']
+                 for info in inspector.get_columns(table)}
+        if isinstance(types.get(column), sa.LargeBinary) == binary:
+            found.append((table, column, nullable))
+    return found
+
+
+def upgrade():
+    for table, column, nullable in existing_columns(binary=False):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                column, type_=sa.LargeBinary(), existing_type=sa.Text(),
+                existing_nullable=nullable,
+                postgresql_using=f"convert_to({column}, 'UTF8')")
+
+
+def decompress(value):
+    # The CompressedText format as of this revision
+    if isinstance(value, str):
+        return value
+    value = bytes(value)
+    if not value.startswith(b'\x00'):
+        return value.decode('utf-8')
+    tag, packed = value[1:2], value[2:]
+    if tag == b'z':
+        return zlib.decompress(packed).decode('utf-8')
+    if tag == b's':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(packed).decode('utf-8')
+    return packed.decode('utf-8')
+
+
+def downgrade():
+    connection = op.get_bind()
+    for table, column, nullable in existing_columns(binary=True):
+        rows = connection.execute(sa.text(
+            f'SELECT id, {column} FROM {table} '
+            f'WHERE {column} IS NOT NULL')).all()
+        update = sa.text(f'UPDATE {table} SET {column} = :value '
+                         'WHERE id = :id').bindparams(
+            sa.bindparam('value', type_=sa.LargeBinary()))
+        for row_id, value in rows:
+            connection.execute(update, {
+                'id': row_id, 'value': decompress(value).encode('utf-8')})
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                column, type_=sa.Text(), existing_type=sa.LargeBinary(),
+                existing_nullable=nullable,
+                postgresql_using=f"convert_from({column}, 'UTF8')")
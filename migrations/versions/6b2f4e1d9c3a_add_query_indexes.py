@@ -0,0 +1,145 @@
+"""Add indexes for course listings and foreign keys
+
+Revision ID: 6b2f4e1d9c3a
+Revises:
+Create Date: 2026-10-18 12:00:00.000000
+
+Tables created by db.create_all() before these indexes were in the models
+never got them. This revision adds whichever are missing.
+
+The app used to run db.create_all() whenever it was imported; the schema
+now comes from `flask db upgrade` alone. On a new database this revision
+therefore first creates the tables as they were before it, and leaves any
+that already exist as they are. The downgrade drops only the indexes, as
+it cannot tell which tables were created here.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6b2f4e1d9c3a'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_courses_user_id_completed', 'courses', ['user_id', 'completed']),
+    ('ix_courses_user_id_title', 'courses', ['user_id', 'title']),
+    ('ix_courses_user_id_description', 'courses', ['user_id', 'description']),
+    ('ix_modules_course_id', 'modules', ['course_id']),
+    ('ix_lessons_module_id', 'lessons', ['module_id']),
+    ('ix_quiz_course_id', 'quiz', ['course_id']),
+    ('ix_generation_jobs_status_heartbeat_at', 'generation_jobs',
+     ['status', 'heartbeat_at']),
+]
+
+
+def existing_indexes(table):
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return None
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def create_missing_tables():
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('user'):
+        op.create_table(
+            'user',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('username', sa.String(length=20), nullable=False),
+            sa.Column('email', sa.String(length=120), nullable=False),
+            sa.Column('password_hash', sa.String(length=60), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('email'),
+            sa.UniqueConstraint('username'))
+    if not inspector.has_table('courses'):
+        op.create_table(
+            'courses',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('title', sa.String(length=50), nullable=False),
+            sa.Column('description', sa.String(length=250), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('enrolled', sa.Boolean(), nullable=True),
+            sa.Column('completed', sa.Boolean(), nullable=True),
+            sa.Column('completed_at', sa.DateTime(), nullable=True),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'))
+    if not inspector.has_table('modules'):
+        op.create_table(
+            'modules',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('title', sa.String(length=50), nullable=False),
+            sa.Column('description', sa.String(length=250), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('course_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['course_id'], ['courses.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('description'),
+            sa.UniqueConstraint('title'))
+    if not inspector.has_table('lessons'):
+        op.create_table(
+            'lessons',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('title', sa.String(length=50), nullable=False),
+            sa.Column('content', sa.Text(), nullable=False),
+            sa.Column('quiz', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('module_id', sa.Integer(), nullable=False),
+            sa.Column('is_completed', sa.Boolean(), nullable=True),
+            sa.Column('completion_date', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['module_id'], ['modules.id']),
+            sa.PrimaryKeyConstraint('id'))
+    if not inspector.has_table('quiz'):
+        op.create_table(
+            'quiz',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('course_id', sa.Integer(), nullable=False),
+            sa.Column('questions', sa.Text(), nullable=False),
+            sa.ForeignKeyConstraint(['course_id'], ['courses.id']),
+            sa.PrimaryKeyConstraint('id'))
+    if not inspector.has_table('generation_jobs'):
+        op.create_table(
+            'generation_jobs',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('title', sa.String(length=50), nullable=False),
+            sa.Column('description', sa.String(length=250), nullable=False),
+            sa.Column('level', sa.String(length=20), nullable=False),
+            sa.Column('active_key', sa.String(length=64), nullable=True),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('progress', sa.Text(), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('course_id', sa.Integer(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['course_id'], ['courses.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('active_key'))
+    if not inspector.has_table('cache_versions'):
+        op.create_table(
+            'cache_versions',
+            sa.Column('key', sa.String(length=64), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('key'))
+
+
+def upgrade():
+    create_missing_tables()
+    for name, table, columns in INDEXES:
+        existing = existing_indexes(table)
+        if existing is not None and name not in existing:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        existing = existing_indexes(table)
+        if existing is not None and name in existing:
+            op.drop_index(name, table_name=table)
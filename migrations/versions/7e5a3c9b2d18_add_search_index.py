@@ -0,0 +1,92 @@
+"""Add the full-text search index
+
+Revision ID: 7e5a3c9b2d18
+Revises: 4c8d2b6e1f07
+Create Date: 2026-10-18 17:00:00.000000
+
+On SQLite builds with FTS5, creates the search_index virtual table (see
+models.py and search_index.py) and indexes the existing courses, modules
+and lessons. Other databases search with the in-memory index and need no
+schema.
+"""
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e5a3c9b2d18'
+down_revision = '4c8d2b6e1f07'
+branch_labels = None
+depends_on = None
+
+CREATE = ("CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+          "title, body, owner, kind UNINDEXED, parent_id UNINDEXED, "
+          "tokenize = 'porter unicode61')")
+# rowid is id * 3 plus 0 for a course, 1 for a module and 2 for a lesson
+INSERT_COURSES = (
+    "INSERT INTO search_index (rowid, title, body, owner, kind, parent_id) "
+    "SELECT id * 3, title, description, 'u' || user_id, 'course', id "
+    "FROM courses")
+INSERT_MODULES = (
+    "INSERT INTO search_index (rowid, title, body, owner, kind, parent_id) "
+    "SELECT modules.id * 3 + 1, modules.title, modules.description, "
+    "'u' || courses.user_id, 'module', modules.course_id "
+    "FROM modules JOIN courses ON courses.id = modules.course_id")
+SELECT_LESSONS = (
+    "SELECT lessons.id, lessons.title, lessons.content, lessons.module_id, "
+    "courses.user_id FROM lessons "
+    "JOIN modules ON modules.id = lessons.module_id "
+    "JOIN courses ON courses.id = modules.course_id")
+
+
+def decompress(value):
+    # The CompressedText format as of this revision
+    if isinstance(value, str):
+        return value
+    value = bytes(value)
+    if not value.startswith(b'\x00'):
+        return value.decode('utf-8')
+    tag, packed = value[1:2], value[2:]
+    if tag == b'z':
+        return zlib.decompress(packed).decode('utf-8')
+    if tag == b's':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(packed).decode('utf-8')
+    return packed.decode('utf-8')
+
+
+def has_fts5(connection):
+    if connection.dialect.name != 'sqlite':
+        return False
+    options = connection.exec_driver_sql(
+        'PRAGMA compile_options').scalars().all()
+    return 'ENABLE_FTS5' in options
+
+
+def upgrade():
+    connection = op.get_bind()
+    if not has_fts5(connection) or \
+            sa.inspect(connection).has_table('search_index'):
+        return
+    op.execute(CREATE)
+    op.execute(INSERT_COURSES)
+    op.execute(INSERT_MODULES)
+    # Lesson bodies may be compressed, so they are decoded here
+    rows = [{'rowid': lesson_id * 3 + 2, 'title': title,
+             'body': decompress(content), 'owner': f'u{user_id}',
+             'parent_id': module_id}
+            for lesson_id, title, content, module_id, user_id
+            in connection.execute(sa.text(SELECT_LESSONS))]
+    if rows:
+        connection.execute(sa.text(
+            "INSERT INTO search_index "
+            "(rowid, title, body, owner, kind, parent_id) "
+            "VALUES (:rowid, :title, :body, :owner, 'lesson', :parent_id)"),
+            rows)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS search_index')
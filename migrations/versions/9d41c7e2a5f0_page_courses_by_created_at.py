@@ -0,0 +1,50 @@
+"""Extend the course listing index for keyset pagination
+
+Revision ID: 9d41c7e2a5f0
+Revises: 6b2f4e1d9c3a
+Create Date: 2026-10-18 14:00:00.000000
+
+Course listings are ordered and paged by (created_at, id), so the
+(user_id, completed) index is replaced by one that continues with those
+columns and serves the filter, the order and the page boundary at once.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d41c7e2a5f0'
+down_revision = '6b2f4e1d9c3a'
+branch_labels = None
+depends_on = None
+
+OLD = ('ix_courses_user_id_completed', ['user_id', 'completed'])
+NEW = ('ix_courses_user_id_completed_created_at',
+       ['user_id', 'completed', 'created_at', 'id'])
+
+
+def existing_indexes():
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('courses'):
+        return None
+    return {index['name'] for index in inspector.get_indexes('courses')}
+
+
+def upgrade():
+    existing = existing_indexes()
+    if existing is None:
+        return
+    if NEW[0] not in existing:
+        op.create_index(NEW[0], 'courses', NEW[1])
+    if OLD[0] in existing:
+        op.drop_index(OLD[0], table_name='courses')
+
+
+def downgrade():
+    existing = existing_indexes()
+    if existing is None:
+        return
+    if OLD[0] not in existing:
+        op.create_index(OLD[0], 'courses', OLD[1])
+    if NEW[0] in existing:
+        op.drop_index(NEW[0], table_name='courses')
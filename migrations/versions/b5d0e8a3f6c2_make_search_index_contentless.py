@@ -0,0 +1,110 @@
+"""Make the full-text search index contentless
+
+Revision ID: b5d0e8a3f6c2
+Revises: 7e5a3c9b2d18
+Create Date: 2026-10-18 21:00:00.000000
+
+search_index kept its own uncompressed copy of every title, description
+and lesson body. It is recreated as a contentless FTS5 table, which holds
+only the index, and refilled here with each word prefixed by its owner's
+id, as search_index.py writes and later removes them. Downgrading recreates the previous
+table empty, for the previous release's `flask rebuild-search` to fill.
+"""
+import re
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d0e8a3f6c2'
+down_revision = '7e5a3c9b2d18'
+branch_labels = None
+depends_on = None
+
+CREATE = ("CREATE VIRTUAL TABLE search_index USING fts5("
+          "title, body, content = '', tokenize = 'porter unicode61')")
+# id, owner, title and body of every course, module and lesson; rowid is
+# id * 3 plus 0 for a course, 1 for a module and 2 for a lesson
+SELECTS = (
+    (0, "SELECT id, user_id, title, description FROM courses"),
+    (1, "SELECT modules.id, courses.user_id, modules.title, "
+        "modules.description FROM modules "
+        "JOIN courses ON courses.id = modules.course_id"),
+    (2, "SELECT lessons.id, courses.user_id, lessons.title, "
+        "lessons.content FROM lessons "
+        "JOIN modules ON modules.id = lessons.module_id "
+        "JOIN courses ON courses.id = modules.course_id"),
+)
+INSERT = ("INSERT INTO search_index (rowid, title, body) "
+          "VALUES (:rowid, :title, :body)")
+BATCH = 5000
+# As FTS5's unicode61 tokenizer splits
+WORD = re.compile(r'[^\W_]+')
+CREATE_PREVIOUS = (
+    "CREATE VIRTUAL TABLE search_index USING fts5("
+    "title, body, owner, kind UNINDEXED, parent_id UNINDEXED, "
+    "tokenize = 'porter unicode61')")
+
+
+def decompress(value):
+    # The CompressedText format as of this revision
+    if isinstance(value, str):
+        return value
+    value = bytes(value)
+    if not value.startswith(b'\x00'):
+        return value.decode('utf-8')
+    tag, packed = value[1:2], value[2:]
+    if tag == b'z':
+        return zlib.decompress(packed).decode('utf-8')
+    if tag == b's':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(packed).decode('utf-8')
+    return packed.decode('utf-8')
+
+
+def owned_words(owner, value):
+    # "12zgraph" for the word "graph" in user 12's text
+    return ' '.join(f'{owner}z{word}'
+                    for word in WORD.findall((value or '').lower()))
+
+
+def fill(connection):
+    for kind, select in SELECTS:
+        batch = []
+        for object_id, owner, title, body in connection.execute(
+                sa.text(select)):
+            batch.append({'rowid': object_id * 3 + kind,
+                          'title': owned_words(owner, title),
+                          'body': owned_words(owner, decompress(body))})
+            if len(batch) >= BATCH:
+                connection.execute(sa.text(INSERT), batch)
+                batch = []
+        if batch:
+            connection.execute(sa.text(INSERT), batch)
+
+
+def has_fts5(connection):
+    if connection.dialect.name != 'sqlite':
+        return False
+    options = connection.exec_driver_sql(
+        'PRAGMA compile_options').scalars().all()
+    return 'ENABLE_FTS5' in options
+
+
+def upgrade():
+    connection = op.get_bind()
+    if not has_fts5(connection):
+        return
+    op.execute('DROP TABLE IF EXISTS search_index')
+    op.execute(CREATE)
+    fill(connection)
+
+
+def downgrade():
+    connection = op.get_bind()
+    if not has_fts5(connection):
+        return
+    op.execute('DROP TABLE IF EXISTS search_index')
+    op.execute(CREATE_PREVIOUS)
@@ -0,0 +1,42 @@
+"""Backfill courses.created_at and make it NOT NULL
+
+Revision ID: c3f7a1e9d5b4
+Revises: b5d0e8a3f6c2
+Create Date: 2026-10-18 22:00:00.000000
+
+Course listings page through (created_at, id), and their cursor holds the
+created_at of the last row, so a course without one broke the listing.
+Courses from before the column had a default get BACKFILL, which sorts
+them after every dated course and among themselves by id, and the column
+becomes NOT NULL. The downgrade allows NULL again but keeps the values.
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f7a1e9d5b4'
+down_revision = 'b5d0e8a3f6c2'
+branch_labels = None
+depends_on = None
+
+BACKFILL = datetime(1970, 1, 1)
+
+
+def upgrade():
+    op.get_bind().execute(
+        sa.text('UPDATE courses SET created_at = :created_at '
+                'WHERE created_at IS NULL').bindparams(
+            sa.bindparam('created_at', type_=sa.DateTime())),
+        {'created_at': BACKFILL})
+    with op.batch_alter_table('courses') as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(),
+                              nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('courses') as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(),
+                              nullable=True)
@@ -1,7 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
 from flask_login import UserMixin
 from datetime import datetime
 
+from compressed_text import CompressedText
+
 db = SQLAlchemy()
 
 # Define your models
@@ -26,13 +29,24 @@ class Course(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(50), nullable=False, unique=False)
     description = db.Column(db.String(250), nullable=False, unique=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow)
     modules = db.relationship('Module', backref='course', lazy=True, cascade="all, delete-orphan")
     enrolled = db.Column(db.Boolean, default=False)
     completed = db.Column(db.Boolean, default=False)  # Tracking course completion 
     completed_at = db.Column(db.DateTime, nullable=True)  # For tracking date of course completion 
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     quizzes = db.relationship('Quiz', backref='course', lazy=True)
+
+    # Course listings filter on (user_id, completed) and page through
+    # (created_at, id); generate_course looks for an existing title or
+    # description among the user's courses
+    __table_args__ = (
+        db.Index('ix_courses_user_id_completed_created_at',
+                 'user_id', 'completed', 'created_at', 'id'),
+        db.Index('ix_courses_user_id_title', 'user_id', 'title'),
+        db.Index('ix_courses_user_id_description', 'user_id', 'description'),
+    )
     
     def __repr__(self):
         return f"Course('{self.title}', '{self.description}')"
@@ -43,7 +57,8 @@ class Module(db.Model):
     title = db.Column(db.String(50), nullable=False, unique=True)
     description = db.Column(db.String(250), nullable=False, unique=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'),
+                          nullable=False, index=True)
     lessons = db.relationship('Lesson', backref='module', lazy=True, cascade="all, delete-orphan")
     
     def __repr__(self):
@@ -53,10 +68,14 @@ class Lesson(db.Model):
     __tablename__ = 'lessons'
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(50), nullable=False, unique=False)
-    content = db.Column(db.Text, nullable=False)
-    quiz = db.Column(db.Text, nullable=True)  # Assuming quiz is stored as JSON or similar
+    # The bodies are compressed (see compressed_text.py) and only loaded when
+    # read, so listing a module's lessons fetches just the small columns
+    content = db.deferred(db.Column(CompressedText, nullable=False))
+    # Assuming quiz is stored as JSON or similar
+    quiz = db.deferred(db.Column(CompressedText, nullable=True))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    module_id = db.Column(db.Integer, db.ForeignKey('modules.id'), nullable=False)
+    module_id = db.Column(db.Integer, db.ForeignKey('modules.id'),
+                          nullable=False, index=True)
 
     # Additional fields for completion status
     is_completed = db.Column(db.Boolean, default=False)
@@ -67,8 +86,77 @@ class Lesson(db.Model):
 
 class Quiz(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
-    questions = db.Column(db.Text, nullable=False)  # Store questions and answers in JSON format
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'),
+                          nullable=False, index=True)
+    # Store questions and answers in JSON format, compressed
+    questions = db.deferred(db.Column(CompressedText, nullable=False))
+
+    def __repr__(self):
+        return f"Quiz('{self.course_id}')"
+
+
+class GenerationJob(db.Model):
+    __tablename__ = 'generation_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    title = db.Column(db.String(50), nullable=False)
+    description = db.Column(db.String(250), nullable=False)
+    level = db.Column(db.String(20), nullable=False)
+    # Only set while queued/running, so two identical submissions collide
+    active_key = db.Column(db.String(64), unique=True, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    # JSON list, one entry per module
+    progress = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'),
+                          nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    # Refreshed while a worker holds the job
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # JobRunner.recover looks for queued jobs and stale running ones
+    __table_args__ = (
+        db.Index('ix_generation_jobs_status_heartbeat_at',
+                 'status', 'heartbeat_at'),
+    )
 
     def __repr__(self):
-        return f"Quiz('{self.course_id}')"
\ No newline at end of file
+        return f"GenerationJob('{self.title}', '{self.status}')"
+
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+    # e.g. 'course:12', 'module:40'
+    key = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"CacheVersion('{self.key}', {self.version})"
+
+
+# Full-text index over course, module and lesson text, kept in step with
+# those tables by search_index.py. A row's rowid encodes the kind and id of
+# what it indexes; each word is prefixed with its owner's id so searches
+# stay within one user's content. Contentless (content = ''): the text
+# itself is only stored in the tables it comes from. Created with the
+# tables wherever SQLite has FTS5
+SEARCH_INDEX_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "title, body, content = '', tokenize = 'porter unicode61')")
+
+
+def has_fts5(ddl, target, bind, **kw):
+    if bind.dialect.name != 'sqlite':
+        return False
+    options = bind.exec_driver_sql('PRAGMA compile_options').scalars().all()
+    return 'ENABLE_FTS5' in options
+
+
+event.listen(db.metadata, 'after_create',
+             DDL(SEARCH_INDEX_DDL).execute_if(callable_=has_fts5))
+event.listen(db.metadata, 'before_drop',
+             DDL('DROP TABLE IF EXISTS search_index')
+             .execute_if(dialect='sqlite'))
@@ -0,0 +1,161 @@
+'''
+Incremental parser for generated course outlines.
+
+The outline prompt asks for blocks like
+
+    Module Title: <title>
+    Module Description: <description>
+    Lessons:
+    1. <Lesson Title>: <Lesson Description>
+
+but the model does not always comply. It adds preambles, wraps labels in
+markdown, numbers modules, numbers lessons past 9, uses bullets, drops the
+colon between a lesson's title and description, or stops halfway through
+a block. OutlineParser accepts all of these rather than failing, since a
+parse error throws away a paid generation. Lines it cannot place are kept
+as text: they continue the description before the first lesson and the
+last lesson's content directly after it.
+
+The parser is fed the outline in arbitrary chunks as it streams in and
+returns each module as soon as the next module starts, so work on a module
+can begin before the rest of the outline has been generated.
+'''
+import re
+
+# "Module Title: X", "**Module 2 - X**", "### Module 3: X", "Module 4"
+MODULE_RE = re.compile(
+    r'^module(?:\s*\d+)?(?:\s*title)?\s*(?:[:.\-–—]\s*(?P<rest>.*))?$',
+    re.IGNORECASE)
+TITLE_RE = re.compile(r'^title\s*[:\-–—]\s*(?P<rest>.*)$', re.IGNORECASE)
+DESCRIPTION_RE = re.compile(
+    r'^(?:module\s+)?description\s*[:\-–—]\s*(?P<rest>.*)$',
+    re.IGNORECASE)
+LESSONS_RE = re.compile(r'^lessons?\s*:?\s*$', re.IGNORECASE)
+# "1. X", "10) X", "- X", "* X", "Lesson 4: X"
+LESSON_RE = re.compile(
+    r'^(?:\d+\s*[.)]|[-*•]|lesson\s*\d+\s*[:.)\-–—]?)\s+'
+    r'(?P<rest>.+)$', re.IGNORECASE)
+# The first colon or spaced dash separates a lesson's title from its text
+SEPARATOR_RE = re.compile(r'\s*(?::|\s[-–—]\s)\s*')
+MARKUP_RE = re.compile(r'^[#>\s]+|\*\*|__|`')
+
+
+def clean(text):
+    """Strip markdown emphasis and heading markers and outer spaces."""
+    return MARKUP_RE.sub('', text).strip()
+
+
+def split_lesson(text):
+    """Split "Title: description" into both parts.
+
+    Text without a separator is used for both, so a lesson is never lost.
+    """
+    parts = SEPARATOR_RE.split(text, maxsplit=1)
+    title = clean(parts[0]).rstrip('.')
+    content = clean(parts[1]) if len(parts) == 2 else ''
+    if not title:
+        title = content
+    return title, content or title
+
+
+class OutlineParser:
+    """Feed outline text in chunks; get back modules as they complete.
+
+        parser = OutlineParser()
+        for chunk in stream:
+            for module in parser.feed(chunk):
+                start_work_on(module)
+        for module in parser.close():
+            start_work_on(module)
+
+    Modules are dicts with ``title``, ``description`` and ``lessons`` (a
+    list of ``{'title', 'content'}`` dicts), as generate_modules_and_lessons
+    has always returned them.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._module = None
+        self._after_blank = False
+
+    def feed(self, chunk):
+        """Consume ``chunk`` and return the modules it completed."""
+        self._buffer += chunk
+        lines = re.split(r'\r\n|\r|\n', self._buffer)
+        self._buffer = lines.pop()  # Possibly an unfinished line
+        done = []
+        for line in lines:
+            module = self._line(line)
+            if module is not None:
+                done.append(module)
+        return done
+
+    def close(self):
+        """Finish the outline and return the modules still open."""
+        done = self.feed('\n')
+        if self._module is not None:
+            done.append(self._finish(self._module))
+            self._module = None
+        return done
+
+    def _line(self, line):
+        """Handle one line; return the previous module if this starts one."""
+        text = clean(line)
+        if not text:
+            self._after_blank = True
+            return None
+        after_blank, self._after_blank = self._after_blank, False
+
+        module = self._module
+        match = DESCRIPTION_RE.match(text)
+        if match:
+            if module is not None and not module['lessons']:
+                self._append(module, 'description',
+                             clean(match.group('rest')))
+            return None
+
+        match = MODULE_RE.match(text)
+        if match:
+            self._module = {'title': clean(match.group('rest') or ''),
+                            'description': '', 'lessons': []}
+            return self._finish(module) if module is not None else None
+
+        if module is None:
+            return None  # Preamble before the first module
+        match = TITLE_RE.match(text)
+        if match and not module['title']:
+            module['title'] = clean(match.group('rest'))
+            return None
+        if LESSONS_RE.match(text):
+            return None
+
+        match = LESSON_RE.match(text)
+        if match:
+            title, content = split_lesson(match.group('rest'))
+            module['lessons'].append({'title': title, 'content': content})
+        elif module['lessons']:
+            # A wrapped lesson continues on the next line; a paragraph after
+            # the lessons ("I hope this helps!") is not part of the course
+            if not after_blank:
+                self._append(module['lessons'][-1], 'content', text)
+        elif not module['title']:
+            module['title'] = text  # "**Module 1**" then the title
+        else:
+            self._append(module, 'description', text)
+        return None
+
+    @staticmethod
+    def _append(target, field, text):
+        target[field] = f"{target[field]} {text}" if target[field] else text
+
+    @staticmethod
+    def _finish(module):
+        if not module['title']:
+            module['title'] = module['description'] or 'Untitled module'
+        return module
+
+
+def parse_outline(outline):
+    """Parse a complete outline in one go."""
+    parser = OutlineParser()
+    return parser.feed(outline) + parser.close()
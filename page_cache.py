@@ -0,0 +1,130 @@
+'''
+Rendered-page cache for course content.
+
+Course pages change only when a course, module or lesson is created,
+deleted, completed or marked incomplete. Each of those routes bumps a
+version stamp stored in the cache_versions table, and cached pages are
+keyed on that stamp, so every worker process sees an edit immediately
+without any explicit purge.
+
+Responses carry an ETag built from the stamp and the viewer, so a browser
+that already has the page gets a 304 without the view touching the course.
+'''
+import hashlib
+import importlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import make_response, request, session
+from flask_login import current_user
+
+from models import db, CacheVersion
+
+
+def course_key(course_id):
+    return f'course:{course_id}'
+
+
+def module_key(module_id):
+    return f'module:{module_id}'
+
+
+def get_version(key):
+    version = db.session.execute(
+        db.select(CacheVersion.version).filter_by(key=key)
+    ).scalar()
+    return version or 0
+
+
+def bump_version(*keys):
+    """Increment the stamps for ``keys`` in the current transaction.
+
+    Call this before the commit that makes the change, so the new content
+    and the new stamp become visible together.
+    """
+    dialect = db.session.get_bind().dialect.name
+    for key in keys:
+        if dialect in ('sqlite', 'postgresql'):
+            # Imported by name so only the dialect in use gets loaded
+            insert = importlib.import_module(
+                'sqlalchemy.dialects.' + dialect).insert
+            statement = insert(CacheVersion).values(key=key, version=1)
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=[CacheVersion.key],
+                set_={'version': CacheVersion.version + 1}))
+        else:
+            row = db.session.get(CacheVersion, key)
+            if row is None:
+                db.session.add(CacheVersion(key=key, version=1))
+            else:
+                row.version += 1
+
+
+class PageCache:
+    """Bounded per-process cache of rendered pages, keyed by ETag."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def _get(self, etag):
+        with self._lock:
+            body = self._pages.get(etag)
+            if body is not None:
+                self._pages.move_to_end(etag)
+            return body
+
+    def _put(self, etag, body):
+        with self._lock:
+            self._pages[etag] = body
+            self._pages.move_to_end(etag)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+    def cached(self, key_func):
+        """Cache a GET view under the version stamp ``key_func(**kwargs)``.
+
+        Pages are cached per viewer, since base.html shows who is logged
+        in, and are bypassed while flashed messages are waiting to be shown.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET' or session.get('_flashes'):
+                    return view(*args, **kwargs)
+
+                key = key_func(**kwargs)
+                viewer = (current_user.get_id()
+                          if current_user.is_authenticated else 'anonymous')
+                raw = f'{request.endpoint}|{key}|{get_version(key)}|{viewer}'
+                etag = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+                if etag in request.if_none_match:
+                    self.not_modified += 1
+                    response = make_response('', 304)
+                else:
+                    body = self._get(etag)
+                    if body is None:
+                        self.misses += 1
+                        response = make_response(view(*args, **kwargs))
+                        if response.status_code != 200:
+                            return response
+                        self._put(etag, response.get_data())
+                    else:
+                        self.hits += 1
+                        response = make_response(body)
+                response.set_etag(etag)
+                # Let browsers keep the page but always revalidate it
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response
+            return wrapper
+        return decorator
@@ -0,0 +1,362 @@
+'''
+Local code execution backend for /compile.
+
+LocalRunner runs python3 and cpp14 submissions on this host instead of
+sending them to JDoodle. Each run is a separate child process that has:
+
+* its own session (so it and anything it forks can be killed together);
+* a scratch working directory;
+* a minimal environment;
+* CPU-time, address-space, file-size, open-file and process-count
+  rlimits.
+
+The rlimits are set by a small helper interpreter that then execs the
+program, not by a preexec_fn: running Python between fork and exec is
+unsafe in a threaded or gevent-patched server process.
+
+RLIMIT_NPROC counts every process and thread of the user the server runs
+as, not just the run's, so a fork loop fails once that user has
+``processes`` of them instead of filling the host's process table before
+the wall-time kill. The kernel does not apply it to root.
+
+The run is killed once it exceeds the wall-time limit. Output goes to a
+file capped by RLIMIT_FSIZE, not to a pipe, so a print loop cannot fill
+the server's memory.
+
+Python runs are served from a pool of pre-started interpreters that block
+reading their job from stdin, so a run does not pay for interpreter
+start-up. C++ sources are compiled once per distinct source: the binaries
+live in ``cache_dir`` under the hash of the source and compiler flags.
+
+These limits keep one careless submission from hurting the server; they are
+not a security boundary. A run can read anything the server can, including
+.env and the database, so create_runner only builds this backend when
+SANDBOX_ALLOW_UNSAFE is set, and /compile then requires a login. Run the
+app in a container (or behind a seccomp/namespace jail) before letting
+untrusted users reach it.
+'''
+import hashlib
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+from code_runner import CodeRunner, RunError
+
+DEFAULT_WORKERS = 4
+DEFAULT_CPU_SECONDS = 2
+DEFAULT_WALL_SECONDS = 5
+DEFAULT_MEMORY_MB = 256
+DEFAULT_OUTPUT_BYTES = 64 * 1024
+DEFAULT_PROCESSES = 16
+DEFAULT_COMPILE_SECONDS = 20
+DEFAULT_MAX_ARTIFACTS = 200
+
+CXX_FLAGS = ['-std=c++14', '-O2', '-pipe']
+
+# Runs in each pooled interpreter: wait for one job, then run it as __main__
+PYTHON_BOOTSTRAP = '''
+import io, json, sys, traceback
+job = json.loads(sys.stdin.buffer.read())
+sys.stdin = io.StringIO(job['stdin'])
+sys.argv = ['main.py']
+try:
+    exec(compile(job['script'], 'main.py', 'exec'), {'__name__': '__main__'})
+except SystemExit:
+    raise
+except BaseException as error:
+    traceback.print_exception(type(error), error, error.__traceback__.tb_next)
+    sys.exit(1)
+'''
+
+# Sets the rlimits passed as JSON in argv[1], then execs argv[2:]
+LIMITS_HELPER = '''
+import json, os, resource, sys
+for name, soft, hard in json.loads(sys.argv[1]):
+    resource.setrlimit(getattr(resource, name), (soft, hard))
+os.execv(sys.argv[2], sys.argv[2:])
+'''
+
+SIGNAL_ERRORS = {
+    signal.SIGXCPU: 'CPU time limit exceeded',
+    signal.SIGXFSZ: 'Output limit exceeded',
+    signal.SIGKILL: 'Time limit exceeded',
+}
+
+
+class UnsupportedLanguage(RunError):
+    status = 400
+
+
+class _Process:
+    """A child started under the sandbox limits, with its output file."""
+
+    def __init__(self, argv, env):
+        self.workdir = tempfile.mkdtemp(prefix='sandbox-')
+        self.output = tempfile.TemporaryFile(dir=self.workdir)
+        self.proc = subprocess.Popen(
+            argv, cwd=self.workdir, env=env, stdin=subprocess.PIPE,
+            stdout=self.output, stderr=subprocess.STDOUT,
+            start_new_session=True)
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def finish(self, stdin, wall_seconds, output_bytes):
+        """Feed ``stdin``, wait up to ``wall_seconds`` and collect results.
+
+        Returns ``(returncode, output, rusage)``; ``output`` is bytes.
+        """
+        # Written from a thread, so a program that never reads its input
+        # cannot hold off the wall-time limit by filling the pipe
+        writer = threading.Thread(target=self._feed, args=(stdin,),
+                                  daemon=True)
+        writer.start()
+        returncode, rusage = self._wait(wall_seconds)
+        writer.join(1)  # The pipe breaks once the process has been killed
+        self.output.seek(0)
+        return returncode, self.output.read(output_bytes), rusage
+
+    def _feed(self, stdin):
+        try:
+            with self.proc.stdin:
+                self.proc.stdin.write(stdin)
+        except (BrokenPipeError, ValueError):
+            pass  # Exited without reading all of its input
+
+    def _wait(self, timeout):
+        # os.wait4 reports the child's own CPU time and peak memory, which
+        # getrusage(RUSAGE_CHILDREN) cannot do with runs in parallel
+        deadline = time.monotonic() + timeout
+        delay = 0.001
+        while True:
+            pid, status, rusage = os.wait4(self.proc.pid, os.WNOHANG)
+            if pid:
+                break
+            if time.monotonic() >= deadline:
+                self.kill()
+                pid, status, rusage = os.wait4(self.proc.pid, 0)
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, 0.02)
+        self.proc.returncode = os.waitstatus_to_exitcode(status)
+        return self.proc.returncode, rusage
+
+    def kill(self):
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def close(self):
+        if self.proc.returncode is None:
+            self.kill()
+            self.proc.wait()
+        self.output.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class _WarmPool:
+    """Keeps ``size`` idle processes started ahead of demand."""
+
+    def __init__(self, size, start):
+        self.size = size
+        self.start = start
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+        self._refill()
+
+    def take(self):
+        with self._lock:
+            while self._idle:
+                process = self._idle.popleft()
+                if process.alive():
+                    break
+                process.close()
+            else:
+                process = None
+        self._schedule_refill()
+        return process or self.start()
+
+    def _schedule_refill(self):
+        with self._lock:
+            if self._refilling:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, daemon=True).start()
+
+    def _refill(self):
+        try:
+            while True:
+                with self._lock:
+                    if len(self._idle) >= self.size:
+                        return
+                process = self.start()
+                with self._lock:
+                    if len(self._idle) < self.size:
+                        self._idle.append(process)
+                        continue
+                process.close()  # Closed or shrunk while it started
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+            self.size = 0
+        for process in idle:
+            process.close()
+
+
+class LocalRunner(CodeRunner):
+    """Runs python3 and cpp14 code in rlimited local subprocesses."""
+
+    def __init__(self, workers=DEFAULT_WORKERS,
+                 cpu_seconds=DEFAULT_CPU_SECONDS,
+                 wall_seconds=DEFAULT_WALL_SECONDS,
+                 memory_mb=DEFAULT_MEMORY_MB,
+                 output_bytes=DEFAULT_OUTPUT_BYTES,
+                 processes=DEFAULT_PROCESSES,
+                 compile_seconds=DEFAULT_COMPILE_SECONDS,
+                 cache_dir=None, max_artifacts=DEFAULT_MAX_ARTIFACTS,
+                 python=sys.executable, cxx='g++', **kwargs):
+        super().__init__(**kwargs)
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self.memory_bytes = int(memory_mb * 1024 * 1024)
+        self.output_bytes = output_bytes
+        self.processes = processes
+        self.compile_seconds = compile_seconds
+        self.cache_dir = cache_dir or tempfile.mkdtemp(prefix='sandbox-cache-')
+        self.max_artifacts = max_artifacts
+        self.python = python
+        self.cxx = cxx
+        self.env = {'PATH': '/usr/local/bin:/usr/bin:/bin',
+                    'LANG': 'C.UTF-8', 'PYTHONIOENCODING': 'utf-8'}
+        self.compiles = 0
+        self.artifact_hits = 0
+        self._slots = threading.BoundedSemaphore(workers)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._python_pool = _WarmPool(workers, self._start_python)
+
+    def _limited(self, argv):
+        """``argv`` prefixed with the helper that applies the rlimits."""
+        limits = [
+            ('RLIMIT_CPU', self.cpu_seconds, self.cpu_seconds + 1),
+            ('RLIMIT_AS', self.memory_bytes, self.memory_bytes),
+            ('RLIMIT_FSIZE', self.output_bytes, self.output_bytes),
+            ('RLIMIT_NOFILE', 64, 64),
+            ('RLIMIT_NPROC', self.processes, self.processes),
+            ('RLIMIT_CORE', 0, 0),
+        ]
+        return [self.python, '-I', '-S', '-c', LIMITS_HELPER,
+                json.dumps(limits), *argv]
+
+    def _start_python(self):
+        return _Process(self._limited(
+            [self.python, '-I', '-c', PYTHON_BOOTSTRAP]), self.env)
+
+    def _execute(self, script, language, stdin, version_index):
+        if language not in ('python3', 'cpp14'):
+            raise UnsupportedLanguage(f'Unsupported language {language!r}')
+        if not self._slots.acquire(timeout=self.wall_seconds):
+            raise RunError('The code runner is busy; try again shortly')
+        try:
+            if language == 'python3':
+                process = self._python_pool.take()
+                payload = json.dumps({'script': script, 'stdin': stdin})
+                return self._finish(process, payload.encode('utf-8'))
+            binary, errors = self._compile(script)
+            if binary is None:
+                # Reported like JDoodle does: the compiler's message as output
+                return {'output': errors, 'statusCode': 200,
+                        'cpuTime': None, 'memory': None}
+            process = _Process(self._limited([binary]), self.env)
+            return self._finish(process, stdin.encode('utf-8'))
+        finally:
+            self._slots.release()
+
+    def _finish(self, process, stdin):
+        try:
+            returncode, output, rusage = process.finish(
+                stdin, self.wall_seconds, self.output_bytes)
+        finally:
+            process.close()
+        result = {
+            'output': output.decode('utf-8', 'replace'),
+            'statusCode': 200,
+            'cpuTime': '%.2f' % (rusage.ru_utime + rusage.ru_stime),
+            'memory': str(rusage.ru_maxrss),  # KiB, as JDoodle reports it
+        }
+        error = SIGNAL_ERRORS.get(-returncode)
+        if error:
+            result['error'] = error
+        elif len(output) >= self.output_bytes:
+            # Python ignores SIGXFSZ and fails the write with EFBIG instead
+            result['error'] = 'Output limit exceeded'
+        elif b'MemoryError' in output or b'std::bad_alloc' in output:
+            result['error'] = 'Memory limit exceeded'
+        return result
+
+    def _compile(self, source):
+        """Return ``(path, None)`` for a built binary or ``(None, errors)``.
+
+        Binaries are cached by the hash of the compiler, flags and source
+        and are written atomically, so concurrent builds of the same source
+        are harmless.
+        """
+        digest = hashlib.sha256(json.dumps(
+            [self.cxx, CXX_FLAGS, source]).encode('utf-8')).hexdigest()
+        binary = os.path.join(self.cache_dir, digest)
+        if os.path.exists(binary):
+            self.artifact_hits += 1
+            os.utime(binary)  # Recently used; see _prune_artifacts
+            return binary, None
+        if shutil.which(self.cxx) is None:
+            raise RunError('C++ is not available on this server')
+
+        self.compiles += 1
+        with tempfile.TemporaryDirectory(dir=self.cache_dir) as workdir:
+            source_path = os.path.join(workdir, 'main.cpp')
+            with open(source_path, 'w', encoding='utf-8') as handle:
+                handle.write(source)
+            built = os.path.join(workdir, 'main')
+            try:
+                compiled = subprocess.run(
+                    [self.cxx, *CXX_FLAGS, '-o', built, source_path],
+                    cwd=workdir, stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT, timeout=self.compile_seconds)
+            except subprocess.TimeoutExpired:
+                return None, 'Compilation timed out'
+            if compiled.returncode != 0:
+                errors = compiled.stdout.decode('utf-8', 'replace')
+                return None, errors.replace(workdir + os.sep, '')
+            os.replace(built, binary)
+        self._prune_artifacts()
+        return binary, None
+
+    def _prune_artifacts(self):
+        try:
+            entries = [entry for entry in os.scandir(self.cache_dir)
+                       if entry.is_file()]
+        except FileNotFoundError:
+            return
+        if len(entries) <= self.max_artifacts:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_artifacts]:
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        self._python_pool.close()
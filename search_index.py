@@ -0,0 +1,561 @@
+'''
+Full-text search over the courses, modules and lessons a user owns.
+
+The only way to search that text used to be LIKE '%...%' over every title,
+description and lesson body, which scans all three tables. SearchIndex
+keeps an index of it and answers ranked queries scoped to one user:
+
+- 'fts5' uses the search_index virtual table that SQLite builds with FTS5
+  (see models.py). The table is contentless: it holds the index but no
+  copy of the text, which stays (compressed) in the lessons table. Each
+  word is indexed behind its owner's id ("12zgraph" for user 12), so a
+  search only reads that user's postings and FTS5's bm25() ranks them,
+  with a title match worth TITLE_WEIGHT body matches. Words match through
+  the porter stemmer ("graphs" finds "graph"). Index rows are written in
+  the same flush, on the same connection, as the course, module or lesson
+  they index, so they commit or roll back with it. Any process that
+  imports this module keeps the table up to date, whichever backend it
+  searches with.
+- 'memory' keeps an inverted index in process memory, built from the
+  database on the first search and updated after each commit. It matches
+  whole words without stemming and ranks with the same bm25 formula. Like
+  the in-memory matchmaking queue it only sees writes made by its own
+  process, so it suits single-process deployments and databases without
+  FTS5.
+
+'auto' picks 'fts5' wherever the search_index table exists. Rows inserted
+or deleted without the ORM (benchmarks/seed_data.py) are not reflected in
+either index until `flask rebuild-search` runs. A contentless table can
+only remove a row given the words it was indexed with, which are read back
+from the database before an update or delete. Neither index follows a
+course or module that moves to another user's course: rebuild after that.
+'''
+import heapq
+import math
+import re
+import threading
+import weakref
+from collections import Counter, namedtuple
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+
+from models import db, Course, Module, Lesson
+
+KINDS = ('course', 'module', 'lesson')
+BACKENDS = ('auto', 'fts5', 'memory')
+TITLE_WEIGHT = 4
+MAX_TERMS = 8  # Words of a query that are used; the rest are ignored
+DEFAULT_LIMIT = 20
+REBUILD_BATCH = 5000
+# bm25 parameters, as FTS5 uses them
+K1 = 1.2
+B = 0.75
+
+_PENDING = 'search_index_pending'
+_WORD = re.compile(r'[^\W_]+')  # As FTS5's unicode61 tokenizer splits
+_MODELS = {'course': Course, 'module': Module, 'lesson': Lesson}
+# The column that ties a row to its owner's course
+_OWNER_KEYS = {'course': 'user_id', 'module': 'course_id',
+               'lesson': 'module_id'}
+_fts_tables = weakref.WeakKeyDictionary()  # Engine -> has search_index
+
+Doc = namedtuple('Doc', 'rowid owner kind parent_id title body')
+
+
+def doc_rowid(kind, object_id):
+    """The index rowid of a course, module or lesson."""
+    return object_id * len(KINDS) + KINDS.index(kind)
+
+
+def split_rowid(rowid):
+    object_id, kind = divmod(rowid, len(KINDS))
+    return KINDS[kind], object_id
+
+
+def words(value):
+    return _WORD.findall(value.lower())
+
+
+def owned_words(owner, value):
+    """The words of ``value`` as search_index holds them for ``owner``.
+
+    The 'z' ends the id, which is only digits, and neither it nor the
+    digits are vowels, so the porter stemmer treats "12zgraphs" as it
+    does "graphs".
+    """
+    return [f'{owner}z{word}' for word in words(value or '')]
+
+
+def bm25(postings, rowid, length, count, average):
+    """Okapi bm25 of one of a user's documents.
+
+    ``postings`` has a {rowid: weighted term frequency} dict per query
+    term, over the ``count`` documents of the user, whose average length
+    is ``average``.
+    """
+    norm = K1 * (1 - B + B * length / average)
+    score = 0.0
+    for hits in postings:
+        frequency = hits[rowid]
+        idf = math.log(1 + (count - len(hits) + 0.5) / (len(hits) + 0.5))
+        score += idf * frequency * (K1 + 1) / (frequency + norm)
+    return score
+
+
+def _kind(target):
+    if isinstance(target, Lesson):
+        return 'lesson'
+    return 'course' if isinstance(target, Course) else 'module'
+
+
+def _body_attribute(target):
+    return 'content' if isinstance(target, Lesson) else 'description'
+
+
+def _parent_column(kind):
+    """The column the parent_id of a search result comes from."""
+    return {'course': Course.id, 'module': Module.course_id,
+            'lesson': Lesson.module_id}[kind]
+
+
+def _select_docs(kind):
+    """id, owner, parent_id, title and body of every row of a kind."""
+    model = _MODELS[kind]
+    query = db.select(
+        model.id, Course.user_id.label('owner'),
+        _parent_column(kind).label('parent_id'), model.title,
+        (Lesson.content if kind == 'lesson' else model.description)
+        .label('body'))
+    if kind != 'course':
+        if kind == 'lesson':
+            query = query.join(Module, Module.id == Lesson.module_id)
+        query = query.join(Course, Course.id == Module.course_id)
+    return query
+
+
+def _doc(connection, kind, object_id):
+    """A row as it is in the database, as a Doc, or None."""
+    row = connection.execute(_select_docs(kind).where(
+        _MODELS[kind].id == object_id)).first()
+    if row is None:
+        return None
+    return Doc(doc_rowid(kind, row.id), row.owner, kind, row.parent_id,
+               row.title, row.body)
+
+
+def _owner(connection, target):
+    """(user id, parent id) of a course, module or lesson being flushed.
+
+    Uses the parent objects when they are already in memory, as they are
+    for a tree saved by save_course_tree(), and a query otherwise.
+    """
+    if isinstance(target, Course):
+        return target.user_id, target.id
+    if isinstance(target, Module):
+        course = target.__dict__.get('course')
+        user_id = course.user_id if course is not None else \
+            connection.execute(
+                text('SELECT user_id FROM courses WHERE id = :id'),
+                {'id': target.course_id}).scalar()
+        return user_id, target.course_id
+    module = target.__dict__.get('module')
+    course = module.__dict__.get('course') if module is not None else None
+    user_id = course.user_id if course is not None else connection.execute(
+        text('SELECT courses.user_id FROM modules '
+             'JOIN courses ON courses.id = modules.course_id '
+             'WHERE modules.id = :id'), {'id': target.module_id}).scalar()
+    return user_id, target.module_id
+
+
+def _inserted_doc(connection, target):
+    kind = _kind(target)
+    owner, parent_id = _owner(connection, target)
+    return Doc(doc_rowid(kind, target.id), owner, kind, parent_id,
+               target.title, getattr(target, _body_attribute(target)))
+
+
+def _reindexed(target):
+    """Whether a flush changes the words or owner ``target`` has."""
+    attrs = inspect(target).attrs
+    return any(attrs[name].history.has_changes() for name in (
+        'title', _body_attribute(target), _OWNER_KEYS[_kind(target)]))
+
+
+def iter_docs(connection):
+    """Every course, module and lesson as a Doc, in batches.
+
+    ``connection`` may also be a session.
+    """
+    for kind in KINDS:
+        model = _MODELS[kind]
+        last_id = 0
+        while True:
+            rows = connection.execute(
+                _select_docs(kind).where(model.id > last_id)
+                .order_by(model.id).limit(REBUILD_BATCH)).all()
+            for row in rows:
+                yield Doc(doc_rowid(kind, row.id), row.owner, kind,
+                          row.parent_id, row.title, row.body)
+            if len(rows) < REBUILD_BATCH:
+                break
+            last_id = rows[-1].id
+
+
+class FTS5Backend:
+    """Reads and writes the search_index table."""
+
+    name = 'fts5'
+    INSERT = text('INSERT INTO search_index (rowid, title, body) '
+                  'VALUES (:rowid, :title, :body)')
+    # The words must be the ones the row was indexed with
+    DELETE = text("INSERT INTO search_index (search_index, rowid, title, "
+                  "body) VALUES ('delete', :rowid, :title, :body)")
+    CLEAR = text("INSERT INTO search_index (search_index) "
+                 "VALUES ('delete-all')")
+    MATCHES = text(f'SELECT rowid, -bm25(search_index, {TITLE_WEIGHT}, 1) '
+                   f'AS score FROM search_index '
+                   f'WHERE search_index MATCH :match '
+                   f'ORDER BY score DESC LIMIT :limit')
+
+    @staticmethod
+    def _row(doc):
+        return {'rowid': doc.rowid,
+                'title': ' '.join(owned_words(doc.owner, doc.title)),
+                'body': ' '.join(owned_words(doc.owner, doc.body))}
+
+    def put(self, connection, doc):
+        connection.execute(self.INSERT, self._row(doc))
+
+    def remove(self, connection, doc):
+        connection.execute(self.DELETE, self._row(doc))
+
+    def search(self, session, user_id, terms, limit):
+        # Quoting keeps FTS5 query syntax in the input from being
+        # interpreted
+        match = '{title body} : (%s)' % ' '.join(
+            f'"{word}"' for word in owned_words(user_id, ' '.join(terms)))
+        scores = session.execute(
+            self.MATCHES, {'match': match, 'limit': limit}).all()
+        # The table has no text, so titles come from the rows themselves
+        ids = {}
+        for row in scores:
+            kind, object_id = split_rowid(row.rowid)
+            ids.setdefault(kind, []).append(object_id)
+        found = {}
+        for kind, object_ids in ids.items():
+            model = _MODELS[kind]
+            for row in session.execute(db.select(
+                    model.id, model.title, _parent_column(kind))
+                    .where(model.id.in_(object_ids))):
+                found[doc_rowid(kind, row[0])] = row[1], row[2]
+        return [(row.score, row.rowid) + found[row.rowid]
+                for row in scores if row.rowid in found]
+
+    def fill(self, connection):
+        """Re-index every row on ``connection``; returns the count."""
+        connection.execute(self.CLEAR)
+        count = 0
+        batch = []
+        for doc in iter_docs(connection):
+            batch.append(self._row(doc))
+            if len(batch) >= REBUILD_BATCH:
+                connection.execute(self.INSERT, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            connection.execute(self.INSERT, batch)
+            count += len(batch)
+        return count
+
+    def rebuild(self, session):
+        count = self.fill(session.connection())
+        session.commit()
+        return count
+
+
+_fts5 = FTS5Backend()
+
+
+def _has_fts5_table(connection):
+    engine = connection.engine
+    if engine not in _fts_tables:
+        _fts_tables[engine] = connection.dialect.name == 'sqlite' and \
+            inspect(connection).has_table('search_index')
+    return _fts_tables[engine]
+
+
+# search_index is written by these listeners alone, once per row, whatever
+# number of SearchIndex objects exist: a contentless table cannot tell a
+# row indexed twice from two rows
+
+def _index_inserted(mapper, connection, target):
+    if _has_fts5_table(connection):
+        _fts5.put(connection, _inserted_doc(connection, target))
+
+
+def _unindex_updated(mapper, connection, target):
+    if _has_fts5_table(connection) and _reindexed(target):
+        doc = _doc(connection, _kind(target), target.id)
+        if doc is not None:
+            _fts5.remove(connection, doc)
+
+
+def _index_updated(mapper, connection, target):
+    # Read back rather than taken from target, whose (deferred) lesson
+    # body may not be loaded
+    if _has_fts5_table(connection) and _reindexed(target):
+        doc = _doc(connection, _kind(target), target.id)
+        if doc is not None:
+            _fts5.put(connection, doc)
+
+
+def _unindex_deleted(mapper, connection, target):
+    if _has_fts5_table(connection):
+        doc = _doc(connection, _kind(target), target.id)
+        if doc is not None:
+            _fts5.remove(connection, doc)
+
+
+for _model in _MODELS.values():
+    event.listen(_model, 'after_insert', _index_inserted)
+    event.listen(_model, 'before_update', _unindex_updated)
+    event.listen(_model, 'after_update', _index_updated)
+    event.listen(_model, 'before_delete', _unindex_deleted)
+
+
+class _Shard:
+    """One user's documents and postings."""
+
+    def __init__(self):
+        self.docs = {}  # rowid -> (kind, parent_id, title, terms, length)
+        self.postings = {}  # term -> {rowid: weighted term frequency}
+        self.total_length = 0
+
+
+class MemoryBackend:
+    """An inverted index per user, in process memory."""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._shards = {}  # user id -> _Shard
+        self._owners = {}  # rowid -> user id
+        self._lock = threading.Lock()
+        self.built = False
+
+    def build(self, session):
+        with self._lock:
+            if self.built:
+                return len(self._owners)
+            self._shards.clear()
+            self._owners.clear()
+            for doc in iter_docs(session):
+                self._put(doc.rowid, doc.owner, doc.kind, doc.parent_id,
+                          doc.title, Counter(words(doc.title)),
+                          Counter(words(doc.body or '')))
+            self.built = True
+            return len(self._owners)
+
+    def rebuild(self, session):
+        with self._lock:
+            self.built = False
+        return self.build(session)
+
+    def apply(self, ops):
+        with self._lock:
+            if not self.built:
+                return  # The build will read the committed rows
+            for op, *args in ops:
+                if op == 'put':
+                    doc = args[0]
+                    self._remove(doc.rowid)
+                    self._put(doc.rowid, doc.owner, doc.kind, doc.parent_id,
+                              doc.title, Counter(words(doc.title)),
+                              Counter(words(doc.body or '')))
+                elif op == 'update':
+                    rowid, fields = args
+                    owner = self._owners.get(rowid)
+                    if owner is None:
+                        continue
+                    shard = self._shards[owner]
+                    kind, parent_id, title, terms, _ = shard.docs[rowid]
+                    # The body's counts are what the title's leave over
+                    # (unary + drops the terms only the title had)
+                    title_counts = Counter(words(title))
+                    body_counts = +Counter({
+                        term: shard.postings[term][rowid] -
+                        TITLE_WEIGHT * title_counts[term] for term in terms})
+                    if 'title' in fields:
+                        title = fields['title']
+                        title_counts = Counter(words(title))
+                    if 'body' in fields:
+                        body_counts = Counter(words(fields['body'] or ''))
+                    self._remove(rowid)
+                    self._put(rowid, owner, kind, parent_id, title,
+                              title_counts, body_counts)
+                else:
+                    self._remove(args[0])
+
+    def _put(self, rowid, owner, kind, parent_id, title, title_counts,
+             body_counts):
+        shard = self._shards.setdefault(owner, _Shard())
+        length = TITLE_WEIGHT * sum(title_counts.values()) + \
+            sum(body_counts.values())
+        terms = tuple(title_counts.keys() | body_counts.keys())
+        shard.docs[rowid] = (kind, parent_id, title, terms, length)
+        shard.total_length += length
+        for term in terms:
+            shard.postings.setdefault(term, {})[rowid] = \
+                TITLE_WEIGHT * title_counts[term] + body_counts[term]
+        self._owners[rowid] = owner
+
+    def _remove(self, rowid):
+        owner = self._owners.pop(rowid, None)
+        if owner is None:
+            return
+        shard = self._shards[owner]
+        _, _, _, terms, length = shard.docs.pop(rowid)
+        shard.total_length -= length
+        for term in terms:
+            postings = shard.postings[term]
+            del postings[rowid]
+            if not postings:
+                del shard.postings[term]
+
+    def search(self, session, user_id, terms, limit):
+        self.build(session)
+        with self._lock:
+            shard = self._shards.get(user_id)
+            if shard is None or not shard.docs:
+                return []
+            postings = []
+            for term in set(terms):
+                hits = shard.postings.get(term)
+                if not hits:
+                    return []
+                postings.append(hits)
+            postings.sort(key=len)
+            count = len(shard.docs)
+            average = shard.total_length / count
+            scores = []
+            for rowid in postings[0]:
+                if not all(rowid in hits for hits in postings[1:]):
+                    continue
+                _, parent_id, title, _, length = shard.docs[rowid]
+                scores.append((bm25(postings, rowid, length, count, average),
+                               rowid, title, parent_id))
+        return heapq.nlargest(limit, scores)
+
+
+class SearchIndex:
+    """Ranked search over each user's courses, modules and lessons.
+
+    With the memory backend, listens to ORM writes of Course, Module and
+    Lesson and applies them to the index once they commit.
+    """
+
+    def __init__(self, backend='auto'):
+        if backend not in BACKENDS:
+            raise ValueError(f'Unknown search backend {backend!r}; '
+                             f'expected one of {", ".join(BACKENDS)}')
+        self.backend_name = backend
+        self._backend = None
+        self._lock = threading.Lock()
+        # Per index, as several can listen to the same session
+        self._pending = (_PENDING, id(self))
+        self._listeners = [(Session, 'after_commit', self._committed),
+                           (Session, 'after_soft_rollback',
+                            self._rolled_back)]
+        for model in (Course, Module, Lesson):
+            self._listeners += [(model, 'after_insert', self._inserted),
+                                (model, 'after_update', self._updated),
+                                (model, 'after_delete', self._deleted)]
+        for target, name, listener in self._listeners:
+            event.listen(target, name, listener)
+
+    def backend(self, connection):
+        """The backend in use, decided on first use."""
+        with self._lock:
+            if self._backend is None:
+                name = self.backend_name
+                if name == 'auto':
+                    fts = connection.dialect.name == 'sqlite' and \
+                        inspect(connection).has_table('search_index')
+                    name = 'fts5' if fts else 'memory'
+                self._backend = _fts5 if name == 'fts5' \
+                    else MemoryBackend()
+            return self._backend
+
+    def search(self, user_id, query, limit=DEFAULT_LIMIT):
+        """The user's best matches for ``query``, best first.
+
+        Each result is a dict with the kind ('course', 'module' or
+        'lesson'), id, title, parent_id (the course of a module, the module
+        of a lesson) and score. Only documents containing every word of
+        the query match.
+        """
+        terms = words(query)[:MAX_TERMS]
+        if not terms or limit <= 0:
+            return []
+        backend = self.backend(db.session.connection())
+        results = []
+        for score, rowid, title, parent_id in backend.search(
+                db.session, user_id, terms, limit):
+            kind, object_id = split_rowid(rowid)
+            results.append({'kind': kind, 'id': object_id, 'title': title,
+                            'parent_id': parent_id, 'score': score})
+        return results
+
+    def rebuild(self):
+        """Re-index every row from the database; returns the count."""
+        return self.backend(db.session.connection()).rebuild(db.session)
+
+    def _queue(self, connection, target):
+        """The list to add ``target``'s change to, or None to skip it."""
+        if not isinstance(self.backend(connection), MemoryBackend):
+            return None  # search_index is written by the listeners above
+        session = Session.object_session(target)
+        if session is None:
+            return None
+        return session.info.setdefault(self._pending, [])
+
+    def _inserted(self, mapper, connection, target):
+        queue = self._queue(connection, target)
+        if queue is not None:
+            queue.append(('put', _inserted_doc(connection, target)))
+
+    def _updated(self, mapper, connection, target):
+        queue = self._queue(connection, target)
+        if queue is None:
+            return
+        # Only changed columns are rewritten, so an unchanged (deferred)
+        # lesson body is never loaded here
+        attrs = inspect(target).attrs
+        fields = {}
+        if attrs.title.history.has_changes():
+            fields['title'] = target.title
+        body = _body_attribute(target)
+        if attrs[body].history.has_changes():
+            fields['body'] = getattr(target, body)
+        if fields:
+            queue.append(('update', doc_rowid(_kind(target), target.id),
+                          fields))
+
+    def _deleted(self, mapper, connection, target):
+        queue = self._queue(connection, target)
+        if queue is not None:
+            queue.append(('delete', doc_rowid(_kind(target), target.id)))
+
+    def _committed(self, session):
+        ops = session.info.pop(self._pending, None)
+        if ops and isinstance(self._backend, MemoryBackend):
+            self._backend.apply(ops)
+
+    def _rolled_back(self, session, previous_transaction):
+        session.info.pop(self._pending, None)
+
+    def close(self):
+        """Stop listening for changes (for indexes made in tests)."""
+        for target, name, listener in self._listeners:
+            event.remove(target, name, listener)
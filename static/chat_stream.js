@@ -0,0 +1,57 @@
+// Sends a message to the AI tutor and streams the answer back as
+// server-sent events, calling onDelta with each piece as it arrives.
+// Resolves with the time to first token and the total time in milliseconds.
+async function streamChat(message, onDelta) {
+  const started = performance.now();
+  let firstToken = null;
+  let server = null;
+
+  const response = await fetch("/chat", {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      Accept: "text/event-stream",
+    },
+    body: JSON.stringify({ message: message }),
+  });
+  if (!response.ok) {
+    throw new Error(`Chat request failed (${response.status})`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = "message";
+      let data = "";
+      for (const line of frame.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      }
+      const payload = JSON.parse(data);
+      if (event === "error") throw new Error(payload.error);
+      if (event === "done") {
+        server = payload;
+      } else {
+        if (firstToken === null) firstToken = performance.now() - started;
+        onDelta(payload.delta);
+      }
+    }
+  }
+
+  const timings = {
+    ttftMs: firstToken,
+    totalMs: performance.now() - started,
+    server: server,
+  };
+  console.debug("Chat timings:", timings);
+  return timings;
+}
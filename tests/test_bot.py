@@ -1,5 +1,8 @@
 import unittest
-from bot import get_user_response
+from unittest import mock
+from bot import get_user_response, stream_user_response, fake_stream
+from conversations import Conversation
+from llm_cache import LLMCache, set_default_cache
 
 class BotTest(unittest.TestCase):
     def test_get_user_response(self):
@@ -7,5 +10,57 @@ class BotTest(unittest.TestCase):
         response = get_user_response(user_message)
         self.assertIn("polymorphism", response.lower())
 
+    def test_repeat_question_is_cached(self):
+        cache = LLMCache()
+        set_default_cache(cache)
+        reply = mock.Mock()
+        reply.choices = [mock.Mock(message={'content': 'Nodes and pointers.'})]
+        try:
+            with mock.patch('openai.ChatCompletion.create', return_value=reply) as create:
+                first = get_user_response("What is a linked list?")
+                second = get_user_response("What is a linked list?")
+        finally:
+            set_default_cache(None)
+        self.assertEqual(first, second)
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_stream_relays_chunks_and_caches_answer(self):
+        cache = LLMCache()
+        set_default_cache(cache)
+        chunks = [mock.Mock(choices=[mock.Mock(delta=delta)])
+                  for delta in ({'role': 'assistant'}, {'content': 'Nodes '},
+                                {'content': 'and pointers.'}, {})]
+        try:
+            with mock.patch('openai.ChatCompletion.create', return_value=iter(chunks)) as create:
+                parts = list(stream_user_response("What is a linked list?"))
+                cached = list(stream_user_response("What is a linked list?"))
+        finally:
+            set_default_cache(None)
+        self.assertEqual(parts, ['Nodes ', 'and pointers.'])
+        self.assertEqual(cached, ['Nodes and pointers.'])
+        self.assertEqual(create.call_count, 1)
+        self.assertTrue(create.call_args.kwargs['stream'])
+
+    def test_fake_stream_works_offline(self):
+        with mock.patch('openai.ChatCompletion.create') as create:
+            parts = list(stream_user_response(
+                "What is a heap?", stream=lambda messages: fake_stream(messages, delay=0)))
+        self.assertGreater(len(parts), 1)
+        self.assertIn('What is a heap?', ''.join(parts))
+        create.assert_not_called()
+
+    def test_conversation_history_is_sent_with_follow_ups(self):
+        conversation = Conversation()
+        stream = lambda messages: fake_stream(messages, delay=0)
+        list(stream_user_response("What is a stack?", stream=stream, conversation=conversation))
+        seen = []
+        list(stream_user_response("And a queue?", stream=lambda messages: seen.append(messages) or iter(['FIFO.']),
+                                  conversation=conversation))
+        contents = [m['content'] for m in seen[0]]
+        self.assertIn("What is a stack?", contents)
+        self.assertEqual(contents[-1], "And a queue?")
+        self.assertEqual(conversation.messages()[-1], {'role': 'assistant', 'content': 'FIFO.'})
+
 if __name__ == '__main__':
     unittest.main()
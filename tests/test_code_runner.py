@@ -0,0 +1,163 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from code_runner import (CodeRunner, InputTooLarge, JDoodleRunner,
+                         RunError, TooManyRuns, UpstreamTimeout,
+                         create_runner)
+
+
+class StubJDoodle(BaseHTTPRequestHandler):
+    """Echoes the submitted script back as its output.
+
+    Scripts starting with 'sleep' are held for that many seconds and
+    'fail' makes the stub answer like JDoodle does for a bad client id.
+    """
+
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(
+            int(self.headers['Content-Length'])))
+        server = self.server
+        with server.lock:
+            server.calls += 1
+            server.connections.add(self.client_address)
+        script = payload['script']
+        if script.startswith('sleep'):
+            time.sleep(float(script.split()[1]))
+        if script == 'fail':
+            status, body = 401, {'error': 'Unauthorized Request'}
+        else:
+            status, body = 200, {'output': script + payload['stdin'],
+                                 'statusCode': 200}
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class JDoodleRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubJDoodle)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.calls = 0
+        self.server.connections = set()
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        host, port = self.server.server_address
+        self.url = f'http://{host}:{port}/v1/execute'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def make(self, **kwargs):
+        kwargs.setdefault('read_timeout', 5)
+        return JDoodleRunner('id', 'secret', url=self.url, **kwargs)
+
+    def test_repeat_run_is_cached(self):
+        runner = self.make()
+        first = runner.run('print(1)', 'python3', stdin='x')
+        second = runner.run('print(1)', 'python3', stdin='x')
+        self.assertEqual(first['output'], 'print(1)x')
+        self.assertEqual(first, second)
+        self.assertEqual(self.server.calls, 1)
+        self.assertEqual(runner.stats()['hits'], 1)
+
+    def test_cache_key_covers_stdin_and_version(self):
+        runner = self.make()
+        runner.run('print(1)', 'python3', stdin='a')
+        runner.run('print(1)', 'python3', stdin='b')
+        runner.run('print(1)', 'python3', stdin='a', version_index='3')
+        self.assertEqual(self.server.calls, 3)
+
+    def test_connections_are_reused(self):
+        runner = self.make()
+        for n in range(5):
+            runner.run(f'print({n})', 'python3')
+        self.assertEqual(self.server.calls, 5)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_concurrent_identical_runs_share_one_call(self):
+        runner = self.make(max_per_user=10)
+        results = []
+
+        def run():
+            results.append(runner.run('sleep 0.3', 'python3', user='x'))
+
+        threads = [threading.Thread(target=run) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 5)
+        self.assertEqual(self.server.calls, 1)
+        self.assertEqual(runner.stats()['shared'], 4)
+
+    def test_per_user_limit(self):
+        runner = self.make(max_per_user=1)
+        started = threading.Thread(
+            target=runner.run, args=('sleep 0.3', 'python3'),
+            kwargs={'user': 'alice'})
+        started.start()
+        time.sleep(0.1)
+        with self.assertRaises(TooManyRuns):
+            runner.run('print(2)', 'python3', user='alice')
+        # Other users are unaffected
+        self.assertEqual(runner.run('print(2)', 'python3', user='bob')
+                         ['output'], 'print(2)')
+        started.join()
+        runner.run('print(3)', 'python3', user='alice')
+
+    def test_stdin_size_is_capped(self):
+        runner = self.make(max_stdin_bytes=10)
+        self.assertEqual(runner.run('x', 'python3', stdin='é' * 5)['output'],
+                         'x' + 'é' * 5)
+        with self.assertRaises(InputTooLarge):
+            runner.run('x', 'python3', stdin='é' * 6)
+        self.assertEqual(self.server.calls, 1)
+
+    def test_read_timeout(self):
+        runner = self.make(read_timeout=0.1)
+        start = time.perf_counter()
+        with self.assertRaises(UpstreamTimeout):
+            runner.run('sleep 1', 'python3')
+        self.assertLess(time.perf_counter() - start, 0.9)
+
+    def test_upstream_errors_are_not_cached(self):
+        runner = self.make()
+        self.assertEqual(runner.run('fail', 'python3')['statusCode'], 401)
+        runner.run('fail', 'python3')
+        self.assertEqual(self.server.calls, 2)
+
+    def test_unreachable_upstream(self):
+        self.server.server_close()
+        runner = self.make()
+        with self.assertRaises(RunError):
+            runner.run('print(1)', 'python3')
+
+
+class CodeRunnerTest(unittest.TestCase):
+    def test_runners_must_implement_execute(self):
+        class Incomplete(CodeRunner):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_local_backend_needs_unsafe_opt_in(self):
+        with self.assertRaises(ValueError):
+            create_runner({'COMPILE_BACKEND': 'local'})
+
+
+if __name__ == '__main__':
+    unittest.main()
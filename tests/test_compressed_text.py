@@ -0,0 +1,186 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask
+from flask_migrate import Migrate, downgrade, upgrade
+from sqlalchemy import inspect, text
+
+import compressed_text
+from compressed_text import TextCodec
+from models import db, User, Course, Module, Lesson, Quiz
+from course_store import load_course_tree, load_module_tree
+from instrumentation import QueryCounter
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'migrations')
+BODY = 'A binary heap keeps the smallest key at the root. ' * 40
+
+
+class TextCodecTest(unittest.TestCase):
+    def test_round_trip(self):
+        codec = TextCodec('zlib', min_size=16)
+        for value in (BODY, 'short', '', 'café ' * 50):
+            self.assertEqual(codec.decode(codec.encode(value)), value)
+
+    def test_large_values_are_compressed(self):
+        stored = TextCodec('zlib').encode(BODY)
+        self.assertTrue(stored.startswith(b'\x00z'))
+        self.assertLess(len(stored), len(BODY) / 10)
+
+    def test_small_values_stay_plain(self):
+        self.assertEqual(TextCodec('zlib', min_size=256).encode('short'),
+                         b'short')
+        self.assertEqual(TextCodec('none').encode(BODY),
+                         BODY.encode('utf-8'))
+
+    def test_reads_every_format(self):
+        # Whatever wrote the row: an older schema, or another setting
+        codec = TextCodec('none')
+        self.assertEqual(codec.decode(TextCodec('zlib').encode(BODY)), BODY)
+        self.assertEqual(codec.decode(BODY), BODY)
+        self.assertEqual(codec.decode(memoryview(b'plain')), 'plain')
+
+    def test_leading_nul_is_escaped(self):
+        codec = TextCodec('zlib')
+        value = '\x00z not compressed'
+        self.assertEqual(codec.decode(codec.encode(value)), value)
+
+    def test_unknown_algorithm(self):
+        with self.assertRaises(ValueError):
+            TextCodec('lz4')
+
+    @unittest.skipIf(importlib.util.find_spec('zstandard') is None,
+                     'zstandard is not installed')
+    def test_zstd_round_trip(self):
+        codec = TextCodec('zstd')
+        stored = codec.encode(BODY)
+        self.assertTrue(stored.startswith(b'\x00s'))
+        self.assertEqual(TextCodec('zlib').decode(stored), BODY)
+
+    @unittest.skipIf(importlib.util.find_spec('zstandard') is not None,
+                     'zstandard is installed')
+    def test_zstd_needs_zstandard(self):
+        with self.assertRaises(RuntimeError):
+            TextCodec('zstd')
+
+
+class LessonStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        user = User(username='testuser', email='test@example.com',
+                    password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        course = Course(
+            title='Heaps', description='Priority queues', user_id=user.id,
+            modules=[Module(title='Basics', description='Heap basics',
+                            lessons=[Lesson(title='Sift down',
+                                            content=BODY)])],
+            quizzes=[Quiz(questions='[{"question": "Root?"}]')])
+        db.session.add(course)
+        db.session.commit()
+        self.course_id = course.id
+        self.module_id = course.modules[0].id
+        db.session.expunge_all()
+
+    def tearDown(self):
+        compressed_text.set_default_codec(TextCodec())
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def raw(self, column, table='lessons'):
+        return db.session.execute(
+            text(f'SELECT {column} FROM {table}')).scalar()
+
+    def test_content_is_stored_compressed(self):
+        self.assertTrue(self.raw('content').startswith(b'\x00z'))
+        self.assertEqual(db.session.get(Lesson, 1).content, BODY)
+        self.assertEqual(db.session.get(Quiz, 1).questions,
+                         '[{"question": "Root?"}]')
+
+    def test_setting_applies_to_writes(self):
+        compressed_text.set_default_codec(TextCodec('none'))
+        lesson = db.session.get(Lesson, 1)
+        lesson.content = BODY + '!'
+        db.session.commit()
+        self.assertEqual(self.raw('content'), (BODY + '!').encode('utf-8'))
+
+    def test_lesson_list_leaves_content_deferred(self):
+        with QueryCounter(db.engine) as queries:
+            module = load_module_tree(self.module_id)
+            lesson = module.lessons[0]
+        self.assertEqual(queries.count, 2)
+        self.assertNotIn('content', lesson.__dict__)
+        self.assertNotIn('quiz', lesson.__dict__)
+        with QueryCounter(db.engine) as queries:
+            self.assertEqual(lesson.content, BODY)
+        self.assertEqual(queries.count, 1)
+
+    def test_course_tree_loads_content(self):
+        with QueryCounter(db.engine) as queries:
+            course = load_course_tree(self.course_id)
+            self.assertEqual(course.modules[0].lessons[0].content, BODY)
+        self.assertEqual(queries.count, 3)
+
+
+class CompressionMigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = (
+            'sqlite:///' + os.path.join(self.tmp, 'site.db'))
+        db.init_app(self.app)
+        Migrate(self.app, db, directory=MIGRATIONS)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        # A database from before the compressed columns, with a lesson
+        upgrade(directory=MIGRATIONS, revision='9d41c7e2a5f0')
+        db.session.execute(text(
+            "INSERT INTO user (id, username, email, password_hash) "
+            "VALUES (1, 'u', 'u@example.com', 'x')"))
+        db.session.execute(text(
+            "INSERT INTO courses (id, title, description, user_id) "
+            "VALUES (1, 'Heaps', 'Priority queues', 1)"))
+        db.session.execute(text(
+            "INSERT INTO modules (id, title, description, course_id) "
+            "VALUES (1, 'Basics', 'Heap basics', 1)"))
+        db.session.execute(text(
+            "INSERT INTO lessons (id, title, content, module_id) "
+            "VALUES (1, 'Old', :content, 1)"), {'content': BODY})
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.ctx.pop()
+        shutil.rmtree(self.tmp)
+
+    def column_type(self, table, column):
+        return {info['name']: str(info['type'])
+                for info in inspect(db.engine).get_columns(table)}[column]
+
+    def test_upgrade_keeps_rows_readable(self):
+        upgrade(directory=MIGRATIONS)
+        self.assertEqual(self.column_type('lessons', 'content'), 'BLOB')
+        self.assertEqual(db.session.get(Lesson, 1).content, BODY)
+        db.session.add(Lesson(title='New', content=BODY, module_id=1))
+        db.session.commit()
+
+        downgrade(directory=MIGRATIONS, revision='9d41c7e2a5f0')
+        self.assertEqual(self.column_type('lessons', 'content'), 'TEXT')
+        contents = db.session.execute(
+            text('SELECT content FROM lessons ORDER BY id')).scalars().all()
+        self.assertEqual(contents, [BODY, BODY])
+
+
+if __name__ == '__main__':
+    unittest.main()
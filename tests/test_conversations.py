@@ -0,0 +1,73 @@
+import time
+import unittest
+
+from conversations import (Conversation, ConversationStore, build_messages,
+                           estimate_tokens)
+
+SYSTEM = [{'role': 'system', 'content': 'You are a tutor.'}]
+
+
+class ConversationTest(unittest.TestCase):
+    def test_follow_up_includes_history(self):
+        conversation = Conversation()
+        conversation.add_exchange('What is a stack?', 'A LIFO list.')
+        messages = build_messages(SYSTEM, 'And a queue?', conversation)
+        self.assertEqual([m['role'] for m in messages],
+                         ['system', 'user', 'assistant', 'user'])
+        self.assertEqual(messages[-1]['content'], 'And a queue?')
+
+    def test_history_stays_within_budget(self):
+        conversation = Conversation(history_tokens=200, summary_tokens=50)
+        for n in range(100):
+            conversation.add_exchange(f'Question {n} ' + 'x' * 100,
+                                      'Answer ' + 'y' * 200)
+        self.assertLessEqual(conversation.tokens, 200)
+        history = conversation.messages()
+        summary = history[0]
+        self.assertEqual(summary['role'], 'system')
+        self.assertIn('Question 99', history[-2]['content'])
+        # The summary keeps the most recent evicted questions within its cap
+        self.assertIn('Question 9', summary['content'])
+        self.assertNotIn('Question 0 ', summary['content'])
+        self.assertLessEqual(sum(estimate_tokens(m['content'])
+                                 for m in history), 200 + 50 + 20)
+
+    def test_system_prompts_are_not_repeated(self):
+        conversation = Conversation()
+        for n in range(5):
+            messages = build_messages(SYSTEM, f'Question {n}', conversation)
+            conversation.add_exchange(f'Question {n}', f'Answer {n}')
+        self.assertEqual(messages.count(SYSTEM[0]), 1)
+
+
+class ConversationStoreTest(unittest.TestCase):
+    def test_same_key_same_conversation(self):
+        store = ConversationStore()
+        self.assertIs(store.get('a'), store.get('a'))
+        self.assertIsNot(store.get('a'), store.get('b'))
+
+    def test_least_recently_used_is_evicted(self):
+        store = ConversationStore(max_sessions=2)
+        first = store.get('a')
+        store.get('b')
+        store.get('a')
+        store.get('c')
+        self.assertEqual(len(store), 2)
+        self.assertIs(store.get('a'), first)
+        self.assertEqual(store.evictions, 1)
+
+    def test_idle_conversations_expire(self):
+        store = ConversationStore(idle_ttl=0.05)
+        first = store.get('a')
+        time.sleep(0.1)
+        self.assertIsNot(store.get('a'), first)
+
+    def test_discard(self):
+        store = ConversationStore()
+        first = store.get('a')
+        store.discard('a')
+        self.assertIsNot(store.get('a'), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
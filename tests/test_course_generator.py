@@ -0,0 +1,187 @@
+import threading
+import time
+import unittest
+
+import openai
+
+from course_generator import (generate_modules_and_lessons, parse_modules,
+                              complete, enhance_lessons)
+from llm_cache import LLMCache, set_default_cache
+from llm_gateway import LLMGateway, set_default_gateway
+
+OUTLINE = """Module Title: Basics
+Module Description: Getting started
+Lessons:
+1. Variables: Naming values
+2. Loops: Repeating work
+
+Module Title: Functions
+Module Description: Reusing code
+Lessons:
+1. Arguments: Passing data
+"""
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.choices = [type('Choice', (), {'message': {'content': content}})]
+
+
+class FakeChunk:
+    def __init__(self, content):
+        self.choices = [type('Choice', (), {'delta': {'content': content}})]
+
+
+class StubCreate:
+    """Stands in for openai.ChatCompletion.create with a fixed latency.
+
+    Streamed outlines arrive in ``chunk_size`` pieces, ``chunk_delay``
+    seconds apart.
+    """
+
+    def __init__(self, latency=0.0, failures=0, chunk_size=16,
+                 chunk_delay=0.0, cut_at=None):
+        self.latency = latency
+        self.failures = failures
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.cut_at = cut_at  # Break the next stream after this many chars
+        self.lesson_started = []
+        self.stream_finished = None
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, model, messages, max_tokens, stream=False, **kwargs):
+        prompt = messages[-1]['content']
+        if not prompt.startswith("Generate"):
+            self.lesson_started.append(time.perf_counter())
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self.failures > 0
+            self.failures -= 1
+        try:
+            time.sleep(self.latency)
+            if fail:
+                raise openai.error.Timeout("stub timeout")
+            if prompt.startswith("Generate"):
+                if stream:
+                    return self.stream(OUTLINE)
+                return FakeResponse(OUTLINE)
+            return FakeResponse("Enhanced: " + prompt.rsplit(": ", 1)[-1])
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def stream(self, text):
+        cut_at, self.cut_at = self.cut_at, None
+        for start in range(0, len(text), self.chunk_size):
+            if cut_at is not None and start >= cut_at:
+                raise openai.error.APIConnectionError("stream cut")
+            time.sleep(self.chunk_delay)
+            yield FakeChunk(text[start:start + self.chunk_size])
+        self.stream_finished = time.perf_counter()
+
+
+class CourseGeneratorTest(unittest.TestCase):
+    def setUp(self):
+        # A fresh memory-only cache so earlier tests never answer for later
+        self.cache = LLMCache()
+        set_default_cache(self.cache)
+        # Nor do earlier tests use up the rate limit of later ones
+        set_default_gateway(LLMGateway(rate=1000, burst=1000))
+
+    def tearDown(self):
+        set_default_cache(None)
+        set_default_gateway(None)
+
+    def test_parse_modules(self):
+        modules = parse_modules(OUTLINE)
+        self.assertEqual([m['title'] for m in modules],
+                         ['Basics', 'Functions'])
+        self.assertEqual(modules[0]['lessons'][1]['content'],
+                         'Repeating work')
+
+    def test_lessons_are_enhanced(self):
+        stub = StubCreate()
+        modules = generate_modules_and_lessons("Python", "Intro", "beginner",
+                                               create=stub)
+        self.assertEqual(stub.calls, 4)
+        self.assertEqual(modules[1]['lessons'][0]['content'],
+                         'Enhanced: Passing data')
+
+    def test_lesson_calls_run_concurrently(self):
+        stub = StubCreate(latency=0.2)
+        start = time.perf_counter()
+        generate_modules_and_lessons("Python", "Intro", "beginner",
+                                     create=stub, max_workers=8)
+        elapsed = time.perf_counter() - start
+        # Outline plus one round of lessons, not outline plus three lessons
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual(stub.max_in_flight, 3)
+
+    def test_concurrency_limit(self):
+        stub = StubCreate(latency=0.05)
+        generate_modules_and_lessons("Python", "Intro", "beginner",
+                                     create=stub, max_workers=2)
+        self.assertEqual(stub.max_in_flight, 2)
+
+    def test_retry_with_backoff(self):
+        stub = StubCreate(failures=2)
+        content = complete("Review this", 10, create=stub, retries=2,
+                           backoff=0)
+        self.assertEqual(content, 'Enhanced: Review this')
+        self.assertEqual(stub.calls, 3)
+
+    def test_repeat_generation_is_cached(self):
+        stub = StubCreate()
+        first = generate_modules_and_lessons("Python", "Intro", "beginner",
+                                             create=stub)
+        second = generate_modules_and_lessons("Python", "Intro", "beginner",
+                                              create=stub)
+        self.assertEqual(first, second)
+        self.assertEqual(stub.calls, 4)
+        self.assertEqual(self.cache.stats()['hits'], 4)
+
+    def test_lessons_start_before_outline_finishes(self):
+        stub = StubCreate(chunk_size=8, chunk_delay=0.02)
+        modules = generate_modules_and_lessons("Python", "Intro", "beginner",
+                                               create=stub)
+        self.assertEqual(len(modules), 2)
+        self.assertLess(min(stub.lesson_started), stub.stream_finished)
+
+    def test_outline_cut_off_keeps_finished_modules(self):
+        # Cut inside the second module: the first is kept, not re-bought
+        stub = StubCreate(cut_at=OUTLINE.index("Reusing"))
+        modules = generate_modules_and_lessons("Python", "Intro", "beginner",
+                                               create=stub, backoff=0)
+        self.assertEqual([m['title'] for m in modules], ['Basics'])
+        self.assertEqual(stub.calls, 3)
+
+    def test_outline_cut_off_early_is_retried(self):
+        stub = StubCreate(cut_at=10)
+        modules = generate_modules_and_lessons("Python", "Intro", "beginner",
+                                               create=stub, backoff=0)
+        self.assertEqual(len(modules), 2)
+        self.assertEqual(stub.calls, 5)
+
+    def test_failed_lesson_keeps_outline_text(self):
+        stub = StubCreate()
+        modules = parse_modules(OUTLINE)
+
+        def flaky(**kwargs):
+            if 'Naming values' in kwargs['messages'][-1]['content']:
+                raise openai.error.APIConnectionError("down")
+            return stub(**kwargs)
+        enhance_lessons(modules, "Python", "beginner", create=flaky,
+                        retries=1, backoff=0)
+        self.assertEqual(modules[0]['lessons'][0]['content'], 'Naming values')
+        self.assertEqual(modules[0]['lessons'][1]['content'],
+                         'Enhanced: Repeating work')
+
+
+if __name__ == '__main__':
+    unittest.main()
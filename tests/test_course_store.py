@@ -0,0 +1,204 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from flask import Flask
+from flask_migrate import Migrate, upgrade
+from sqlalchemy import event, inspect, text
+
+from models import db, User, Course, Module, Lesson
+from course_store import (save_course_tree, load_course_tree,
+                          load_module_tree, list_courses)
+from instrumentation import QueryCounter
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'migrations')
+
+MODULES = [
+    {'title': 'Basics', 'description': 'Getting started',
+     'lessons': [{'title': 'Variables', 'content': 'Naming values'},
+                 {'title': 'Loops', 'content': 'Repeating work'}]},
+    {'title': 'Functions', 'description': 'Reusing code',
+     'lessons': [{'title': 'Arguments', 'content': 'Passing data'}]},
+]
+
+
+class CourseStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        user = User(username='testuser', email='test@example.com',
+                    password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_tree_is_saved_in_one_commit(self):
+        commits = []
+        event.listen(db.session(), 'after_commit', commits.append)
+        course = save_course_tree(self.user_id, 'Python', 'Intro', MODULES)
+        self.assertEqual(len(commits), 1)
+
+        db.session.expire_all()
+        saved = db.session.get(Course, course.id)
+        self.assertEqual([m.title for m in saved.modules],
+                         ['Basics', 'Functions'])
+        self.assertEqual([lesson.title for lesson in saved.modules[0].lessons],
+                         ['Variables', 'Loops'])
+        self.assertEqual(Lesson.query.count(), 3)
+
+    def test_failure_rolls_back_whole_tree(self):
+        save_course_tree(self.user_id, 'Python', 'Intro', MODULES)
+        # Module titles are unique, so reusing them fails part way through
+        with self.assertRaises(Exception):
+            save_course_tree(self.user_id, 'Python 2', 'More', MODULES)
+        self.assertEqual(Course.query.count(), 1)
+        self.assertEqual(Module.query.count(), 2)
+        self.assertEqual(Lesson.query.count(), 3)
+
+    def test_commit_can_be_left_to_caller(self):
+        course = save_course_tree(self.user_id, 'Python', 'Intro', MODULES,
+                                  commit=False)
+        self.assertIsNotNone(course.id)
+        db.session.rollback()
+        self.assertEqual(Course.query.count(), 0)
+
+    def make_course(self, tag, modules, lessons):
+        return save_course_tree(self.user_id, tag, tag, [
+            {'title': f'{tag} module {m}', 'description': f'{tag} {m}',
+             'lessons': [{'title': f'Lesson {n}', 'content': 'text'}
+                         for n in range(lessons)]}
+            for m in range(modules)]).id
+
+    def walk(self, course):
+        return [(module.title, [lesson.content for lesson in module.lessons])
+                for module in course.modules]
+
+    def test_course_tree_query_count_is_constant(self):
+        counts = []
+        for tag, size in (('small', 1), ('large', 8)):
+            course_id = self.make_course(tag, size, size)
+            db.session.expunge_all()
+            with QueryCounter(db.engine) as queries:
+                tree = self.walk(load_course_tree(course_id))
+            self.assertEqual(len(tree), size)
+            counts.append(queries.count)
+        self.assertEqual(counts, [3, 3])
+
+    def test_lazy_loading_is_n_plus_one(self):
+        course_id = self.make_course('lazy', 4, 2)
+        db.session.expunge_all()
+        with QueryCounter(db.engine) as queries:
+            self.walk(db.session.get(Course, course_id))
+        # Course, modules, each module's lessons, each lesson's content
+        self.assertEqual(queries.count, 1 + 1 + 4 + 8)
+
+    def test_module_tree(self):
+        course_id = self.make_course('python', 2, 3)
+        module_id = db.session.get(Course, course_id).modules[0].id
+        db.session.expunge_all()
+        with QueryCounter(db.engine) as queries:
+            module = load_module_tree(module_id)
+            self.assertEqual(len(module.lessons), 3)
+        self.assertEqual(queries.count, 2)
+
+    def test_missing_course(self):
+        self.assertIsNone(load_course_tree(404))
+        self.assertIsNone(load_module_tree(404))
+
+    def add_courses(self, count, completed=False):
+        # Pairs share a created_at so paging has to break ties on id
+        start = datetime(2024, 1, 1)
+        db.session.add_all(
+            Course(title=f'Course {i}', description='', user_id=self.user_id,
+                   completed=completed,
+                   created_at=start + timedelta(minutes=i // 2))
+            for i in range(count))
+        db.session.commit()
+
+    def test_course_pages_follow_cursor(self):
+        self.add_courses(7)
+        self.add_courses(2, completed=True)
+        titles, after = [], None
+        while True:
+            rows, after = list_courses(self.user_id, False, after, limit=3)
+            titles.extend(row.title for row in rows)
+            if after is None:
+                break
+        self.assertEqual(titles, [f'Course {i}' for i in range(6, -1, -1)])
+
+        rows, after = list_courses(self.user_id, True)
+        self.assertEqual(len(rows), 2)
+        self.assertIsNone(after)
+
+    def test_page_query_count_is_constant(self):
+        self.add_courses(30)
+        _, after = list_courses(self.user_id, False, limit=10)
+        with QueryCounter(db.engine) as queries:
+            rows, _ = list_courses(self.user_id, False, after, limit=10)
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(queries.count, 1)
+
+    def test_invalid_cursor(self):
+        for token in ('nope', '', 'WzEsMl0='):
+            with self.assertRaises(ValueError):
+                list_courses(self.user_id, False, token)
+
+
+
+class CreatedAtMigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = (
+            'sqlite:///' + os.path.join(self.tmp, 'site.db'))
+        db.init_app(self.app)
+        Migrate(self.app, db, directory=MIGRATIONS)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        # Courses from before created_at had a default
+        upgrade(directory=MIGRATIONS, revision='b5d0e8a3f6c2')
+        db.session.execute(text(
+            "INSERT INTO user (id, username, email, password_hash) "
+            "VALUES (1, 'u', 'u@example.com', 'x')"))
+        for course_id in (1, 2, 3):
+            db.session.execute(text(
+                "INSERT INTO courses (id, title, description, user_id, "
+                "completed) VALUES (:id, :title, 'Old', 1, 0)"),
+                {'id': course_id, 'title': f'Course {course_id}'})
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.ctx.pop()
+        shutil.rmtree(self.tmp)
+
+    def test_undated_courses_can_be_paged(self):
+        upgrade(directory=MIGRATIONS)
+        columns = {column['name']: column for column
+                   in inspect(db.engine).get_columns('courses')}
+        self.assertFalse(columns['created_at']['nullable'])
+        save_course_tree(1, 'New', 'Dated', [])
+        titles, after = [], None
+        while True:
+            rows, after = list_courses(1, False, after, limit=2)
+            titles.extend(row.title for row in rows)
+            if after is None:
+                break
+        self.assertEqual(titles, ['New', 'Course 3', 'Course 2', 'Course 1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
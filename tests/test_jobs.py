@@ -0,0 +1,230 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from models import db, User, Course, Lesson, GenerationJob
+from jobs import JobRunner, enqueue_job, job_to_dict
+
+MODULES = [
+    {'title': 'Basics', 'description': 'Getting started',
+     'lessons': [{'title': 'Variables', 'content': 'Naming values'}]},
+    {'title': 'Functions', 'description': 'Reusing code',
+     'lessons': [{'title': 'Arguments', 'content': 'Passing data'},
+                 {'title': 'Returns', 'content': 'Giving back'}]},
+]
+
+
+def fake_generate(title, description, level, on_outline=None,
+                  on_module_done=None):
+    # Module titles and descriptions are unique across all courses
+    modules = [dict(m, title=f"{title} {m['title']}",
+                    description=f"{title} {m['description']}",
+                    lessons=list(m['lessons'])) for m in MODULES]
+    on_outline(modules)
+    for index, module in enumerate(modules):
+        on_module_done(index, module)
+    return modules
+
+
+class JobsTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = \
+            'sqlite:///' + self.db_path
+        db.init_app(self.app)
+        with self.app.app_context():
+            db.create_all()
+            user = User(username='testuser', email='test@example.com',
+                        password_hash='x')
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        os.remove(self.db_path)
+
+    def enqueue(self, title='Python'):
+        with self.app.app_context():
+            job, created = enqueue_job(self.user_id, title, 'Intro',
+                                       'beginner')
+            return job.id, created
+
+    def test_identical_submission_reuses_job(self):
+        first, created = self.enqueue()
+        second, created_again = self.enqueue()
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(first, second)
+
+    def test_racing_submissions_create_one_job(self):
+        barrier = threading.Barrier(6)
+        results = []
+
+        def submit():
+            barrier.wait()
+            results.append(self.enqueue())
+
+        threads = [threading.Thread(target=submit) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len({job_id for job_id, _ in results}), 1)
+        self.assertEqual(sum(created for _, created in results), 1)
+        with self.app.app_context():
+            self.assertEqual(GenerationJob.query.count(), 1)
+
+    def test_run_saves_course_and_progress(self):
+        job_id, _ = self.enqueue()
+        JobRunner(self.app, fake_generate, max_workers=0).submit(job_id)
+        with self.app.app_context():
+            job = db.session.get(GenerationJob, job_id)
+            info = job_to_dict(job)
+            self.assertEqual(info['status'], 'succeeded')
+            self.assertEqual(info['modules_done'], 2)
+            self.assertEqual(info['modules_total'], 2)
+            self.assertIsNone(job.active_key)
+            course = db.session.get(Course, job.course_id)
+            self.assertEqual(course.title, 'Python')
+            self.assertEqual(Lesson.query.count(), 3)
+        # Once finished, the same submission may be queued again
+        self.assertTrue(self.enqueue()[1])
+
+    def test_failed_generation_marks_job(self):
+        def broken(*args, **kwargs):
+            raise RuntimeError('boom')
+
+        job_id, _ = self.enqueue()
+        JobRunner(self.app, broken, max_workers=0).submit(job_id)
+        with self.app.app_context():
+            job = db.session.get(GenerationJob, job_id)
+            self.assertEqual(job.status, 'failed')
+            self.assertIsNone(job.active_key)
+            self.assertEqual(Course.query.count(), 0)
+
+    def test_recover_requeues_stale_jobs_only(self):
+        stale, _ = self.enqueue('Stale')
+        live, _ = self.enqueue('Live')
+        queued, _ = self.enqueue('Queued')
+        with self.app.app_context():
+            now = datetime.utcnow()
+            for job_id, beat in ((stale, now - timedelta(hours=1)),
+                                 (live, now)):
+                job = db.session.get(GenerationJob, job_id)
+                job.status = 'running'
+                job.heartbeat_at = beat
+            db.session.commit()
+
+        runner = JobRunner(self.app, fake_generate, max_workers=0)
+        self.assertEqual(sorted(runner.recover()), sorted([stale, queued]))
+        with self.app.app_context():
+            statuses = {job.id: job.status
+                        for job in GenerationJob.query.all()}
+        self.assertEqual(statuses, {stale: 'succeeded', live: 'running',
+                                    queued: 'succeeded'})
+
+    def test_claimed_job_is_not_run_twice(self):
+        calls = []
+
+        def counting(*args, **kwargs):
+            calls.append(1)
+            return fake_generate(*args, **kwargs)
+
+        job_id, _ = self.enqueue()
+        runner = JobRunner(self.app, counting, max_workers=0)
+        runner.submit(job_id)
+        runner.submit(job_id)
+        self.assertEqual(len(calls), 1)
+
+    def test_slow_module_keeps_its_lease(self):
+        calls = []
+
+        def slow(*args, **kwargs):
+            calls.append(1)
+            # Longer than the lease without reporting progress
+            time.sleep(1)
+            runner.recover()
+            return fake_generate(*args, **kwargs)
+
+        job_id, _ = self.enqueue()
+        runner = JobRunner(self.app, slow, max_workers=0, lease_seconds=0.3)
+        runner.submit(job_id)
+        self.assertEqual(len(calls), 1)
+        with self.app.app_context():
+            job = db.session.get(GenerationJob, job_id)
+            self.assertEqual(job.status, 'succeeded')
+
+    def test_recover_due(self):
+        calls = []
+
+        def counting(*args, **kwargs):
+            calls.append(1)
+            return fake_generate(*args, **kwargs)
+
+        self.enqueue()
+        runner = JobRunner(self.app, counting, max_workers=0,
+                           lease_seconds=0.3)
+        runner.recover_due()
+        self.enqueue('Later')  # Not picked up until a third of the lease
+        runner.recover_due()
+        self.assertEqual(len(calls), 1)
+        time.sleep(0.15)
+        runner.recover_due()
+        self.assertEqual(len(calls), 2)
+
+    def test_restart_inside_the_lease(self):
+        job_id, _ = self.enqueue()
+        with self.app.app_context():
+            # Claimed by a process that died just before this one started
+            job = db.session.get(GenerationJob, job_id)
+            job.status = 'running'
+            job.heartbeat_at = datetime.utcnow()
+            db.session.commit()
+
+        runner = JobRunner(self.app, fake_generate, max_workers=0,
+                           lease_seconds=0.3)
+        runner.recover_due()
+        with self.app.app_context():
+            job = db.session.get(GenerationJob, job_id)
+            self.assertEqual(job.status, 'running')
+        time.sleep(0.4)
+        runner.recover_due()
+        with self.app.app_context():
+            job = db.session.get(GenerationJob, job_id)
+            self.assertEqual(job.status, 'succeeded')
+
+    def test_submitted_jobs_are_not_resubmitted(self):
+        job_id, _ = self.enqueue()
+        runner = JobRunner(self.app, fake_generate, max_workers=1)
+        release = threading.Event()
+        runner.executor.submit(release.wait)  # Keeps the job queued
+        try:
+            self.assertEqual(runner.recover(), [job_id])
+            self.assertEqual(runner.recover(), [])
+        finally:
+            release.set()
+            runner.executor.shutdown()
+        with self.app.app_context():
+            job = db.session.get(GenerationJob, job_id)
+            self.assertEqual(job.status, 'succeeded')
+
+    def test_recover_due_logs_failure(self):
+        with self.app.app_context():
+            db.drop_all()
+        runner = JobRunner(self.app, fake_generate, max_workers=0)
+        with self.assertLogs('jobs', 'ERROR'):
+            runner.recover_due()
+
+if __name__ == '__main__':
+    unittest.main()
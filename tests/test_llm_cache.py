@@ -0,0 +1,93 @@
+import os
+import tempfile
+import time
+import unittest
+
+from llm_cache import LLMCache, cache_key
+
+MESSAGES = [{"role": "user", "content": "What is a linked list?"}]
+
+
+class Counter:
+    def __init__(self, value="A chain of nodes."):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+class LLMCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'cache.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_key_covers_every_parameter(self):
+        base = cache_key("gpt-3.5-turbo", MESSAGES, 150, 0.5)
+        self.assertEqual(base, cache_key("gpt-3.5-turbo", list(MESSAGES),
+                                         150, 0.5))
+        self.assertNotEqual(base, cache_key("gpt-4", MESSAGES, 150, 0.5))
+        self.assertNotEqual(base, cache_key("gpt-3.5-turbo", MESSAGES,
+                                            100, 0.5))
+        self.assertNotEqual(base, cache_key("gpt-3.5-turbo", MESSAGES,
+                                            150, 0.0))
+
+    def test_repeat_prompt_is_served_from_memory(self):
+        cache = LLMCache()
+        call = Counter()
+        for _ in range(3):
+            value = cache.get_or_call(call, "gpt-3.5-turbo", MESSAGES, 150)
+        self.assertEqual(value, "A chain of nodes.")
+        self.assertEqual(call.calls, 1)
+        stats = cache.stats()
+        self.assertEqual((stats['memory_hits'], stats['misses']), (2, 1))
+
+    def test_disk_tier_survives_restart(self):
+        call = Counter()
+        LLMCache(path=self.path).get_or_call(call, "m", MESSAGES, 150)
+        restarted = LLMCache(path=self.path)
+        restarted.get_or_call(call, "m", MESSAGES, 150)
+        self.assertEqual(call.calls, 1)
+        self.assertEqual(restarted.stats()['disk_hits'], 1)
+
+    def test_entries_expire(self):
+        cache = LLMCache(ttl=0.05, path=self.path)
+        call = Counter()
+        cache.get_or_call(call, "m", MESSAGES, 150)
+        time.sleep(0.1)
+        cache.get_or_call(call, "m", MESSAGES, 150)
+        self.assertEqual(call.calls, 2)
+        self.assertGreaterEqual(cache.stats()['expirations'], 1)
+
+    def test_memory_tier_is_bounded(self):
+        cache = LLMCache(max_entries=2)
+        for n in range(5):
+            cache.set(str(n), "value")
+        self.assertEqual(cache.stats()['memory_entries'], 2)
+        self.assertEqual(cache.stats()['evictions'], 3)
+        self.assertIsNone(cache.get("0"))
+        self.assertEqual(cache.get("4"), "value")
+
+    def test_disk_tier_is_pruned(self):
+        cache = LLMCache(max_entries=1, path=self.path, disk_max_entries=3)
+        for n in range(6):
+            cache.set(str(n), "value")
+        cache.prune()
+        self.assertIsNone(cache.get("0"))
+        self.assertEqual(cache.get("5"), "value")
+        self.assertEqual(cache.stats()['evictions'], 5 + 3)
+
+    def test_empty_responses_are_not_cached(self):
+        cache = LLMCache()
+        call = Counter(value="")
+        cache.get_or_call(call, "m", MESSAGES, 150)
+        cache.get_or_call(call, "m", MESSAGES, 150)
+        self.assertEqual(call.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
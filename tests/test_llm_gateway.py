@@ -0,0 +1,232 @@
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+import openai
+
+from llm_gateway import (BATCH, INTERACTIVE, GatewayBusy, LLMGateway,
+                         get_default_gateway, request_key,
+                         set_default_gateway)
+
+MESSAGES = [{"role": "user", "content": "What is a linked list?"}]
+
+
+class MockClient:
+    """Stands in for openai.ChatCompletion.create."""
+
+    def __init__(self, latency=0.0, rate_limited=0):
+        self.latency = latency
+        self.rate_limited = rate_limited
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, **kwargs):
+        with self.lock:
+            self.calls.append(kwargs)
+            limited = self.rate_limited > 0
+            self.rate_limited -= 1
+        time.sleep(self.latency)
+        if limited:
+            raise openai.error.RateLimitError("slow down")
+        if kwargs.get('stream'):
+            return iter(['a', 'b'])
+        return kwargs['messages'][-1]['content'].upper()
+
+
+def in_threads(count, target):
+    threads = [threading.Thread(target=target, args=(n,))
+               for n in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class LLMGatewayTest(unittest.TestCase):
+    def test_call_passes_through(self):
+        client = MockClient()
+        gateway = LLMGateway(client)
+        self.assertEqual(gateway.call(model='m', messages=MESSAGES),
+                         'WHAT IS A LINKED LIST?')
+        self.assertEqual(client.calls[0]['model'], 'm')
+
+    def test_identical_concurrent_calls_are_coalesced(self):
+        client = MockClient(latency=0.2)
+        gateway = LLMGateway(client)
+        results = []
+        in_threads(5, lambda n: results.append(
+            gateway.call(model='m', messages=MESSAGES)))
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(gateway.metrics()['coalesced'], 4)
+
+    def test_request_timeout_does_not_split_a_flight(self):
+        self.assertEqual(request_key({'model': 'm', 'request_timeout': 5}),
+                         request_key({'model': 'm', 'request_timeout': 60}))
+        self.assertNotEqual(request_key({'model': 'm'}),
+                            request_key({'model': 'n'}))
+
+    def test_token_bucket_limits_rate(self):
+        client = MockClient()
+        gateway = LLMGateway(client, rate=20, burst=2)
+        start = time.perf_counter()
+        for n in range(6):
+            gateway.call(model='m', messages=[{'content': str(n)}])
+        # Two from the burst, then four at 20 per second
+        self.assertGreater(time.perf_counter() - start, 0.15)
+
+    def test_concurrency_limit(self):
+        client = MockClient(latency=0.1)
+        gateway = LLMGateway(client, rate=1000, burst=1000,
+                             max_concurrent=2)
+        peak = []
+
+        def call(n):
+            gateway.call(model='m', messages=[{'content': str(n)}])
+
+        def watch():
+            while len(client.calls) < 6:
+                peak.append(gateway.metrics()['active'])
+                time.sleep(0.01)
+
+        watcher = threading.Thread(target=watch)
+        watcher.start()
+        in_threads(6, call)
+        watcher.join()
+        self.assertEqual(max(peak), 2)
+
+    def test_interactive_is_admitted_before_batch(self):
+        client = MockClient(latency=0.05)
+        gateway = LLMGateway(client, rate=1000, burst=1000,
+                             max_concurrent=1)
+        order = []
+        blocker = threading.Thread(target=gateway.call, kwargs={
+            'model': 'm', 'messages': [{'content': 'first'}]})
+        blocker.start()
+        time.sleep(0.01)
+
+        def call(priority, name):
+            gateway.call(priority, model='m', messages=[{'content': name}])
+            order.append(name)
+
+        threads = [threading.Thread(target=call, args=(BATCH, 'batch'))]
+        threads[0].start()
+        time.sleep(0.01)
+        threads.append(threading.Thread(
+            target=call, args=(INTERACTIVE, 'chat')))
+        threads[1].start()
+        time.sleep(0.01)
+        depth = gateway.metrics()['queue_depth']
+        self.assertEqual(depth, {'interactive': 1, 'batch': 1})
+        for thread in [blocker] + threads:
+            thread.join()
+        self.assertEqual(order, ['chat', 'batch'])
+
+    def test_admission_timeout(self):
+        client = MockClient(latency=0.3)
+        gateway = LLMGateway(client, max_concurrent=1)
+        blocker = threading.Thread(target=gateway.call, kwargs={
+            'model': 'm', 'messages': [{'content': 'first'}]})
+        blocker.start()
+        time.sleep(0.02)
+        with self.assertRaises(GatewayBusy):
+            gateway.call(model='m', messages=MESSAGES, timeout=0.05)
+        blocker.join()
+        metrics = gateway.metrics()
+        self.assertEqual(metrics['rejected'], 1)
+        self.assertEqual(metrics['queue_depth']['interactive'], 0)
+
+    def test_shared_call_is_bounded_by_its_timeout(self):
+        client = MockClient(latency=0.3)
+        gateway = LLMGateway(client, max_concurrent=1)
+        blocker = threading.Thread(target=gateway.call, kwargs={
+            'model': 'm', 'messages': [{'content': 'first'}]})
+        blocker.start()
+        time.sleep(0.02)
+        leader = threading.Thread(target=gateway.call, kwargs={
+            'model': 'm', 'messages': MESSAGES})
+        leader.start()
+        time.sleep(0.02)
+        start = time.perf_counter()
+        with self.assertRaises(GatewayBusy):
+            gateway.call(model='m', messages=MESSAGES, timeout=0.05)
+        self.assertLess(time.perf_counter() - start, 0.2)
+        for thread in (blocker, leader):
+            thread.join()
+        self.assertEqual(gateway.metrics()['rejected'], 1)
+
+    def test_interactive_is_not_held_behind_queued_batch(self):
+        client = MockClient(latency=0.1)
+        gateway = LLMGateway(client, rate=1000, burst=1000,
+                             max_concurrent=1)
+        order = []
+        blocker = threading.Thread(target=gateway.call, kwargs={
+            'model': 'm', 'messages': [{'content': 'first'}]})
+        blocker.start()
+        time.sleep(0.01)
+
+        def call(priority):
+            gateway.call(priority, model='m', messages=MESSAGES)
+            order.append(priority)
+
+        threads = [threading.Thread(target=call, args=(BATCH,))]
+        threads[0].start()
+        time.sleep(0.01)
+        # Identical, but must not wait for the batch call's admission
+        threads.append(threading.Thread(target=call, args=(INTERACTIVE,)))
+        threads[1].start()
+        time.sleep(0.01)
+        self.assertEqual(gateway.metrics()['queue_depth'],
+                         {'interactive': 1, 'batch': 1})
+        for thread in [blocker] + threads:
+            thread.join()
+        self.assertEqual(order, [INTERACTIVE, BATCH])
+        self.assertEqual(gateway.metrics()['coalesced'], 0)
+
+    def test_upstream_429_pauses_admissions(self):
+        client = MockClient(rate_limited=1)
+        gateway = LLMGateway(client, cooldown=0.2)
+        with self.assertRaises(openai.error.RateLimitError):
+            gateway.call(model='m', messages=MESSAGES)
+        start = time.perf_counter()
+        gateway.call(model='m', messages=MESSAGES)
+        self.assertGreater(time.perf_counter() - start, 0.15)
+        self.assertEqual(gateway.metrics()['rate_limited'], 1)
+
+    def test_stream_holds_a_slot_until_exhausted(self):
+        client = MockClient()
+        gateway = LLMGateway(client)
+        chunks = gateway.stream(model='m', messages=MESSAGES)
+        self.assertEqual(next(chunks), 'a')
+        self.assertEqual(gateway.metrics()['active'], 1)
+        self.assertEqual(list(chunks), ['b'])
+        self.assertEqual(gateway.metrics()['active'], 0)
+        self.assertTrue(client.calls[0]['stream'])
+
+    def test_wait_times_are_recorded(self):
+        gateway = LLMGateway(MockClient())
+        gateway.call(BATCH, model='m', messages=MESSAGES)
+        waits = gateway.metrics()['wait_seconds']
+        self.assertEqual(waits['batch']['count'], 1)
+
+
+class DefaultGatewayTest(unittest.TestCase):
+    def tearDown(self):
+        set_default_gateway(None)
+
+    def test_settings_are_loaded_from_dotenv(self):
+        # As if .env set LLM_BURST, without an app to load it
+        def load_dotenv():
+            os.environ.setdefault('LLM_BURST', '3')
+
+        set_default_gateway(None)
+        with mock.patch.dict(os.environ), \
+                mock.patch('llm_gateway.load_dotenv', load_dotenv):
+            os.environ.pop('LLM_BURST', None)
+            self.assertEqual(get_default_gateway().burst, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from matchmaking import InMemoryMatchmaker, Matchmaker, SQLiteMatchmaker
+
+
+class MatchmakerTests:
+    """Behaviour every backend must share; mixed into a TestCase below."""
+
+    def make(self, **kwargs):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.matchmaker = self.make()
+
+    def test_two_users_are_paired(self):
+        self.assertEqual(self.matchmaker.join('alice'), (True, None))
+        queued, room = self.matchmaker.join('bob')
+        self.assertTrue(queued)
+        self.assertEqual(len(room), 8)
+        self.assertEqual(self.matchmaker.room_for('alice'), room)
+        self.assertFalse(self.matchmaker.is_waiting('alice'))
+        self.assertFalse(self.matchmaker.is_waiting('bob'))
+
+    def test_duplicate_join_is_rejected(self):
+        self.matchmaker.join('alice')
+        self.assertEqual(self.matchmaker.join('alice'), (False, None))
+        self.assertTrue(self.matchmaker.is_waiting('alice'))
+
+    def test_rejoining_forgets_previous_room(self):
+        self.matchmaker.join('alice')
+        self.matchmaker.join('bob')
+        self.matchmaker.join('alice')
+        self.assertIsNone(self.matchmaker.room_for('alice'))
+
+    def test_waiter_wakes_when_matched(self):
+        self.matchmaker.join('alice')
+        result = {}
+
+        def wait():
+            start = time.perf_counter()
+            result['room'] = self.matchmaker.wait_for_room('alice', 5)
+            result['waited'] = time.perf_counter() - start
+
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        time.sleep(0.1)
+        _, room = self.matchmaker.join('bob')
+        waiter.join()
+        self.assertEqual(result['room'], room)
+        self.assertLess(result['waited'], 1)
+
+    def test_wait_times_out(self):
+        self.matchmaker.join('alice')
+        start = time.perf_counter()
+        self.assertIsNone(self.matchmaker.wait_for_room('alice', 0.1))
+        self.assertGreaterEqual(time.perf_counter() - start, 0.1)
+        self.assertTrue(self.matchmaker.is_waiting('alice'))
+
+    def test_unmatched_waits_are_forgotten(self):
+        self.matchmaker.join('alice')
+        self.matchmaker.wait_for_room('alice', 0.05)
+        self.matchmaker.wait_for_room('bob', 0.05)
+        self.assertEqual(self.matchmaker._waiters, {})
+
+    def test_wait_returns_at_once_when_not_queued(self):
+        start = time.perf_counter()
+        self.assertIsNone(self.matchmaker.wait_for_room('alice', 5))
+        self.assertLess(time.perf_counter() - start, 0.1)
+
+    def test_stale_queue_entries_expire(self):
+        matchmaker = self.make(queue_ttl=0.05)
+        matchmaker.join('alice')
+        time.sleep(0.1)
+        # alice left long ago, so bob must not be paired with her
+        self.assertEqual(matchmaker.join('bob'), (True, None))
+        self.assertFalse(matchmaker.is_waiting('alice'))
+
+    def test_touch_keeps_waiting_user(self):
+        matchmaker = self.make(queue_ttl=0.2)
+        matchmaker.join('alice')
+        for _ in range(3):
+            time.sleep(0.1)
+            matchmaker.touch('alice')
+        self.assertIsNotNone(matchmaker.join('bob')[1])
+
+    def test_room_assignments_expire(self):
+        matchmaker = self.make(room_ttl=0.05)
+        matchmaker.join('alice')
+        matchmaker.join('bob')
+        time.sleep(0.1)
+        matchmaker.join('carol')
+        self.assertIsNone(matchmaker.room_for('alice'))
+
+    def test_fifo_mode_ignores_preferences(self):
+        self.matchmaker.join('alice', 'python', 'beginner')
+        _, room = self.matchmaker.join('bob', 'java', 'advanced')
+        self.assertIsNotNone(room)
+
+    def test_skill_mode_pairs_same_language_and_level(self):
+        matchmaker = self.make(mode='skill', skill_window=60)
+        matchmaker.join('alice', 'python', 'beginner')
+        matchmaker.join('bob', 'java', 'beginner')
+        self.assertEqual(matchmaker.join('carol', 'python', 'advanced'),
+                         (True, None))
+        _, room = matchmaker.join('dave', 'java', 'beginner')
+        self.assertEqual(matchmaker.room_for('bob'), room)
+        _, room = matchmaker.join('erin', 'python', 'beginner')
+        self.assertEqual(matchmaker.room_for('alice'), room)
+        self.assertTrue(matchmaker.is_waiting('carol'))
+
+    def test_skill_mode_falls_back_after_window(self):
+        matchmaker = self.make(mode='skill', skill_window=0.1)
+        matchmaker.join('alice', 'python', 'beginner')
+        time.sleep(0.15)
+        # Anyone may now take alice, who has waited out the window
+        _, room = matchmaker.join('bob', 'java', 'advanced')
+        self.assertIsNotNone(room)
+        self.assertEqual(matchmaker.room_for('alice'), room)
+
+    def test_skill_mode_pairs_expired_waiters_on_touch(self):
+        matchmaker = self.make(mode='skill', skill_window=0.1)
+        matchmaker.join('alice', 'python', 'beginner')
+        matchmaker.join('bob', 'java', 'advanced')
+        time.sleep(0.15)
+        matchmaker.touch('alice')
+        self.assertIsNotNone(matchmaker.room_for('alice'))
+        self.assertEqual(matchmaker.room_for('alice'),
+                         matchmaker.room_for('bob'))
+
+    def test_unknown_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.make(mode='random')
+
+
+class InMemoryMatchmakerTest(MatchmakerTests, unittest.TestCase):
+    def make(self, **kwargs):
+        return InMemoryMatchmaker(**kwargs)
+
+    def test_queue_lists_waiting_users_in_order(self):
+        matchmaker = self.make(mode='skill', skill_window=60)
+        for n, language in enumerate(['python', 'java', 'cpp']):
+            matchmaker.join(f'user{n}', language)
+        matchmaker.join('user3', 'java')
+        self.assertEqual(matchmaker.queue, ['user0', 'user2'])
+
+    def test_large_queue_drains_in_linear_time(self):
+        matchmaker = self.make(mode='skill', skill_window=60)
+        count = 20000
+        start = time.perf_counter()
+        for n in range(count):
+            matchmaker.join(f'a{n}', str(n))
+        for n in range(count):
+            matchmaker.join(f'b{n}', str(n))
+        elapsed = time.perf_counter() - start
+        self.assertEqual(matchmaker.queue, [])
+        # A list-scanning queue takes tens of seconds here
+        self.assertLess(elapsed, 5)
+
+
+class SQLiteMatchmakerTest(MatchmakerTests, unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.count = 0
+        super().setUp()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make(self, **kwargs):
+        self.count += 1
+        path = os.path.join(self.tmpdir.name, f'match{self.count}.db')
+        return SQLiteMatchmaker(path, poll_interval=0.05, **kwargs)
+
+    def test_processes_share_one_queue(self):
+        path = self.matchmaker.path
+        ctx = multiprocessing.get_context('fork')
+        workers = [ctx.Process(target=join_many, args=(path, worker, 50))
+                   for worker in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertTrue(all(worker.exitcode == 0 for worker in workers))
+
+        conn = sqlite3.connect(path)
+        rooms = conn.execute('SELECT room_name, COUNT(*) FROM match_rooms '
+                             'GROUP BY room_name').fetchall()
+        matched = {user for (user,) in conn.execute(
+            'SELECT username FROM match_rooms')}
+        waiting = {user for (user,) in conn.execute(
+            'SELECT username FROM match_queue')}
+        conn.close()
+
+        everyone = {f'user{w}-{n}' for w in range(4) for n in range(50)}
+        # Nobody lost, nobody matched twice, every room is a pair
+        self.assertEqual(matched | waiting, everyone)
+        self.assertFalse(matched & waiting)
+        self.assertEqual(len(matched), 2 * len(rooms))
+        self.assertTrue(all(count == 2 for _, count in rooms))
+        self.assertLessEqual(len(waiting), 1)
+
+
+def join_many(path, worker, count):
+    matchmaker = SQLiteMatchmaker(path)
+    for n in range(count):
+        matchmaker.join(f'user{worker}-{n}')
+
+
+class MatchmakerInterfaceTest(unittest.TestCase):
+    def test_backends_must_implement_every_method(self):
+        class Incomplete(Matchmaker):
+            def join(self, username, language=None, level=None):
+                return True, None
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,262 @@
+import importlib.util
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+from flask import Flask, Response, stream_with_context
+
+from models import db, User
+from metrics import (Registry, RequestMetrics, OUTBOUND_SECONDS, authorized,
+                     long_running, outbound)
+from log_config import JsonFormatter, configure_logging
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Two requests as greenlets under gunicorn's gevent patching: one holding
+# the CPU and one waiting
+GEVENT_PROFILE = '''
+from gevent import monkey
+monkey.patch_all()
+import json, time
+import gevent
+from metrics import SamplingProfiler
+
+profiler = SamplingProfiler(interval=0.002)
+
+def crunch():
+    profiler.begin()
+    deadline = time.perf_counter() + 0.2
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+    return profiler.end()
+
+def wait():
+    profiler.begin()
+    gevent.sleep(0.2)
+    return profiler.end()
+
+requests = [gevent.spawn(crunch), gevent.spawn(wait)]
+gevent.joinall(requests)
+print(json.dumps([dict(request.value) for request in requests]))
+'''
+
+
+class RegistryTest(unittest.TestCase):
+    def test_counter_and_histogram_text(self):
+        registry = Registry()
+        hits = registry.counter('hits_total', 'Hits.', ('route',))
+        hits.inc(route='/a')
+        hits.inc(2, route='/a')
+        latency = registry.histogram('latency_seconds', 'Latency.',
+                                     ('route',), buckets=(0.1, 1))
+        latency.observe(0.05, route='/a')
+        latency.observe(0.5, route='/a')
+        latency.observe(5, route='/a')
+
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE hits_total counter', lines)
+        self.assertIn('hits_total{route="/a"} 3', lines)
+        self.assertIn('# TYPE latency_seconds histogram', lines)
+        self.assertIn('latency_seconds_bucket{route="/a",le="0.1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{route="/a",le="1.0"} 2', lines)
+        self.assertIn('latency_seconds_bucket{route="/a",le="+Inf"} 3',
+                      lines)
+        self.assertIn('latency_seconds_sum{route="/a"} 5.55', lines)
+        self.assertIn('latency_seconds_count{route="/a"} 3', lines)
+
+    def test_label_values_are_escaped(self):
+        registry = Registry()
+        registry.counter('c', 'C.', ('v',)).inc(v='a"b\\c\nd')
+        self.assertIn('c{v="a\\"b\\\\c\\nd"} 1', registry.render())
+
+    def test_collectors(self):
+        registry = Registry()
+        registry.collect(lambda: [('queue_depth', 'gauge', 'Depth.',
+                                   [({'kind': 'batch'}, 4)])])
+        registry.collect(lambda: 1 / 0)  # Logged and skipped
+        with self.assertLogs('metrics', 'ERROR'):
+            text = registry.render()
+        self.assertIn('queue_depth{kind="batch"} 4', text)
+
+
+class RequestMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.registry = Registry()
+        self.metrics = RequestMetrics(self.app, registry=self.registry,
+                                      slow_seconds=0.05, profile=True,
+                                      profile_interval=0.002)
+        app = self.app
+
+        @app.route('/users/<int:user_id>')
+        def user(user_id):
+            db.session.get(User, user_id)
+            User.query.count()
+            return 'ok'
+
+        @app.route('/slow')
+        def slow():
+            with outbound('example'):
+                busy_wait(0.1)
+            return 'done'
+
+        @app.route('/fail')
+        def fail():
+            raise RuntimeError('boom')
+
+        @app.route('/stream')
+        def stream():
+            def chunks():
+                for _ in range(3):
+                    time.sleep(0.03)
+                    yield 'x'
+            return Response(stream_with_context(chunks()))
+
+        @app.route('/poll')
+        @long_running
+        def poll():
+            time.sleep(0.1)
+            return 'nothing yet'
+
+        with app.app_context():
+            db.create_all()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+
+    def test_labels_by_route_and_counts_sql(self):
+        self.client.get('/users/1')
+        self.client.get('/users/2')
+        self.client.get('/missing')
+        self.assertEqual(self.metrics.requests.value(
+            route='/users/<int:user_id>', method='GET', status='200'), 2)
+        self.assertEqual(self.metrics.requests.value(
+            route='<unmatched>', method='GET', status='404'), 1)
+        text = self.registry.render()
+        self.assertIn(
+            'http_request_sql_queries_sum{route="/users/<int:user_id>"} 4',
+            text)
+        self.assertEqual(len(self.metrics.slow_requests), 0)
+
+    def test_errors_count_as_500(self):
+        self.app.config['PROPAGATE_EXCEPTIONS'] = False
+        with self.assertLogs(self.app.logger, 'ERROR'):
+            self.client.get('/fail')
+        self.assertEqual(self.metrics.requests.value(
+            route='/fail', method='GET', status='500'), 1)
+
+    def test_slow_request_is_logged_and_profiled(self):
+        before = OUTBOUND_SECONDS.count(service='example', outcome='ok')
+        with self.assertLogs('metrics', 'WARNING') as logs:
+            self.client.get('/slow')
+        self.assertIn('Slow request GET /slow', logs.output[0])
+        record, = self.metrics.slow_requests
+        self.assertEqual(record['outbound_calls'], 1)
+        self.assertGreaterEqual(record['outbound_ms'], 100)
+        self.assertTrue(any('busy_wait' in line
+                            for line in record['profile']))
+        self.assertEqual(OUTBOUND_SECONDS.count(service='example',
+                                                outcome='ok'), before + 1)
+
+    def test_streamed_response_is_timed_to_the_end(self):
+        response = self.client.get('/stream')
+        self.assertEqual(response.get_data(as_text=True), 'xxx')
+        response.close()
+        self.assertEqual(self.metrics.duration.count(route='/stream',
+                                                     method='GET'), 1)
+        record, = self.metrics.slow_requests
+        self.assertGreaterEqual(record['duration_ms'], 90)
+
+    def test_long_running_views_are_not_reported_slow(self):
+        with self.assertNoLogs('metrics', 'WARNING'):
+            self.client.get('/poll')
+        self.assertEqual(len(self.metrics.slow_requests), 0)
+        self.assertEqual(self.metrics.duration.count(route='/poll',
+                                                     method='GET'), 1)
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class OutboundTest(unittest.TestCase):
+    def test_outcome(self):
+        ok = OUTBOUND_SECONDS.count(service='test', outcome='ok')
+        error = OUTBOUND_SECONDS.count(service='test', outcome='error')
+        with outbound('test'):
+            pass
+        with self.assertRaises(ValueError):
+            with outbound('test'):
+                raise ValueError
+        self.assertEqual(OUTBOUND_SECONDS.count(service='test', outcome='ok'),
+                         ok + 1)
+        self.assertEqual(OUTBOUND_SECONDS.count(service='test',
+                                                outcome='error'), error + 1)
+
+    def test_authorized(self):
+        app = Flask(__name__)
+        for header, token, expected in (
+                ('Bearer s3cret', 's3cret', True),
+                ('bearer s3cret', 's3cret', True),
+                ('Bearer wrong', 's3cret', False),
+                ('s3cret', 's3cret', False),
+                (None, 's3cret', False),
+                ('Bearer ', None, False),
+                ('Bearer ', '', False)):
+            headers = {'Authorization': header} if header else {}
+            with app.test_request_context(headers=headers):
+                self.assertEqual(authorized(token), expected,
+                                 (header, token))
+
+
+class ProfilerTest(unittest.TestCase):
+    @unittest.skipIf(importlib.util.find_spec('gevent') is None,
+                     'gevent is not installed')
+    def test_greenlets_are_sampled(self):
+        result = subprocess.run([sys.executable, '-c', GEVENT_PROFILE],
+                                cwd=ROOT, capture_output=True, text=True,
+                                timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        crunch, wait = json.loads(result.stdout)
+        self.assertTrue(crunch)
+        self.assertTrue(all(':crunch' in stack for stack in crunch))
+        self.assertTrue(wait)
+        self.assertTrue(all(':wait;' in stack for stack in wait))
+
+
+class LoggingTest(unittest.TestCase):
+    def test_json_lines_carry_extra_fields(self):
+        record = logging.LogRecord('app', logging.INFO, __file__, 1,
+                                   'Matched %s', ('alice',), None)
+        record.room = 'room-1'
+        data = json.loads(JsonFormatter().format(record))
+        self.assertEqual(data['message'], 'Matched alice')
+        self.assertEqual(data['room'], 'room-1')
+        self.assertEqual(data['level'], 'INFO')
+
+    def test_level_gates_debug(self):
+        root = logging.getLogger()
+        level, handlers = root.level, list(root.handlers)
+        try:
+            configure_logging('INFO', 'json')
+            configure_logging('WARNING', 'text')  # Replaces, not adds
+            ours = [h for h in root.handlers if h not in handlers]
+            self.assertEqual(len(ours), 1)
+            self.assertFalse(logging.getLogger('app').isEnabledFor(
+                logging.INFO))
+        finally:
+            root.handlers[:] = handlers
+            root.setLevel(level)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import json
+import os
+import random
+import unittest
+
+from outline_parser import OutlineParser, parse_outline, split_lesson
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'outlines')
+
+
+def load_corpus():
+    with open(os.path.join(CORPUS, 'expected.json')) as f:
+        expected = json.load(f)
+    for name, modules in expected.items():
+        with open(os.path.join(CORPUS, name), newline='') as f:
+            yield name, f.read(), modules
+
+
+def parse_in_chunks(text, rng):
+    parser = OutlineParser()
+    modules = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 40)
+        modules += parser.feed(text[position:position + size])
+        position += size
+    return modules + parser.close()
+
+
+class OutlineParserTest(unittest.TestCase):
+    def test_corpus(self):
+        for name, text, expected in load_corpus():
+            with self.subTest(name):
+                modules = parse_outline(text)
+                self.assertEqual([[m['title'], len(m['lessons'])]
+                                  for m in modules], expected)
+
+    def test_any_chunking_gives_the_same_result(self):
+        rng = random.Random(0)
+        for name, text, _ in load_corpus():
+            whole = parse_outline(text)
+            for _ in range(25):
+                with self.subTest(name):
+                    self.assertEqual(parse_in_chunks(text, rng), whole)
+
+    def test_module_is_emitted_when_the_next_begins(self):
+        parser = OutlineParser()
+        self.assertEqual(parser.feed("Module Title: One\n1. A: a\n"), [])
+        # Only once the next title line is complete
+        self.assertEqual(parser.feed("Module Title: Tw"), [])
+        done = parser.feed("o\n")
+        self.assertEqual([m['title'] for m in done], ['One'])
+        self.assertEqual([m['title'] for m in parser.close()], ['Two'])
+
+    def test_lessons_past_nine_and_without_colons(self):
+        # Both used to raise in the original parser
+        modules = parse_outline("Module Title: M\nLessons:\n"
+                                "10. Recursion: Calling yourself\n"
+                                "11. Iteration without a colon\n")
+        self.assertEqual(modules[0]['lessons'], [
+            {'title': 'Recursion', 'content': 'Calling yourself'},
+            {'title': 'Iteration without a colon',
+             'content': 'Iteration without a colon'},
+        ])
+
+    def test_split_lesson(self):
+        self.assertEqual(split_lesson('**Big-O**: Growth rates'),
+                         ('Big-O', 'Growth rates'))
+        self.assertEqual(split_lesson('Queues - FIFO order'),
+                         ('Queues', 'FIFO order'))
+        self.assertEqual(split_lesson(': only text'),
+                         ('only text', 'only text'))
+
+    def test_fuzzed_outlines_never_raise(self):
+        rng = random.Random(1)
+        corpus = [text for _, text, _ in load_corpus()]
+        alphabet = 'Module Title:Description.Lessons\n1234567890-*#: '
+        for _ in range(500):
+            chars = list(rng.choice(corpus))
+            for _ in range(rng.randint(1, 30)):
+                position = rng.randrange(len(chars) + 1)
+                action = rng.random()
+                if action < 0.4 and chars:
+                    del chars[position:position + rng.randint(1, 20)]
+                elif action < 0.8:
+                    chars.insert(position, rng.choice(alphabet))
+                else:
+                    chars = chars[:position]
+            for module in parse_in_chunks(''.join(chars), rng):
+                self.assertIsInstance(module['title'], str)
+                self.assertTrue(module['title'])
+                for lesson in module['lessons']:
+                    self.assertTrue(lesson['title'])
+                    self.assertTrue(lesson['content'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+
+from flask import Flask, abort, flash
+from flask_login import LoginManager
+
+from models import db, CacheVersion
+from page_cache import PageCache, bump_version, get_version, course_key
+
+
+class PageCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SECRET_KEY'] = 'test'
+        db.init_app(self.app)
+        LoginManager(self.app).user_loader(lambda user_id: None)
+        self.cache = PageCache(max_entries=8)
+        self.renders = []
+
+        @self.app.route('/courses/<int:course_id>')
+        @self.cache.cached(course_key)
+        def view_course(course_id):
+            if course_id == 404:
+                abort(404)
+            self.renders.append(course_id)
+            return f'course {course_id} render {len(self.renders)}'
+
+        @self.app.route('/flash')
+        def flash_message():
+            flash('Course deleted successfully!', 'success')
+            return ''
+
+        with self.app.app_context():
+            db.create_all()
+        self.client = self.app.test_client()
+
+    def bump(self, course_id):
+        with self.app.app_context():
+            bump_version(course_key(course_id))
+            db.session.commit()
+
+    def test_bump_version_increments(self):
+        with self.app.app_context():
+            self.assertEqual(get_version('course:1'), 0)
+            bump_version('course:1', 'module:2')
+            bump_version('course:1')
+            db.session.commit()
+            self.assertEqual(get_version('course:1'), 2)
+            self.assertEqual(get_version('module:2'), 1)
+            self.assertEqual(CacheVersion.query.count(), 2)
+
+    def test_repeat_views_are_served_from_cache(self):
+        first = self.client.get('/courses/1')
+        second = self.client.get('/courses/1')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(self.renders, [1])
+        self.assertEqual(first.headers['ETag'], second.headers['ETag'])
+        self.assertEqual((self.cache.misses, self.cache.hits), (1, 1))
+
+    def test_matching_etag_gets_304(self):
+        etag = self.client.get('/courses/1').headers['ETag']
+        response = self.client.get('/courses/1',
+                                   headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(self.renders, [1])
+
+    def test_bump_invalidates_page_and_etag(self):
+        etag = self.client.get('/courses/1').headers['ETag']
+        self.bump(1)
+        response = self.client.get('/courses/1',
+                                   headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(self.renders, [1, 1])
+        # Other courses keep their cached pages
+        self.client.get('/courses/2')
+        self.bump(1)
+        self.client.get('/courses/2')
+        self.assertEqual(self.renders, [1, 1, 2])
+
+    def test_pending_flash_bypasses_cache(self):
+        self.client.get('/courses/1')
+        self.client.get('/flash')
+        response = self.client.get('/courses/1')
+        self.assertNotIn('ETag', response.headers)
+        self.assertEqual(self.renders, [1, 1])
+
+    def test_errors_are_not_cached(self):
+        self.assertEqual(self.client.get('/courses/404').status_code, 404)
+        self.assertEqual(self.cache.misses, 1)
+        self.assertEqual(self.client.get('/courses/404').status_code, 404)
+        self.assertEqual(self.cache.misses, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from flask import Flask
+from flask_migrate import Migrate, downgrade, upgrade
+from sqlalchemy import create_engine, inspect, text
+
+from models import db, User, Course, Module, Lesson, Quiz, GenerationJob
+from course_store import list_courses, load_course_tree, load_module_tree
+from instrumentation import QueryCounter, query_plan
+from jobs import QUEUED, RUNNING
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'migrations')
+# Tables big enough that a scan of them would hurt as they grow
+LARGE_TABLES = ('courses', 'modules', 'lessons', 'quiz', 'generation_jobs')
+
+
+class QueryPlanTest(unittest.TestCase):
+    """Each hot query must SEARCH an index, never SCAN a large table.
+
+    The queries are the ones the routes and JobRunner run; if one of them
+    changes shape, change it here too.
+    """
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.seed()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def seed(self):
+        for u in range(3):
+            user = User(username=f'user{u}', email=f'user{u}@example.com',
+                        password_hash='x')
+            db.session.add(user)
+            db.session.flush()
+            for c in range(5):
+                course = Course(title=f'Course {u}.{c}', description=f'{u}.{c}',
+                                user_id=user.id, completed=c % 2 == 0)
+                db.session.add(course)
+                db.session.flush()
+                db.session.add(Quiz(course_id=course.id, questions='[]'))
+                for m in range(2):
+                    module = Module(title=f'Module {u}.{c}.{m}',
+                                    description=f'{u}.{c}.{m}',
+                                    course_id=course.id)
+                    db.session.add(module)
+                    db.session.flush()
+                    for n in range(3):
+                        db.session.add(Lesson(title=f'Lesson {u}.{c}.{m}.{n}',
+                                              content='...',
+                                              module_id=module.id))
+            db.session.add(GenerationJob(user_id=user.id, title='T',
+                                         description='D', level='beginner'))
+        db.session.commit()
+        db.session.expunge_all()
+
+    def plans(self, run):
+        """The query plan of every SELECT that ``run`` executes."""
+        with QueryCounter(db.engine) as queries:
+            run()
+        connection = db.session.connection()
+        return [(statement, query_plan(connection, statement, parameters))
+                for statement, parameters in zip(queries.statements,
+                                                 queries.parameters)
+                if statement.lstrip().upper().startswith('SELECT')]
+
+    def assertSearches(self, run):
+        plans = self.plans(run)
+        self.assertTrue(plans)
+        for statement, steps in plans:
+            for step in steps:
+                table = step.split()[1] if len(step.split()) > 1 else ''
+                if table in LARGE_TABLES:
+                    self.assertTrue(
+                        step.startswith('SEARCH'),
+                        f'{step!r} scans a table for:\n{statement}')
+
+    def test_manage_courses(self):
+        self.assertSearches(lambda: Course.query.filter_by(
+            user_id=1, completed=False).all())
+
+    def test_completed_courses(self):
+        self.assertSearches(lambda: Course.query.filter_by(
+            completed=True, user_id=1).all())
+
+    def test_course_list_pages(self):
+        _, cursor = list_courses(1, False, limit=1)
+        for after in (None, cursor):
+            self.assertSearches(lambda: list_courses(1, False, after, 1))
+            plans = self.plans(lambda: list_courses(1, True, after, 1))
+            for _, steps in plans:
+                # The index yields rows in page order, so nothing is sorted
+                self.assertFalse([step for step in steps
+                                  if 'TEMP B-TREE' in step], steps)
+
+    def test_generate_course_duplicate_checks(self):
+        self.assertSearches(lambda: Course.query.filter_by(
+            user_id=1, description='0.1').first())
+        self.assertSearches(lambda: Course.query.filter_by(
+            user_id=1, title='Course 0.1').first())
+
+    def test_course_and_module_trees(self):
+        self.assertSearches(lambda: load_course_tree(1))
+        self.assertSearches(lambda: load_module_tree(1))
+
+    def test_relationship_loads(self):
+        def load():
+            course = db.session.get(Course, 2)
+            course.modules[0].lessons
+            course.quizzes
+        self.assertSearches(load)
+
+    def test_job_recovery(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=300)
+        self.assertSearches(lambda: GenerationJob.query.filter(
+            GenerationJob.status == RUNNING,
+            GenerationJob.heartbeat_at < cutoff).all())
+        self.assertSearches(lambda: db.session.query(
+            GenerationJob.id).filter_by(status=QUEUED).all())
+
+    def test_detects_a_scan(self):
+        for name in ('ix_courses_user_id_completed_created_at',
+                     'ix_courses_user_id_title',
+                     'ix_courses_user_id_description'):
+            db.session.execute(text(f'DROP INDEX {name}'))
+        with self.assertRaises(AssertionError):
+            self.assertSearches(lambda: Course.query.filter_by(
+                user_id=1, completed=False).all())
+
+
+class IndexMigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = (
+            'sqlite:///' + os.path.join(self.tmp, 'site.db'))
+        db.init_app(self.app)
+        Migrate(self.app, db, directory=MIGRATIONS)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        # A database created before the indexes existed
+        db.create_all()
+        for name in self.indexes():
+            db.session.execute(text(f'DROP INDEX {name}'))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.ctx.pop()
+        shutil.rmtree(self.tmp)
+
+    def indexes(self):
+        inspector = inspect(db.engine)
+        return {index['name']
+                for table in inspector.get_table_names()
+                for index in inspector.get_indexes(table)
+                if index['name'].startswith('ix_')}
+
+    def test_upgrade_adds_model_indexes(self):
+        self.assertEqual(self.indexes(), set())
+        upgrade(directory=MIGRATIONS)
+        expected = {index.name for table in db.metadata.tables.values()
+                    for index in table.indexes}
+        self.assertEqual(self.indexes(), expected)
+
+        downgrade(directory=MIGRATIONS, revision='base')
+        self.assertEqual(self.indexes(), set())
+
+    def test_upgrade_skips_existing_indexes(self):
+        db.session.execute(text('CREATE INDEX ix_modules_course_id '
+                                'ON modules (course_id)'))
+        db.session.commit()
+        upgrade(directory=MIGRATIONS)
+        self.assertIn('ix_lessons_module_id', self.indexes())
+
+    def test_upgrade_creates_schema_on_empty_database(self):
+        db.drop_all()
+        upgrade(directory=MIGRATIONS)
+        reference = create_engine('sqlite://')
+        db.metadata.create_all(reference)
+        self.assertEqual(schema(db.engine), schema(reference))
+
+        # The tables stay, as the base revision cannot tell whether it
+        # created them
+        downgrade(directory=MIGRATIONS, revision='base')
+        self.assertEqual(self.indexes(), set())
+
+
+def schema(engine):
+    """Tables, columns, keys and indexes of ``engine``'s database."""
+    inspector = inspect(engine)
+    return {table: {
+        'columns': [(column['name'], str(column['type']), column['nullable'])
+                    for column in inspector.get_columns(table)],
+        'primary_key': inspector.get_pk_constraint(table)[
+            'constrained_columns'],
+        'foreign_keys': sorted((key['constrained_columns'],
+                                key['referred_table'])
+                               for key in inspector.get_foreign_keys(table)),
+        'unique': sorted(constraint['column_names'] for constraint
+                         in inspector.get_unique_constraints(table)),
+        'indexes': sorted((index['name'], index['column_names'])
+                          for index in inspector.get_indexes(table)),
+    } for table in inspector.get_table_names() if table != 'alembic_version'}
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Run before each test's code: two users and a way to log them in
+SETUP = '''
+import json, time
+from app import app, bcrypt, db, User
+app.config['WTF_CSRF_ENABLED'] = False
+with app.app_context():
+    db.create_all()
+    for name in ('alice', 'bob'):
+        db.session.add(User(username=name, email=name + '@example.com',
+                            password_hash=bcrypt.generate_password_hash(
+                                'password', 4).decode('utf-8')))
+    db.session.commit()
+
+def login(name):
+    client = app.test_client()
+    client.post('/login', data={'email': name + '@example.com',
+                                'password': 'password'})
+    return client
+'''
+
+
+class RouteTest(unittest.TestCase):
+    """Routes through the app's test client, each test in a fresh
+    interpreter on its own database (the app is configured on import)."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.database = os.path.join(self.tmp, 'site.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_app(self, code, **env):
+        """Run ``code`` after SETUP, with ``env`` added to the environment;
+        returns what it prints as JSON."""
+        env = dict(os.environ, DATABASE_URL='sqlite:///' + self.database,
+                   COURSE_JOB_WORKERS='0', LOG_LEVEL='WARNING', **env)
+        result = subprocess.run([sys.executable, '-c', SETUP + code],
+                                cwd=ROOT, env=env, capture_output=True,
+                                text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return json.loads(result.stdout)
+
+    def test_wait_match_does_not_hold_a_sync_worker(self):
+        output = self.run_app(
+            "alice = login('alice')\n"
+            "alice.get('/join_queue')\n"
+            "start = time.perf_counter()\n"
+            "data = alice.get('/wait_match').get_json()\n"
+            "print(json.dumps([data, time.perf_counter() - start]))")
+        data, seconds = output
+        self.assertEqual(data, {'matched': False, 'waiting': True,
+                                'retry_after': 3.0})
+        self.assertLess(seconds, 1)
+
+    def test_wait_match_long_polls_on_threaded_servers(self):
+        output = self.run_app(
+            "alice = login('alice')\n"
+            "alice.get('/join_queue')\n"
+            "start = time.perf_counter()\n"
+            "data = alice.get('/wait_match?timeout=0.5', environ_overrides="
+            "{'wsgi.multithread': True}).get_json()\n"
+            "print(json.dumps([data, time.perf_counter() - start]))")
+        data, seconds = output
+        self.assertEqual(data, {'matched': False, 'waiting': True})
+        self.assertGreaterEqual(seconds, 0.5)
+
+    def test_wait_match_reports_a_match_made_after_the_wait(self):
+        output = self.run_app(
+            "from app import matchmaker\n"
+            "alice = login('alice')\n"
+            "alice.get('/join_queue')\n"
+            "wait_for_room = matchmaker.wait_for_room\n"
+            "def paired_late(username, timeout):\n"
+            "    room_name = wait_for_room(username, timeout)\n"
+            "    matchmaker.join('bob')\n"
+            "    return room_name\n"
+            "matchmaker.wait_for_room = paired_late\n"
+            "data = alice.get('/wait_match').get_json()\n"
+            "print(json.dumps([data, matchmaker.room_for('bob')]))")
+        data, room_name = output
+        self.assertEqual(data, {'matched': True, 'room_name': room_name})
+
+    def test_long_polls_are_not_slow_requests(self):
+        output = self.run_app(
+            "from app import request_metrics\n"
+            "request_metrics.slow_seconds = 0.1\n"
+            "alice = login('alice')\n"
+            "alice.get('/join_queue')\n"
+            "alice.get('/wait_match?timeout=0.3', environ_overrides="
+            "{'wsgi.multithread': True})\n"
+            "print(len(request_metrics.slow_requests))")
+        self.assertEqual(output, 0)
+
+    def test_completed_course_has_completed_at(self):
+        output = self.run_app(
+            "from app import Course\n"
+            "with app.app_context():\n"
+            "    db.session.add(Course(title='Graphs', description='Paths',"
+            " user_id=1))\n"
+            "    db.session.commit()\n"
+            "alice = login('alice')\n"
+            "alice.post('/courses/1/complete')\n"
+            "print(json.dumps(alice.get('/api/courses?status=completed')"
+            ".get_json()))")
+        course, = output['courses']
+        self.assertEqual(course['id'], 1)
+        self.assertIsNotNone(course['completed_at'])
+
+    def test_deleting_a_course_drops_its_module_pages(self):
+        output = self.run_app(
+            "from app import Course, Module\n"
+            "with app.app_context():\n"
+            "    db.session.add(Course(title='Graphs', description='Paths',"
+            " user_id=1))\n"
+            "    db.session.add(Module(title='BFS', description='Layers',"
+            " course_id=1))\n"
+            "    db.session.commit()\n"
+            "alice = login('alice')\n"
+            "before = alice.get('/modules/1/lessons')\n"
+            "alice.post('/courses/1/delete', follow_redirects=True)\n"
+            "after = alice.get('/modules/1/lessons', headers={"
+            "'If-None-Match': before.headers['ETag']})\n"
+            "print(json.dumps([before.status_code, after.status_code]))")
+        self.assertEqual(output, [200, 404])
+
+    def test_local_compile_requires_login(self):
+        output = self.run_app(
+            "run = {'script': 'print(1)', 'language': 'python3'}\n"
+            "anonymous = app.test_client().post('/compile', json=run)\n"
+            "alice = login('alice').post('/compile', json=run)\n"
+            "print(json.dumps([anonymous.status_code, alice.get_json()]))",
+            COMPILE_BACKEND='local', SANDBOX_ALLOW_UNSAFE='1',
+            SANDBOX_WORKERS='1', SANDBOX_CACHE_DIR=self.tmp)
+        status, result = output
+        self.assertEqual(status, 302)
+        self.assertEqual(result['output'], '1\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
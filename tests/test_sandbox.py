@@ -0,0 +1,131 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from sandbox import LocalRunner, UnsupportedLanguage, _Process
+
+HELLO_CPP = '''
+#include <iostream>
+#include <string>
+int main() {
+    std::string name;
+    std::cin >> name;
+    std::cout << "hello " << name << std::endl;
+}
+'''
+
+
+class LocalRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.runner = LocalRunner(workers=2, cpu_seconds=1, wall_seconds=2,
+                                  memory_mb=256, output_bytes=4096,
+                                  cache_dir=self.cache_dir)
+
+    def tearDown(self):
+        self.runner.close()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_python_reads_stdin(self):
+        result = self.runner.run('print(input().upper())', 'python3',
+                                 stdin='abc\n')
+        self.assertEqual(result['output'], 'ABC\n')
+        self.assertNotIn('error', result)
+        self.assertIn('cpuTime', result)
+
+    def test_python_traceback_is_output(self):
+        result = self.runner.run('1 / 0', 'python3')
+        self.assertIn('ZeroDivisionError', result['output'])
+        self.assertIn('main.py', result['output'])
+        self.assertNotIn('<string>', result['output'])
+
+    def test_runs_do_not_share_state(self):
+        self.runner.run('import os; open("x", "w").write("1")', 'python3')
+        result = self.runner.run('import os; print(os.path.exists("x"))',
+                                 'python3')
+        self.assertEqual(result['output'], 'False\n')
+
+    def test_wall_time_limit(self):
+        start = time.perf_counter()
+        result = self.runner.run('import time; time.sleep(10)', 'python3')
+        self.assertEqual(result['error'], 'Time limit exceeded')
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_wall_time_limit_with_unread_stdin(self):
+        # More input than a pipe holds, for a program that never reads it
+        process = _Process([sys.executable, '-c', 'import time; '
+                            'time.sleep(10)'], None)
+        start = time.perf_counter()
+        try:
+            returncode, _, _ = process.finish(b'x' * 2 ** 20, 1, 4096)
+        finally:
+            process.close()
+        self.assertEqual(returncode, -9)
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_cpu_time_limit(self):
+        result = self.runner.run('while True: pass', 'python3')
+        self.assertEqual(result['error'], 'CPU time limit exceeded')
+
+    def test_memory_limit(self):
+        result = self.runner.run('x = bytearray(1024 ** 3)', 'python3')
+        self.assertEqual(result['error'], 'Memory limit exceeded')
+
+    def test_process_limit_is_set(self):
+        result = self.runner.run(
+            'import resource\n'
+            'print(*resource.getrlimit(resource.RLIMIT_NPROC))', 'python3')
+        self.assertEqual(result['output'], '16 16\n')
+
+    @unittest.skipIf(os.geteuid() == 0, 'RLIMIT_NPROC does not apply to root')
+    def test_fork_loop_is_contained(self):
+        # Bounded, so a missing limit fails the test rather than the host
+        result = self.runner.run(
+            'import os, time\n'
+            'children = 0\n'
+            'try:\n'
+            '    for _ in range(200):\n'
+            '        if os.fork() == 0:\n'
+            '            time.sleep(10)\n'
+            '            os._exit(0)\n'
+            '        children += 1\n'
+            'except OSError:\n'
+            '    print("refused after", children)\n', 'python3')
+        self.assertRegex(result['output'], r'^refused after \d+\n')
+        self.assertLess(int(result['output'].split()[-1]), 16)
+
+    def test_output_limit(self):
+        result = self.runner.run('while True: print("x" * 100)', 'python3')
+        self.assertEqual(result['error'], 'Output limit exceeded')
+        self.assertLessEqual(len(result['output']), 4096)
+
+    def test_failed_runs_are_not_cached(self):
+        self.runner.run('while True: pass', 'python3')
+        self.runner.run('while True: pass', 'python3')
+        self.assertEqual(self.runner.stats()['misses'], 2)
+
+    def test_unsupported_language(self):
+        with self.assertRaises(UnsupportedLanguage):
+            self.runner.run('puts 1', 'ruby')
+
+    @unittest.skipUnless(shutil.which('g++'), 'g++ is not installed')
+    def test_cpp_binary_is_cached_by_source(self):
+        first = self.runner.run(HELLO_CPP, 'cpp14', stdin='ada')
+        second = self.runner.run(HELLO_CPP, 'cpp14', stdin='grace')
+        self.assertEqual(first['output'], 'hello ada\n')
+        self.assertEqual(second['output'], 'hello grace\n')
+        self.assertEqual(self.runner.compiles, 1)
+        self.assertEqual(self.runner.artifact_hits, 1)
+
+    @unittest.skipUnless(shutil.which('g++'), 'g++ is not installed')
+    def test_cpp_compile_errors_are_output(self):
+        result = self.runner.run('int main() { return x; }', 'cpp14')
+        self.assertIn('was not declared', result['output'])
+        self.assertNotIn(self.cache_dir, result['output'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,264 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask
+from flask_migrate import Migrate, upgrade
+from sqlalchemy import text
+
+from compressed_text import TextCodec
+from models import db, User, Module, Lesson
+from course_store import save_course_tree
+from search_index import SearchIndex, doc_rowid, split_rowid
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'migrations')
+
+
+class SearchIndexTests:
+    """Run against each backend by the TestCase subclasses below."""
+
+    BACKEND = None
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.index = SearchIndex(self.BACKEND)
+        users = [User(username=f'user{n}', email=f'user{n}@example.com',
+                      password_hash='x') for n in range(2)]
+        db.session.add_all(users)
+        db.session.commit()
+        self.user_id, self.other_id = users[0].id, users[1].id
+        self.course = save_course_tree(
+            self.user_id, 'Graph algorithms', 'Shortest paths and search', [
+                {'title': 'Traversal', 'description': 'Visiting every node',
+                 'lessons': [
+                     {'title': 'Breadth first',
+                      'content': 'A queue drives breadth first graph search'},
+                     {'title': 'Depth first',
+                      'content': 'Recursion or a stack, on any graph'}]}])
+        save_course_tree(self.other_id, 'Graph theory', 'Proofs', [])
+
+    def tearDown(self):
+        self.index.close()
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def titles(self, query, user_id=None):
+        return [result['title'] for result in self.index.search(
+            user_id or self.user_id, query)]
+
+    def test_rowids_encode_kind_and_id(self):
+        for kind in ('course', 'module', 'lesson'):
+            self.assertEqual(split_rowid(doc_rowid(kind, 12)), (kind, 12))
+
+    def test_title_matches_rank_first(self):
+        results = self.index.search(self.user_id, 'graph')
+        self.assertEqual(results[0]['kind'], 'course')
+        self.assertEqual(results[0]['id'], self.course.id)
+        self.assertEqual({result['title'] for result in results[1:]},
+                         {'Breadth first', 'Depth first'})
+        self.assertEqual({result['parent_id'] for result in results[1:]},
+                         {self.course.modules[0].id})
+        self.assertGreater(results[0]['score'], results[1]['score'])
+
+    def test_scoped_to_user(self):
+        self.assertEqual(self.titles('proofs'), [])
+        self.assertEqual(self.titles('graph', self.other_id),
+                         ['Graph theory'])
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.titles('queue graph'), ['Breadth first'])
+        self.assertEqual(self.titles('queue heap'), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.titles('graph')  # The memory index is built on first use
+        for query in ('graph OR "', 'NEAR(graph', 'owner:u2 graph', '*'):
+            self.index.search(self.user_id, query)
+        self.assertEqual(self.titles('"owner" graph'), [])
+
+    def test_writes_are_indexed(self):
+        self.titles('graph')
+        module = Module(title='Weighted', description='Edge costs',
+                        course_id=self.course.id)
+        db.session.add(module)
+        db.session.commit()
+        lesson = Lesson(title='Dijkstra', content='A heap of distances',
+                        module_id=module.id)
+        db.session.add(lesson)
+        db.session.commit()
+        self.assertEqual(self.titles('heap'), ['Dijkstra'])
+        self.assertEqual(self.titles('edge'), ['Weighted'])
+
+        db.session.delete(lesson)
+        db.session.commit()
+        self.assertEqual(self.titles('heap'), [])
+
+    def test_deleting_a_course_removes_its_tree(self):
+        self.titles('graph')
+        db.session.delete(self.course)
+        db.session.commit()
+        self.assertEqual(self.titles('graph'), [])
+        self.assertEqual(self.titles('recursion'), [])
+
+    def test_updates_are_indexed(self):
+        self.titles('graph')
+        lesson = self.course.modules[0].lessons[1]
+        lesson.title = 'Backtracking'
+        db.session.commit()
+        self.assertEqual(self.titles('backtracking'), ['Backtracking'])
+        self.assertEqual(self.titles('depth'), [])
+        self.assertEqual(self.titles('recursion'), ['Backtracking'])
+        lesson.content = 'Try, then undo'
+        db.session.commit()
+        self.assertEqual(self.titles('recursion'), [])
+        self.assertEqual(self.titles('undo'), ['Backtracking'])
+
+    def test_rolled_back_writes_are_not_indexed(self):
+        self.titles('graph')
+        db.session.add(Lesson(title='Tries', content='Prefix trees',
+                              module_id=self.course.modules[0].id))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.titles('prefix'), [])
+
+    def test_rebuild_indexes_bulk_inserts(self):
+        self.titles('graph')
+        db.session.execute(Lesson.__table__.insert(), [{
+            'title': 'Union find', 'content': 'Disjoint sets',
+            'module_id': self.course.modules[0].id}])
+        db.session.commit()
+        self.assertEqual(self.titles('disjoint'), [])
+        self.assertEqual(self.index.rebuild(), 6)
+        self.assertEqual(self.titles('disjoint'), ['Union find'])
+        self.assertEqual(len(self.titles('graph')), 3)
+
+
+class FTS5SearchTest(SearchIndexTests, unittest.TestCase):
+    BACKEND = 'fts5'
+
+    def test_words_are_stemmed(self):
+        self.assertEqual(self.titles('searching graphs'),
+                         ['Graph algorithms', 'Breadth first'])
+
+    def test_index_commits_with_the_rows(self):
+        # Index rows are written in the same transaction as the lesson
+        db.session.add(Lesson(title='Tries', content='Prefix trees',
+                              module_id=self.course.modules[0].id))
+        db.session.flush()
+        self.assertEqual(self.titles('prefix'), ['Tries'])
+        db.session.rollback()
+        self.assertEqual(self.titles('prefix'), [])
+
+    def test_table_holds_no_text(self):
+        self.assertEqual(db.session.execute(text(
+            'SELECT DISTINCT title, body FROM search_index')).all(),
+            [(None, None)])
+
+    def documents(self, word):
+        """How many documents search_index has ``word`` (as indexed) in."""
+        db.session.execute(text(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS temp.search_terms '
+            "USING fts5vocab(main, search_index, 'row')"))
+        return db.session.execute(text(
+            'SELECT doc FROM search_terms WHERE term = :term'),
+            {'term': f'{self.user_id}z{word}'}).scalar() or 0
+
+    def test_rows_are_indexed_once_for_any_number_of_indexes(self):
+        other = SearchIndex('fts5')
+        try:
+            lesson = Lesson(title='Heaps', content='A deque, then a heap',
+                            module_id=self.course.modules[0].id)
+            db.session.add(lesson)
+            db.session.commit()
+            self.assertEqual(self.documents('dequ'), 1)
+            lesson.content = 'A heap'
+            db.session.commit()
+            self.assertEqual(self.documents('dequ'), 0)
+            self.assertEqual(self.documents('heap'), 1)
+            db.session.delete(lesson)
+            db.session.commit()
+            self.assertEqual(self.documents('heap'), 0)
+        finally:
+            other.close()
+        self.assertEqual(self.documents('graph'), 3)
+
+
+class MemorySearchTest(SearchIndexTests, unittest.TestCase):
+    BACKEND = 'memory'
+
+    def test_writes_show_after_commit(self):
+        self.titles('graph')
+        db.session.add(Lesson(title='Tries', content='Prefix trees',
+                              module_id=self.course.modules[0].id))
+        db.session.flush()
+        self.assertEqual(self.titles('prefix'), [])
+        db.session.commit()
+        self.assertEqual(self.titles('prefix'), ['Tries'])
+
+
+class SearchMigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = (
+            'sqlite:///' + os.path.join(self.tmp, 'site.db'))
+        db.init_app(self.app)
+        Migrate(self.app, db, directory=MIGRATIONS)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        # A database from before the search index, with a compressed lesson
+        upgrade(directory=MIGRATIONS, revision='4c8d2b6e1f07')
+        db.session.execute(text(
+            "INSERT INTO user (id, username, email, password_hash) "
+            "VALUES (1, 'u', 'u@example.com', 'x')"))
+        db.session.execute(text(
+            "INSERT INTO courses (id, title, description, user_id) "
+            "VALUES (1, 'Heaps', 'Priority queues', 1)"))
+        db.session.execute(text(
+            "INSERT INTO modules (id, title, description, course_id) "
+            "VALUES (1, 'Basics', 'Heap basics', 1)"))
+        db.session.execute(text(
+            "INSERT INTO lessons (id, title, content, module_id) "
+            "VALUES (1, 'Sifting', :content, 1)"),
+            {'content': TextCodec(min_size=0).encode('Sift down the root')})
+        db.session.commit()
+        self.index = SearchIndex('fts5')
+
+    def tearDown(self):
+        self.index.close()
+        db.session.remove()
+        db.engine.dispose()
+        self.ctx.pop()
+        shutil.rmtree(self.tmp)
+
+    def test_upgrade_indexes_existing_rows(self):
+        upgrade(directory=MIGRATIONS)
+        results = self.index.search(1, 'sift')
+        self.assertEqual([result['title'] for result in results],
+                         ['Sifting'])
+        # Indexed with the words search_index.py removes again
+        db.session.delete(db.session.get(Lesson, 1))
+        db.session.commit()
+        db.session.execute(text(
+            'CREATE VIRTUAL TABLE temp.search_terms '
+            "USING fts5vocab(main, search_index, 'row')"))
+        self.assertEqual(db.session.execute(text(
+            "SELECT count(*) FROM search_terms "
+            "WHERE term = '1zsift'")).scalar(), 0)
+
+
+class BackendChoiceTest(unittest.TestCase):
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            SearchIndex('elasticsearch')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Clients only some requests need; the app imports them on first use
+LAZY_MODULES = ('openai', 'twilio', 'alembic', 'flask_migrate', 'requests')
+
+
+class StartupTest(unittest.TestCase):
+    """Importing the app must stay cheap: see benchmarks/bench_startup.py."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.database = os.path.join(self.tmp, 'site.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_app(self, code):
+        # A fresh interpreter, since this one may have imported anything
+        env = dict(os.environ, DATABASE_URL='sqlite:///' + self.database,
+                   COURSE_JOB_WORKERS='0', LOG_LEVEL='WARNING')
+        result = subprocess.run([sys.executable, '-c', 'import app\n' + code],
+                                cwd=ROOT, env=env, capture_output=True,
+                                text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout
+
+    def test_import_defers_heavy_modules(self):
+        output = self.run_app(
+            'import json, sys\n'
+            f'print(json.dumps([name for name in {LAZY_MODULES!r} '
+            'if name in sys.modules]))')
+        self.assertEqual(json.loads(output), [])
+
+    def test_import_does_not_touch_database(self):
+        self.run_app('')
+        if os.path.exists(self.database):
+            with sqlite3.connect(self.database) as connection:
+                tables = connection.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table'")
+                self.assertEqual(tables.fetchall(), [])
+
+    def test_db_command_loads_on_use(self):
+        output = self.run_app(
+            "result = app.app.test_cli_runner().invoke(args=['db', '--help'])"
+            "\nprint(result.output)")
+        self.assertIn('upgrade', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
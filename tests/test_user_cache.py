@@ -0,0 +1,118 @@
+import time
+import unittest
+
+from flask import Flask
+
+from models import db, User, Course
+from user_cache import UserCache
+from instrumentation import QueryCounter
+
+
+class UserCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        user = User(username='testuser', email='test@example.com',
+                    password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+        self.cache = UserCache(User, max_entries=2, ttl=60)
+
+    def tearDown(self):
+        self.cache.close()
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def load(self):
+        # A new session per call, as each request gets
+        db.session.remove()
+        return self.cache.get(self.user_id, db.session)
+
+    def test_cached_user_needs_no_query(self):
+        self.load()
+        with QueryCounter(db.engine) as queries:
+            user = self.load()
+            self.assertEqual(user.username, 'testuser')
+            self.assertEqual(user.email, 'test@example.com')
+        self.assertEqual(queries.count, 0)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_cached_user_is_usable_in_the_session(self):
+        self.load()
+        user = self.load()
+        self.assertIn(user, db.session)
+        db.session.add(Course(title='Python', description='Intro',
+                              user_id=user.id))
+        db.session.commit()
+        self.assertEqual(Course.query.filter_by(user_id=user.id).count(), 1)
+
+    def test_update_invalidates(self):
+        user = self.load()
+        user.username = 'renamed'
+        db.session.commit()
+        self.assertEqual(self.load().username, 'renamed')
+        self.assertGreaterEqual(self.cache.stats()['invalidations'], 1)
+
+    def test_rolled_back_update_keeps_old_value(self):
+        user = self.load()
+        user.username = 'renamed'
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.load().username, 'testuser')
+
+    def test_delete_invalidates(self):
+        user = self.load()
+        db.session.delete(user)
+        db.session.commit()
+        self.assertIsNone(self.load())
+
+    def test_user_outlives_released_session(self):
+        # app.release_db() closes the session while the request still
+        # holds current_user, cached or freshly queried
+        for _ in range(2):
+            user = self.load()
+            db.session.close()
+            self.assertFalse(db.session().in_transaction())
+            with QueryCounter(db.engine) as queries:
+                self.assertEqual(user.get_id(), str(self.user_id))
+                self.assertEqual(user.username, 'testuser')
+            self.assertEqual(queries.count, 0)
+
+    def test_missing_user(self):
+        self.assertIsNone(self.cache.get(999, db.session))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_ttl_expires(self):
+        self.cache.ttl = 0.05
+        self.load()
+        time.sleep(0.1)
+        with QueryCounter(db.engine) as queries:
+            self.load()
+        self.assertEqual(queries.count, 1)
+
+    def test_bounded(self):
+        for n in range(3):
+            db.session.add(User(username=f'user{n}',
+                                email=f'user{n}@example.com',
+                                password_hash='x'))
+        db.session.commit()
+        for user_id in range(1, 5):
+            self.cache.get(user_id, db.session)
+        self.assertEqual(self.cache.stats()['entries'], 2)
+
+    def test_disabled(self):
+        self.cache.max_entries = 0
+        self.load()
+        with QueryCounter(db.engine) as queries:
+            self.load()
+        self.assertEqual(queries.count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+
+import jwt
+
+from video_tokens import VideoTokens
+
+SECRET = 'secret' * 6
+
+
+class FakeClock:
+    def __init__(self, now=1_700_000_000.5):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def claims(token):
+    return jwt.decode(token, SECRET, algorithms=['HS256'],
+                      options={'verify_exp': False, 'verify_nbf': False})
+
+
+class VideoTokensTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.tokens = VideoTokens('AC123', 'SK456', SECRET, ttl=600,
+                                  refresh=60, max_entries=2,
+                                  clock=self.clock)
+
+    def test_token_grants_room_to_identity(self):
+        data = claims(self.tokens.get('alice', 'room-1'))
+        self.assertEqual(data['grants']['identity'], 'alice')
+        self.assertEqual(data['grants']['video'], {'room': 'room-1'})
+        self.assertEqual((data['iss'], data['sub']), ('SK456', 'AC123'))
+        self.assertEqual(data['exp'], int(self.clock.now) + 600)
+        self.assertNotIn('nbf', data)
+
+    def test_reused_per_identity_and_room(self):
+        token = self.tokens.get('alice', 'room-1')
+        self.clock.now += 100
+        self.assertEqual(self.tokens.get('alice', 'room-1'), token)
+        self.assertNotEqual(self.tokens.get('alice', 'room-2'), token)
+        self.assertNotEqual(self.tokens.get('bob', 'room-1'), token)
+        self.assertEqual(self.tokens.stats(),
+                         {'entries': 2, 'hits': 1, 'misses': 3})
+
+    def test_never_served_past_ttl(self):
+        tokens = set()
+        for _ in range(500):  # 4250 s, about eight token lifetimes
+            token = self.tokens.get('alice', 'room-1')
+            tokens.add(token)
+            self.assertGreater(claims(token)['exp'] - self.clock.now, 60)
+            self.clock.now += 8.5
+        self.assertGreaterEqual(len(tokens), 7)
+        self.assertLessEqual(len(tokens), 8)
+
+    def test_least_recently_used_is_evicted(self):
+        first = self.tokens.get('alice', 'room-1')
+        self.tokens.get('bob', 'room-1')
+        self.tokens.get('alice', 'room-1')
+        self.tokens.get('carol', 'room-1')  # Evicts bob
+        self.assertEqual(self.tokens.get('alice', 'room-1'), first)
+        self.assertEqual(self.tokens.stats()['entries'], 2)
+        self.tokens.get('bob', 'room-1')
+        self.assertEqual(self.tokens.stats()['misses'], 4)
+
+    def test_disabled_cache_mints_every_time(self):
+        tokens = VideoTokens('AC123', 'SK456', SECRET, max_entries=0,
+                             clock=self.clock)
+        tokens.get('alice', 'room-1')
+        tokens.get('alice', 'room-1')
+        self.assertEqual(tokens.stats(),
+                         {'entries': 0, 'hits': 0, 'misses': 2})
+
+    def test_refresh_must_be_shorter_than_ttl(self):
+        with self.assertRaises(ValueError):
+            VideoTokens('AC123', 'SK456', SECRET, ttl=60, refresh=60)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+'''
+Per-process cache of logged-in users for Flask-Login's user_loader.
+
+Every @login_required request used to load its user with a SELECT, which
+made authentication the only database work on hot endpoints such as
+/check_match and /token. UserCache keeps the column values of recently
+seen users and rebuilds the instance from them: the rebuilt user is merged
+into the request's session with ``load=False``, so it behaves like a loaded
+row (queries, relationships and updates work as usual) without a query.
+
+Entries are dropped when the user is updated or deleted through the ORM in
+this process, both at flush and again after the commit, so a concurrent
+request cannot re-cache the old row in between. Other processes only see
+a change once their entry is older than ``ttl`` seconds, which bounds how
+stale an identity can be; keep the TTL short if users are edited outside
+the ORM or from another worker.
+'''
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL = 300
+
+_DIRTY = 'user_cache_dirty'
+
+
+class UserCache:
+    """Bounded, expiring cache of ``model`` rows by primary key.
+
+        cache = UserCache(User)
+
+        @login_manager.user_loader
+        def load_user(user_id):
+            return cache.get(int(user_id), db.session)
+
+    ``max_entries=0`` or ``ttl=0`` disables caching.
+    """
+
+    def __init__(self, model, max_entries=DEFAULT_MAX_ENTRIES,
+                 ttl=DEFAULT_TTL):
+        self.model = model
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._columns = [attr.key for attr in inspect(model).column_attrs]
+        self._entries = OrderedDict()  # id -> (stored_at, column values)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._listeners = [
+            (model, 'after_update', self._changed),
+            (model, 'after_delete', self._changed),
+            (Session, 'after_commit', self._committed),
+            (Session, 'after_soft_rollback', self._rolled_back),
+        ]
+        for target, name, listener in self._listeners:
+            event.listen(target, name, listener)
+
+    def get(self, user_id, session):
+        """Return the user with ``user_id`` attached to ``session``."""
+        values = self._lookup(user_id)
+        if values is None:
+            user = session.get(self.model, user_id)
+            if user is not None:
+                self._store(user_id, user)
+            return user
+        user = self.model(**values)
+        make_transient_to_detached(user)
+        return session.merge(user, load=False)
+
+    def _lookup(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def _store(self, user_id, user):
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        values = {key: getattr(user, key) for key in self._columns}
+        with self._lock:
+            self._entries[user_id] = (time.monotonic(), values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def _changed(self, mapper, connection, user):
+        self.discard(user.id)
+        session = Session.object_session(user)
+        if session is not None:
+            session.info.setdefault(_DIRTY, set()).add(user.id)
+
+    def _committed(self, session):
+        for user_id in session.info.pop(_DIRTY, ()):
+            self.discard(user_id)
+
+    def _rolled_back(self, session, previous_transaction):
+        # The change never happened; the row read back will be the old one
+        session.info.pop(_DIRTY, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits,
+                    'misses': self.misses,
+                    'invalidations': self.invalidations}
+
+    def close(self):
+        """Stop listening for changes (for caches made in tests)."""
+        for target, name, listener in self._listeners:
+            event.remove(target, name, listener)
+        self.clear()
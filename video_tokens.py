@@ -0,0 +1,99 @@
+'''
+Twilio Video access tokens for /video_call and /token.
+
+Both routes used to build and sign a new AccessToken on every request,
+reading the Twilio credentials from the environment each time, and the
+video page then fetched /token for a second token on top of the one it was
+rendered with. VideoTokens signs one token per (identity, room) and serves
+it from memory until ``refresh`` seconds before it expires, so the page and
+any later /token calls share one mint, and no token is handed out with less
+than ``refresh`` seconds of validity left. The credentials are read once,
+when create_video_tokens() builds the service from the app config.
+'''
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 3600  # Twilio's own default; it allows up to 24 hours
+DEFAULT_REFRESH = 300
+DEFAULT_MAX_ENTRIES = 1024
+
+
+class VideoTokens:
+    """Signs Video access tokens and caches them per (identity, room).
+
+    ``clock`` returns seconds since the epoch, the unit of the tokens' exp
+    claim. ``max_entries=0`` disables caching.
+    """
+
+    def __init__(self, account_sid, api_key_sid, api_key_secret,
+                 ttl=DEFAULT_TTL, refresh=DEFAULT_REFRESH,
+                 max_entries=DEFAULT_MAX_ENTRIES, clock=time.time):
+        if not 0 <= refresh < ttl:
+            raise ValueError('refresh must be shorter than ttl')
+        self.account_sid = account_sid
+        self.api_key_sid = api_key_sid
+        self.api_key_secret = api_key_secret
+        self.ttl = ttl
+        self.refresh = refresh
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()  # (identity, room) -> (exp, token)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, identity, room_name):
+        """A signed token for ``identity`` to join ``room_name``."""
+        key = (identity, room_name)
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry[0] - self.refresh:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        expires_at, token = self.mint(identity, room_name, now)
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = (expires_at, token)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return token
+
+    def mint(self, identity, room_name, now=None):
+        """Sign a new token; returns ``(expires_at, token)``."""
+        from twilio.jwt.access_token import AccessToken
+        from twilio.jwt.access_token.grants import VideoGrant
+        # The expiry is set here, so the one the cache checks against is
+        # exactly the one in the token. nbf=None leaves out the nbf claim,
+        # which the library would set to now: Twilio would then reject a
+        # fresh token while its clock was even slightly behind ours
+        expires_at = int(self.clock() if now is None else now) + self.ttl
+        token = AccessToken(self.account_sid, self.api_key_sid,
+                            self.api_key_secret, identity=identity,
+                            nbf=None, valid_until=expires_at)
+        token.add_grant(VideoGrant(room=room_name))
+        return expires_at, token.to_jwt()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits,
+                    'misses': self.misses}
+
+
+def create_video_tokens(config):
+    """Build the token service from the TWILIO_* and VIDEO_TOKEN_* config."""
+    return VideoTokens(
+        config.get('TWILIO_ACCOUNT_SID'),
+        config.get('TWILIO_API_KEY_SID'),
+        config.get('TWILIO_API_KEY_SECRET'),
+        ttl=config.get('VIDEO_TOKEN_TTL', DEFAULT_TTL),
+        refresh=config.get('VIDEO_TOKEN_REFRESH', DEFAULT_REFRESH),
+        max_entries=config.get('VIDEO_TOKEN_CACHE_SIZE', DEFAULT_MAX_ENTRIES))